@@ -1,8 +1,11 @@
 from .solrclient import SolrClient
 from .solrresp import SolrResponse
+from .columnar import ColumnarResponse
+from .compactdocs import CompactDocs
 from .schema import Schema
 from .indexq import IndexQ
-from .helpers import Reindexer
+from .logq import LogQ
+from .helpers import Reindexer, Verifier
 from .collections import Collections
 from .zk import ZK
 #This is the main project version. On new releases, it only needs to be updated here and in the README.md.
@@ -0,0 +1,118 @@
+from array import array
+
+try:
+    import numpy
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+#Largest integer a double holds exactly
+_MAX_EXACT = 2 ** 53
+
+
+class ColumnarResponse():
+    '''
+    Stores query results column by column instead of a dict per document. Integer fields are stored in array('q'),
+    float fields in array('d') and everything else (strings, dates, multi valued fields) in lists. Only the fields
+    asked for are kept, so exporting a few fields out of millions of documents takes a fraction of the memory.
+
+    If a numeric field is missing from some documents, the column falls back to a list with None for the missing values.
+
+    Example::
+
+        >>> res = solr.query_columns('SolrClient_unittest', {'q': '*:*'}, fields=['id', 'price'], cursor=True)
+        >>> res['price']
+        array('q', [10, 22, 93, 60])
+        >>> res['id']
+        ['cb666bd1-ab8e-4951-9829-5ccd4c12d10b', ...]
+    '''
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.columns = dict((field, None) for field in self.fields)
+        self.num_found = None
+        self._length = 0
+
+    def add_docs(self, docs):
+        '''
+        Appends a page of documents to the columns.
+        '''
+        for field in self.fields:
+            self.columns[field] = self._extend(self.columns[field], [doc.get(field) for doc in docs])
+        self._length += len(docs)
+
+    def add_response(self, res):
+        '''
+        Appends documents from a SolrResponse.
+        '''
+        if hasattr(res, 'num_found'):
+            self.num_found = res.num_found
+        self.add_docs(res.docs)
+
+    def _extend(self, column, values):
+        if column is None:
+            column = self._new_column(values)
+            if type(column) is list:
+                # Not seen any values yet, fill in the blanks
+                column.extend(values)
+                return column
+        if type(column) is list:
+            column.extend(values)
+            return column
+        try:
+            column.extend(array(column.typecode, values))
+            return column
+        except (TypeError, OverflowError):
+            pass
+        #Floats in an int column, doubles only hold ints up to 2**53 exactly, larger ones fall through to a list
+        if None not in values and column.typecode == 'q' and all(abs(x) <= _MAX_EXACT for x in column) and \
+                all(type(x) is float or (type(x) is int and abs(x) <= _MAX_EXACT) for x in values):
+            try:
+                column = array('d', column)
+                column.extend(array('d', values))
+                return column
+            except (TypeError, OverflowError):
+                pass
+        column = column.tolist()
+        column.extend(values)
+        return column
+
+    def _new_column(self, values):
+        for val in values:
+            if val is None:
+                continue
+            if type(val) is int:
+                return array('q')
+            if type(val) is float:
+                return array('d')
+            return []
+        return []
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def __len__(self):
+        return self._length
+
+    def get_column(self, field):
+        '''
+        :param str field: Name of the field.
+
+        Returns column for the field.
+        '''
+        if field not in self.columns:
+            raise KeyError("Field {} not in columnar response, available fields are {}".format(field, self.fields))
+        return self.columns[field]
+
+    def get_numpy_column(self, field):
+        '''
+        :param str field: Name of the field.
+
+        Returns a copy of the column as a numpy array. Requires numpy.
+        '''
+        if not np_imported:
+            raise ImportError("numpy is required to get columns as numpy arrays")
+        column = self.get_column(field)
+        if type(column) is array:
+            return numpy.array(column, dtype=numpy.int64 if column.typecode == 'q' else numpy.float64)
+        return numpy.array(column, dtype=object)
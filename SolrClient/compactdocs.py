@@ -0,0 +1,118 @@
+from collections.abc import Mapping, Sequence
+
+#Placeholder for fields that aren't in a document
+_MISSING = object()
+
+
+def _get_value(row, pos):
+    #Rows stored before a field was first seen are shorter than the index
+    if pos is None or pos >= len(row):
+        return _MISSING
+    return row[pos]
+
+
+class CompactDoc(Mapping):
+    '''
+    Read only, dict like view of a single document stored in CompactDocs.
+    '''
+    __slots__ = ('_index', '_values')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, field):
+        val = _get_value(self._values, self._index.get(field))
+        if val is _MISSING:
+            raise KeyError(field)
+        return val
+
+    def __contains__(self, field):
+        return _get_value(self._values, self._index.get(field)) is not _MISSING
+
+    def get(self, field, default=None):
+        val = _get_value(self._values, self._index.get(field))
+        return default if val is _MISSING else val
+
+    def __iter__(self):
+        for field, pos in self._index.items():
+            if _get_value(self._values, pos) is not _MISSING:
+                yield field
+
+    def __len__(self):
+        return sum(1 for val in self._values if val is not _MISSING)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactDocs(Sequence):
+    '''
+    Compact container for a page of documents. Field names are stored once per page and each document is
+    stored as a tuple of values, which takes a fraction of the memory of a dict per document on large pages.
+    Indexing returns a CompactDoc, a read only Mapping, so it can be used like the usual list of dicts.
+
+    `docs` is read one document at a time, so the rows can be built while the response is decoded. The javabin decoder
+    does that with wt='javabin'. With wt='json' the whole page is decoded into dicts before it is converted, so the
+    peak memory use of a request is that of the list of dicts, only the memory held afterwards is reduced. ::
+
+        >>> res = solr.query('SolrClient_unittest', {'q': '*:*', 'rows': 50000}, compact_docs=True)
+        >>> res.docs[0]['id']
+        'cb666bd1-ab8e-4951-9829-5ccd4c12d10b'
+        >>> dict(res.docs[0])
+        {'id': 'cb666bd1-ab8e-4951-9829-5ccd4c12d10b', 'price': 10, ...}
+    '''
+    __slots__ = ('fields', '_index', '_rows')
+
+    def __init__(self, docs):
+        index = {}
+        rows = []
+        for doc in docs:
+            for field in doc:
+                if field not in index:
+                    index[field] = len(index)
+            rows.append(tuple(doc.get(field, _MISSING) for field in index))
+        self._index = index
+        self.fields = tuple(index)
+        self._rows = rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [CompactDoc(self._index, row) for row in self._rows[i]]
+        return CompactDoc(self._index, self._rows[i])
+
+    def __iter__(self):
+        index = self._index
+        for row in self._rows:
+            yield CompactDoc(index, row)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def get_field_values(self, field):
+        '''
+        Returns values of `field` from all documents that have it.
+        '''
+        pos = self._index.get(field)
+        if pos is None:
+            return []
+        return [row[pos] for row in self._rows if _get_value(row, pos) is not _MISSING]
+
+    def get_first_field_value(self, field):
+        '''
+        Returns value of `field` from the first document that has it, raises KeyError if none do.
+        '''
+        pos = self._index.get(field)
+        if pos is not None:
+            for row in self._rows:
+                if _get_value(row, pos) is not _MISSING:
+                    return row[pos]
+        raise KeyError(field)
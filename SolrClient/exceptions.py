@@ -2,6 +2,8 @@ class SolrError(Exception):
     """
     Class to handle any issues that Solr Reports
     """
+    #HTTP status code of the response, if there was one
+    status_code = None
 
 
 class SolrResponseError(SolrError):
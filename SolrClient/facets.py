@@ -0,0 +1,277 @@
+'''
+Helpers for working with facet counts as arrays instead of dictionaries.
+
+Solr returns field and range facets as flat [term, count, term, count, ...] lists. These helpers slice
+them into a list of keys and an array of counts without building a dict for each bucket. There are also helpers to
+flatten pivot and json.facet trees and to merge facets from several responses, e.g. one per collection.
+'''
+import heapq
+import math
+from array import array
+from collections import OrderedDict
+from .columnar import ColumnarResponse
+
+try:
+    import numpy
+    np_imported = True
+except ImportError:
+    np_imported = False
+
+
+def flat_to_arrays(flat, as_numpy=False):
+    '''
+    :param list flat: Flat [term, count, term, count] list from Solr.
+    :param bool as_numpy: Return counts as a numpy int64 array instead of array('q'). Requires numpy.
+
+    Returns a tuple of (keys, counts).
+    '''
+    if as_numpy:
+        if not np_imported:
+            raise ImportError("numpy is required to get facet counts as numpy arrays")
+        return flat[::2], numpy.array(flat[1::2], dtype=numpy.int64)
+    return flat[::2], array('q', flat[1::2])
+
+
+def top_k(keys, counts, k):
+    '''
+    Returns a list of (key, count) tuples for the `k` largest counts, largest first.
+    '''
+    idx = heapq.nlargest(k, range(len(counts)), key=counts.__getitem__)
+    return [(keys[i], counts[i]) for i in idx]
+
+
+def merge_facet_arrays(arrays, k=None):
+    '''
+    :param list arrays: List of (keys, counts) tuples, like the ones returned from SolrResponse.get_facet_arrays.
+    :param int k: Only return the `k` largest merged counts.
+
+    Adds up counts for the same keys across several responses. Returns (keys, counts) sorted by count, largest first.
+    '''
+    merged = {}
+    for keys, counts in arrays:
+        for key, count in zip(keys, counts):
+            merged[key] = merged.get(key, 0) + int(count)
+    if k is None:
+        items = sorted(merged.items(), key=lambda x: x[1], reverse=True)
+    else:
+        items = heapq.nlargest(k, merged.items(), key=lambda x: x[1])
+    return [x[0] for x in items], array('q', [x[1] for x in items])
+
+
+def _iter_tree(nodes, key_field, children, skip=()):
+    # Depth first walk with an explicit stack, so deep trees don't hit the recursion limit
+    skip = (key_field, 'count') + skip
+    stack = [((), iter(nodes))]
+    while stack:
+        path, it = stack[-1]
+        node = next(it, None)
+        if node is None:
+            stack.pop()
+            continue
+        node_path = path + (node[key_field],)
+        metrics = {}
+        subs = []
+        for key, val in node.items():
+            if key in skip:
+                continue
+            sub = children(key, val)
+            if sub is not None:
+                subs.append(sub)
+            else:
+                metrics[key] = val
+        yield node_path, node.get('count'), metrics
+        for sub in reversed(subs):
+            stack.append((node_path, iter(sub)))
+
+
+def iter_pivot_rows(pivots):
+    '''
+    :param list pivots: Pivot list for one field set from facet_counts/facet_pivot.
+
+    Lazily yields a (path, count, metrics) row for every node of the pivot tree, parents before their children. `path` is a tuple of
+    the values from the top level down to the node and `metrics` holds anything else Solr sent for the node, like stats or ranges.
+    '''
+    return _iter_tree(pivots, 'value', lambda key, val: val if key == 'pivot' else None, skip=('field',))
+
+
+def iter_json_facet_rows(buckets):
+    '''
+    :param list buckets: Bucket list of a json.facet field, e.g. response['facets']['field']['buckets'].
+
+    Lazily yields a (path, count, metrics) row for every bucket, including buckets of sub facets. `path` is a tuple of bucket values and
+    `metrics` holds the aggregations for the bucket, like sum or unique.
+    '''
+    return _iter_tree(buckets, 'val',
+                      lambda key, val: val['buckets'] if type(val) is dict and 'buckets' in val else None)
+
+
+def rows_to_columns(rows, metrics=(), chunk_size=10000):
+    '''
+    :param rows: Iterable of (path, count, metrics) rows, from iter_pivot_rows or iter_json_facet_rows.
+    :param list metrics: Names of metrics to keep as columns.
+    :param int chunk_size: Number of rows converted at a time.
+
+    Collects rows into a ColumnarResponse with path, depth, count and metric columns.
+    '''
+    out = ColumnarResponse(['path', 'depth', 'count'] + list(metrics))
+    chunk = []
+    for path, count, row_metrics in rows:
+        row = {'path': path, 'depth': len(path), 'count': count}
+        for metric in metrics:
+            if metric in row_metrics:
+                row[metric] = row_metrics[metric]
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            out.add_docs(chunk)
+            chunk = []
+    if chunk:
+        out.add_docs(chunk)
+    return out
+
+
+def merge_num_found(responses):
+    '''
+    Returns the total numFound across several SolrResponse objects.
+    '''
+    return sum(res.get_num_found() for res in responses)
+
+
+def merge_facets(responses, k=None):
+    '''
+    :param list responses: SolrResponse objects with the same facet.field request, e.g. one per collection.
+    :param int k: Only keep the `k` largest buckets of each field.
+
+    Adds up field facet counts across responses. Returns a dict like SolrResponse.get_facets, each field sorted by count. ::
+
+        >>> merge_facets([res_us, res_eu], k=10)
+        {'facet_test': OrderedDict([('amet,', 28), ('sit', 21), ...])}
+    '''
+    fields = []
+    for res in responses:
+        for field in res.data.get('facet_counts', {}).get('facet_fields', {}):
+            if field not in fields:
+                fields.append(field)
+    out = {}
+    for field in fields:
+        arrays = [res.get_facet_arrays(field) for res in responses
+                  if field in res.data.get('facet_counts', {}).get('facet_fields', {})]
+        keys, counts = merge_facet_arrays(arrays, k=k)
+        out[field] = OrderedDict(zip(keys, counts))
+    return out
+
+
+def merge_facet_ranges(responses):
+    '''
+    Adds up range facet counts across responses. Returns a dict like SolrResponse.get_facets_ranges, ranges stay in order.
+    '''
+    out = {}
+    for res in responses:
+        for field, ranges in res.data.get('facet_counts', {}).get('facet_ranges', {}).items():
+            merged = out.setdefault(field, OrderedDict())
+            flat = ranges['counts']
+            for key, count in zip(flat[::2], flat[1::2]):
+                merged[key] = merged.get(key, 0) + count
+    return out
+
+
+_AGGREGATIONS = {
+    'sum': lambda vals, counts: sum(vals),
+    'min': lambda vals, counts: min(vals),
+    'max': lambda vals, counts: max(vals),
+    #Distinct values can overlap between responses, so this is an upper bound
+    'unique': lambda vals, counts: sum(vals),
+    'avg': lambda vals, counts: sum(v * c for v, c in zip(vals, counts)) / sum(counts) if sum(counts) else 0,
+}
+
+
+def merge_json_facet_buckets(bucket_lists, aggregations=None, k=None):
+    '''
+    :param list bucket_lists: List of json.facet bucket lists, one per response.
+    :param dict aggregations: Maps metric names to how they get merged: 'sum', 'min', 'max', 'avg' or 'unique'. Metrics that aren't listed are summed.
+    :param int k: Only keep the `k` buckets with the largest count.
+
+    Merges json.facet buckets with the same value. Counts are added up, metrics are merged according to `aggregations` and
+    sub facets are merged the same way. Note that 'unique' can only be approximated, it is the sum of the uniques of each response.
+    Returns a list of buckets sorted by count, in the same format Solr uses.
+    '''
+    aggregations = aggregations or {}
+    merged = OrderedDict()
+    for buckets in bucket_lists:
+        for bucket in buckets:
+            merged.setdefault(bucket['val'], []).append(bucket)
+    out = []
+    for val, buckets in merged.items():
+        bucket = {'val': val, 'count': sum(b.get('count', 0) for b in buckets)}
+        bucket.update(_merge_facet_dicts(buckets, aggregations))
+        out.append(bucket)
+    if k is None:
+        return sorted(out, key=lambda b: b['count'], reverse=True)
+    return heapq.nlargest(k, out, key=lambda b: b['count'])
+
+
+def _merge_facet_dicts(dicts, aggregations, k=None):
+    '''
+    Merges json.facet results that aren't bucket lists, like buckets themselves or query facets, metric by metric.
+    '''
+    out = {}
+    for key in OrderedDict((key, None) for d in dicts for key in d):
+        if key == 'val':
+            continue
+        present = [d for d in dicts if key in d]
+        if key == 'buckets':
+            out[key] = merge_json_facet_buckets([d[key] for d in present], aggregations, k=k)
+        elif type(present[0][key]) is dict:
+            #Sub facet, with or without buckets
+            out[key] = _merge_facet_dicts([d[key] for d in present], aggregations)
+        elif key == 'count':
+            out[key] = sum(d[key] for d in present)
+        else:
+            how = _AGGREGATIONS[aggregations.get(key, 'sum')]
+            out[key] = how([d[key] for d in present], [d.get('count', 0) for d in present])
+    return out
+
+
+def merge_json_facets(responses, field, aggregations=None, k=None):
+    '''
+    :param list responses: SolrResponse objects with the same json.facet request.
+    :param str field: Name of the json.facet field to merge.
+
+    Merges one json.facet field across responses, see merge_json_facet_buckets. Returns the merged facet, {'buckets': [...]} for terms and range facets.
+    '''
+    return _merge_facet_dicts([res.json_facet(field) for res in responses], aggregations or {}, k=k)
+
+
+def merge_stats(responses):
+    '''
+    Merges the results of stats.field across responses. Returns a dict of field name to stats, like the stats_fields section of a response.
+
+    count, missing, sum and sumOfSquares are added up, min and max are kept, and mean and stddev are computed again from the merged
+    sums. Other stats, like percentiles or countDistinct, can't be merged from the results and are left out.
+    '''
+    merged = OrderedDict()
+    for res in responses:
+        for field, stats in (res.data.get('stats', {}).get('stats_fields') or {}).items():
+            if stats:
+                merged.setdefault(field, []).append(stats)
+    out = {}
+    for field, stats_list in merged.items():
+        stats = {}
+        for key in ('count', 'missing', 'sum', 'sumOfSquares'):
+            if any(key in x for x in stats_list):
+                stats[key] = sum(x.get(key) or 0 for x in stats_list)
+        for key, how in (('min', min), ('max', max)):
+            values = [x[key] for x in stats_list if x.get(key) is not None]
+            if any(key in x for x in stats_list):
+                stats[key] = how(values) if values else None
+        count = stats.get('count')
+        if 'sum' in stats and count is not None:
+            stats['mean'] = stats['sum'] / count if count else None
+        if 'sumOfSquares' in stats and 'sum' in stats and count is not None:
+            if count > 1:
+                #Same formula as Solr, sample standard deviation
+                variance = (count * stats['sumOfSquares'] - stats['sum'] ** 2) / (count * (count - 1))
+                stats['stddev'] = math.sqrt(max(variance, 0))
+            else:
+                stats['stddev'] = 0.0 if count else None
+        out[field] = stats
+    return out
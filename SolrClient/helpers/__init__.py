@@ -1 +1,3 @@
 from .reindexer import Reindexer
+from .verifier import Verifier
+from .throttle import Throttle, MetricsPressure
@@ -7,14 +7,68 @@ import os
 import json
 from datetime import datetime, timedelta
 from time import time, sleep
+from collections import deque
+from multiprocessing import Process, Pool
 from SolrClient import SolrClient, IndexQ
+from SolrClient.exceptions import SolrError
+from .verifier import diff_sorted
+from . import transform as transforms
+
+
+def _reindex_worker(spec):
+    '''
+    Entry point of the worker processes started by Reindexer.reindex_parallel. Reindexes one shard or slice.
+    '''
+    source = SolrClient(spec['source_host'], **spec['source_config'])
+    if spec['dest']['type'] == 'solr':
+        dest = SolrClient(spec['dest']['host'], **spec['dest']['config'])
+    else:
+        #No buffering, so a checkpoint is only written once the batch is on disk
+        dest = IndexQ(spec['dest']['basepath'], spec['dest']['queue'], compress=spec['dest']['compress'])
+    reindexer = Reindexer(source, dest,
+                          source_coll=spec['source_coll'],
+                          dest_coll=spec['dest']['collection'],
+                          rows=spec['rows'],
+                          date_field=spec['date_field'],
+                          per_shard=spec['per_shard'],
+                          ignore_fields=spec['ignore_fields'],
+                          transform=spec['transform'],
+                          fl=spec['fl'],
+                          throttle=spec['throttle'])
+    reindexer._reindex_from_checkpoint(spec['state_file'], fq=spec['fq'])
+
+
+def _get_client_config(solr):
+    '''
+    Returns the settings of a SolrClient, except the host, so a worker process can build the same client.
+    '''
+    transport = solr.transport
+    return {'transport': type(transport), 'devel': solr.devel, 'auth': transport.auth, 'retry_policy': transport.retry_policy,
+            'compression': transport.compression, 'wt': transport.wt}
+
+
+def _load_json_file(path):
+    '''
+    Decodes a .json or .json.gz file, runs in the file reader process pool.
+    '''
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        with open(path) as f:
+            data = json.load(f)
+    return [data] if type(data) is dict else data
+
+
+#Finer timespan to split a mismatched range into in precise resume
+_SUB_TIMESPANS = {'DAY': 'HOUR', 'HOUR': 'MINUTE'}
 
 
 class Reindexer():
     '''
     Initiates the re-indexer.
 
-    :param source: An instance of SolrClient.
+    :param source: An instance of SolrClient, or a directory with .json and .json.gz files, like the todo or done directory of an IndexQ.
     :param dest: An instance of SolrClient or an instance of IndexQ.
     :param string source_coll: Source collection name.
     :param string dest_coll: Destination collection name; only required if destination is SolrClient.
@@ -24,6 +78,13 @@ class Reindexer():
     :param bool per_shard: Will add distrib=false to each query to get the data. Use this only if you will be running multiple instances of this to get the rest of the shards.
     :param list ignore_fields: What fields to exclude from Solr queries. This is important since if you pull them out, you won't be able to index the documents in.
     By default, it will try to determine and exclude copy fields as well as _version_. Pass in your own list to override or set it to False to prevent it from doing anything.
+    :param list transform: Transform steps to apply to each batch of items after the ignore fields are removed, like dropping, renaming, type casting,
+    computing or filtering fields. See SolrClient.helpers.transform for the format.
+    :param list fl: Fields to get from the source. By default they are worked out from the schema: all stored (or docValues) fields and dynamic
+    fields, minus the ignore fields, so ignored fields aren't sent over the wire at all. Pass False to get all fields with `*`, or when ignore_fields is False.
+    :param throttle: A Throttle instance to limit how fast items are sent to the destination, see SolrClient.helpers.throttle.
+    :param int transform_processes: Run transforms in a pool of this many processes, so CPU heavy transforms run alongside fetching and indexing.
+    Functions in the transform spec need to be picklable for this. Default is 0, transforms run in the main process.
     '''
     def __init__(self,
                 source,
@@ -35,6 +96,10 @@ class Reindexer():
                 devel=False,
                 per_shard=False,
                 ignore_fields=['_version_'],
+                transform=None,
+                transform_processes=0,
+                fl=None,
+                throttle=None,
                 ):
 
 
@@ -50,6 +115,10 @@ class Reindexer():
         self._items_processed = 0
         self._devel = devel
         self._ignore_fields = ignore_fields
+        self._transform_spec = transform or []
+        self._transform_processes = transform_processes
+        self._fl = fl
+        self._throttle = throttle
 
 
         #Determine what source and destination should be
@@ -58,6 +127,8 @@ class Reindexer():
              #Maybe break this out later for the sake of testing
             if type(self._ignore_fields) is list and len(self._ignore_fields) == 1:
                 self._ignore_fields.extend(self._get_copy_fields())
+            if self._fl is None:
+                self._fl = self._get_fl() if self._ignore_fields else False
 
         elif type(source) is str and os.path.isdir(source):
             self._getter = self._from_json
@@ -72,6 +143,12 @@ class Reindexer():
         else:
            raise ValueError("Incorrect Destination Specified. Pass either a directory with json files or destination SolrClient \
                             instance with the name of the collection.")
+        if self._throttle is not None:
+            self._send = self._putter
+            self._putter = self._throttled_put
+
+        #Compiled once, ignore fields are dropped in the same pass as any drops and renames of the transform
+        self._transform = transforms.compile_transform(self._get_transform_spec())
         self.log.info("Reindexer created succesfully. ")
 
 
@@ -84,23 +161,73 @@ class Reindexer():
         return fields
 
 
+    def _get_fl(self):
+        '''
+        Returns the list of fields to request from the source: stored or docValues fields and dynamic fields that aren't ignored.
+        Ignored fields are still removed from the results, in case a dynamic field pattern matches one of them.
+        '''
+        try:
+            fields = self._source.schema.get_schema_fields(self._source_coll, show_defaults=True)['fields']
+            dynamic_fields = self._source.schema.get_schema_dynamic_fields(self._source_coll, show_defaults=True)
+        except (SolrError, KeyError) as e:
+            self.log.warning("Couldn't get fields from the schema, getting all fields instead. {}".format(e))
+            return False
+        ignore = set(self._ignore_fields)
+        fl = [field['name'] for field in fields + dynamic_fields
+              if field['name'] not in ignore
+              and (field.get('stored', True) or (field.get('docValues') and field.get('useDocValuesAsStored', True)))]
+        self.log.info("Requesting fields: {}".format(",".join(fl)))
+        return fl
+
+
     def reindex(self, fq= [], **kwargs):
         '''
         Starts Reindexing Process. All parameter arguments will be passed down to the getter function.
         :param string fq: FilterQuery to pass to source Solr to retrieve items. This can be used to limit the results.
         '''
-        for items in self._getter(fq=fq, **kwargs):
+        if self._transform_processes:
+            batches = self._transform_in_pool(self._getter(fq=fq, transform=False, **kwargs))
+        else:
+            batches = self._getter(fq=fq, **kwargs)
+        for items in batches:
             self._putter(items)
         if type(self._dest) is SolrClient and self._dest_coll:
             self.log.info("Finished Indexing, sending a commit")
             self._dest.commit(self._dest_coll, openSearcher=True)
 
 
-    def _from_solr(self, fq=[], report_frequency = 25):
+    def _get_transform_spec(self):
+        spec = []
+        if self._ignore_fields:
+            spec.append({'drop': self._ignore_fields})
+        return spec + list(self._transform_spec)
+
+
+    def _transform_in_pool(self, batches):
+        '''
+        Transforms batches in a process pool, keeping the order of the batches. Only a couple of batches per process are
+        read ahead, so the getter doesn't run away from a slow pool.
+        '''
+        pool = Pool(self._transform_processes, initializer=transforms._init_worker, initargs=(self._get_transform_spec(),))
+        try:
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.apply_async(transforms._run_worker, (batch,)))
+                if len(pending) >= self._transform_processes * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+
+
+    def _from_solr(self, fq=[], report_frequency = 25, cursor='*', checkpoint=None, transform=True):
         '''
         Method for retrieving batch data from Solr.
+        :param string cursor: cursorMark to start from, used to resume.
+        :param checkpoint: Callable that gets the next cursorMark after each batch has been processed by the caller.
+        :param bool transform: Remove ignore fields and apply the transform to each batch.
         '''
-        cursor = '*'
         stime = datetime.now()
         query_count = 0
         while True:
@@ -128,8 +255,10 @@ class Reindexer():
                 self._items_processed += results.get_results_count()
                 cursor = results.get_cursor()
                 #Remove ignore fields
-                docs = self._trim_fields(results.docs)
+                docs = self._trim_fields(results.docs) if transform else results.docs
                 yield docs
+                if checkpoint:
+                    checkpoint(cursor)
                 if results.get_results_count() < self._rows:
                     #Less results than asked, probably done
                     break
@@ -139,15 +268,223 @@ class Reindexer():
                 break
 
 
+    def reindex_parallel(self, state_dir='reindexer_state', partition='shard', slices=4, fq=[], report_interval=30):
+        '''
+        Reindexes with one worker process per shard (or per slice) and checkpoints the cursorMark of each worker to a state file
+        in `state_dir` after every batch. If the run gets killed, running it again with the same `state_dir` resumes each worker
+        where it stopped; workers that finished are skipped. Aggregate progress and ETA are logged every `report_interval` seconds.
+
+        :param string state_dir: Directory for the manifest and per worker state files. Remove it to start over.
+        :param string partition: 'shard' to read each shard of a SolrCloud collection from one of it's replicas with distrib=false,
+        or 'slice' to split the collection into `slices` ranges on date_field (see SolrClient.sliced_cursor_query), which also works on standalone cores.
+        :param int slices: Number of slices when partition is 'slice'.
+        :param list fq: FilterQuery to pass to source Solr to retrieve items.
+        :param int report_interval: Seconds between progress reports.
+        '''
+        if type(self._source) is not SolrClient:
+            raise ValueError("Parallel reindexing needs a SolrClient source.")
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        specs = self._get_worker_specs(state_dir, partition, slices, fq)
+        procs = []
+        for spec in specs:
+            if self._read_state(spec['state_file']).get('done'):
+                self.log.info("Worker {} already finished, skipping".format(spec['name']))
+                continue
+            proc = Process(target=_reindex_worker, args=(spec,), name='reindexer-{}'.format(spec['name']))
+            proc.start()
+            procs.append(proc)
+        self.log.info("Started {} reindexing workers".format(len(procs)))
+
+        stime = time()
+        start_items = self._get_progress(specs)[0]
+        while True:
+            alive = [proc for proc in procs if proc.is_alive()]
+            if not alive:
+                break
+            alive[0].join(report_interval)
+            self._log_progress(specs, stime, start_items)
+        failed = [proc.name for proc in procs if proc.exitcode != 0]
+        if failed:
+            raise RuntimeError("Reindexing workers {} failed, run again with the same state_dir to resume.".format(", ".join(failed)))
+        if type(self._dest) is SolrClient and self._dest_coll:
+            self.log.info("Finished Indexing, sending a commit")
+            self._dest.commit(self._dest_coll, openSearcher=True)
+        return self._get_progress(specs)
+
+    def _get_worker_specs(self, state_dir, partition, slices, fq):
+        '''
+        Returns the list of workers, the partitioning is saved to a manifest so a resumed run uses the same shards or slices.
+        '''
+        manifest = os.path.join(state_dir, '{}_manifest.json'.format(self._source_coll))
+        if os.path.isfile(manifest):
+            with open(manifest) as f:
+                parts = json.load(f)
+        else:
+            parts = self._get_partitions(partition, slices, fq)
+            with open(manifest + '.tmp', 'w') as f:
+                json.dump(parts, f)
+            os.replace(manifest + '.tmp', manifest)
+        if type(self._dest) is SolrClient:
+            dest = {'type': 'solr', 'host': self._dest.host, 'config': _get_client_config(self._dest), 'collection': self._dest_coll}
+        else:
+            dest = {'type': 'indexq', 'basepath': self._dest._basepath, 'queue': self._dest._queue_name,
+                    'compress': self._dest._compress, 'collection': None}
+        #The workers send at the same time, so each one gets a share of the rate
+        throttle = self._throttle.split(len(parts)) if self._throttle is not None else None
+        specs = []
+        for part in parts:
+            spec = dict(part)
+            spec.update(dest=dest, source_config=_get_client_config(self._source), rows=self._rows, date_field=self._date_field,
+                        ignore_fields=self._ignore_fields, transform=self._transform_spec, fl=self._fl,
+                        throttle=throttle,
+                        state_file=os.path.join(state_dir, '{}_{}.json'.format(self._source_coll, part['name'])))
+            specs.append(spec)
+        return specs
+
+    def _get_partitions(self, partition, slices, fq):
+        parts = []
+        if partition == 'shard':
+            shards = self._source.collections.cluster_status_raw()['cluster']['collections'][self._source_coll]['shards']
+            for shard in sorted(shards):
+                replicas = [r for r in shards[shard]['replicas'].values() if r['state'] == 'active']
+                if not replicas:
+                    raise ValueError("No active replicas for {} {}".format(self._source_coll, shard))
+                #Prefer the leader, it's the most up to date
+                replica = sorted(replicas, key=lambda r: r.get('leader') != 'true')[0]
+                parts.append({'name': shard, 'source_host': replica['base_url'], 'source_coll': replica['core'],
+                              'per_shard': True, 'fq': list(fq)})
+        elif partition == 'slice':
+            if not self._date_field:
+                raise ValueError("Slicing needs a date_field.")
+            slice_fqs = self._source.get_slice_fqs(self._source_coll, {'q': '*:*', 'fq': list(fq)}, self._date_field, slices)
+            for i, slice_fq in enumerate(slice_fqs):
+                parts.append({'name': 'slice{}'.format(i), 'source_host': self._source.host, 'source_coll': self._source_coll,
+                              'per_shard': self._per_shard, 'fq': list(fq) + [slice_fq]})
+        else:
+            raise ValueError("Unknown partition {}, use 'shard' or 'slice'".format(partition))
+        return parts
+
+    def _read_state(self, state_file):
+        if not os.path.isfile(state_file):
+            return {}
+        with open(state_file) as f:
+            return json.load(f)
+
+    def _write_state(self, state_file, state):
+        #Write and rename, so a killed worker never leaves a half written state file
+        with open(state_file + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_file + '.tmp', state_file)
+
+    def _reindex_from_checkpoint(self, state_file, fq=[]):
+        '''
+        Reindexes starting from the cursorMark saved in state_file, saving the cursorMark after each batch.
+        '''
+        state = self._read_state(state_file)
+        if state.get('done'):
+            return
+        if 'total' not in state:
+            query = {'q': '*:*', 'rows': 0, 'fq': fq}
+            if self._per_shard:
+                query['distrib'] = 'false'
+            state['total'] = self._source.query(self._source_coll, query).get_num_found()
+        self._items_processed = state.get('items', 0)
+        cursor = state.get('cursor', '*')
+        self.log.info("Starting {} from cursor {}, {} of {} items done".format(
+            state_file, cursor, self._items_processed, state['total']))
+
+        def checkpoint(cursor):
+            state.update(cursor=cursor, items=self._items_processed)
+            self._write_state(state_file, state)
+
+        checkpoint(cursor)
+        for items in self._from_solr(fq=fq, cursor=cursor, checkpoint=checkpoint):
+            self._putter(items)
+        state['done'] = True
+        self._write_state(state_file, state)
+
+    def _get_progress(self, specs):
+        states = [self._read_state(spec['state_file']) for spec in specs]
+        items = sum(state.get('items', 0) for state in states)
+        total = sum(state.get('total', 0) for state in states)
+        done = sum(1 for state in states if state.get('done'))
+        return items, total, done
+
+    def _log_progress(self, specs, stime, start_items):
+        items, total, done = self._get_progress(specs)
+        elapsed = time() - stime
+        rate = (items - start_items) / elapsed if elapsed else 0
+        eta = int((total - items) / rate) if rate else None
+        self.log.info("Processed {} of {} items, {} of {} workers done. {} items/second, ETA {} seconds".format(
+            items, total, done, len(specs), int(rate), eta))
+
+    def _from_json(self, fq=[], processes=2, manifest=None, transform=True):
+        '''
+        Method for retrieving batch data from a directory of json files. Files are read oldest first, the same order as IndexQ.get_all_as_list,
+        and decoded in a process pool. Only a couple of decoded files per process are kept in memory while earlier ones are being sent.
+        Pass these to reindex, for example reindex(processes=4, manifest='/tmp/reindex_manifest')
+        :param int processes: Number of processes to decode files in.
+        :param string manifest: File that completed files are recorded in. Files listed in it are skipped, so running again with the same manifest resumes.
+        :param bool transform: Remove ignore fields and apply the transform to each batch.
+        '''
+        if fq:
+            self.log.warning("fq can't be applied to a directory source, ignoring it.")
+        done = set()
+        if manifest and os.path.isfile(manifest):
+            with open(manifest) as f:
+                done = set(line.rstrip('\n') for line in f if line.strip())
+        files = [path for path in self._get_json_files() if path not in done]
+        self.log.info("Reading {} files from {}, {} already done".format(len(files), self._source, len(done)))
+
+        files = iter(files)
+        pending = deque()
+        pool = Pool(processes)
+        manifest_file = open(manifest, 'a') if manifest else None
+
+        def submit():
+            path = next(files, None)
+            if path is not None:
+                pending.append((path, pool.apply_async(_load_json_file, (path,))))
+
+        try:
+            for _ in range(processes * 2):
+                submit()
+            while pending:
+                path, result = pending.popleft()
+                docs = result.get()
+                submit()
+                for i in range(0, len(docs), self._rows):
+                    batch = docs[i:i + self._rows]
+                    self._items_processed += len(batch)
+                    yield self._trim_fields(batch) if transform else batch
+                #All items from the file were sent once we get here
+                if manifest_file:
+                    manifest_file.write(path + '\n')
+                    manifest_file.flush()
+        finally:
+            pool.terminate()
+            if manifest_file:
+                manifest_file.close()
+
+
+    def _get_json_files(self):
+        '''
+        Returns full paths of all .json and .json.gz files under the source directory, oldest first.
+        '''
+        files = []
+        for root, dirs, names in os.walk(os.path.abspath(self._source)):
+            dirs.sort()
+            files.extend(os.path.join(root, name) for name in names if name.endswith('.json') or name.endswith('.json.gz'))
+        files.sort(key=lambda path: (os.path.getmtime(path), path))
+        return files
+
+
     def _trim_fields(self, docs):
         '''
-        Removes ignore fields from the data that we got from Solr.
+        Removes ignore fields from the data that we got from Solr and applies the transform.
         '''
-        for doc in docs:
-            for field in self._ignore_fields:
-                if field in doc:
-                    del(doc[field])
-        return docs
+        return self._transform(docs)
 
 
     def _get_query(self, cursor):
@@ -162,9 +499,22 @@ class Reindexer():
             query['sort'] = "{} asc, id desc".format(self._date_field)
         if self._per_shard:
             query['distrib'] = 'false'
+        if self._fl:
+            query['fl'] = ','.join(self._fl)
         return query
 
 
+    def _throttled_put(self, data):
+        '''
+        Sends data to the destination, pacing it with the throttle.
+        '''
+        self._throttle.wait(len(data))
+        start = time()
+        res = self._send(data)
+        self._throttle.record(len(data), time() - start)
+        return res
+
+
     def _to_IndexQ(self, data):
         '''
         Sends data to IndexQ instance.
@@ -219,6 +569,24 @@ class Reindexer():
         if 'DAY' not in timespan:
             raise ValueError("At this time, only DAY date range increment is supported. Aborting..... ")
 
+        start_date, end_date = self._get_date_bounds(date_field, start_date, end_date)
+        self.log.info("Processing Items from {} to {}".format(start_date, end_date))
+
+        #Get facet counts for source and destination collections
+        source_facet = self._source.query(self._source_coll,
+            self._get_date_range_query(timespan=timespan, start_date=start_date, end_date=end_date)
+            ).get_facets_ranges()[date_field]
+        dest_facet = self._dest.query(
+            self._dest_coll, self._get_date_range_query(
+                    timespan=timespan, start_date=start_date, end_date=end_date
+                    )).get_facets_ranges()[date_field]
+        return source_facet, dest_facet
+
+
+    def _get_date_bounds(self, date_field, start_date=None, end_date=None):
+        '''
+        Returns start and end dates rounded to whole days, taken from the oldest and newest items if not given.
+        '''
         #Need to do this a bit better later. Don't like the string and date concatenations.
         if not start_date:
             start_date = self._get_edge_date(date_field, 'asc')
@@ -233,22 +601,10 @@ class Reindexer():
             end_date = end_date.isoformat()+'T00:00:00.000Z'
         else:
             end_date = end_date+'T00:00:00.000Z'
+        return start_date, end_date
 
 
-        self.log.info("Processing Items from {} to {}".format(start_date, end_date))
-
-        #Get facet counts for source and destination collections
-        source_facet = self._source.query(self._source_coll,
-            self._get_date_range_query(timespan=timespan, start_date=start_date, end_date=end_date)
-            ).get_facets_ranges()[date_field]
-        dest_facet = self._dest.query(
-            self._dest_coll, self._get_date_range_query(
-                    timespan=timespan, start_date=start_date, end_date=end_date
-                    )).get_facets_ranges()[date_field]
-        return source_facet, dest_facet
-
-
-    def resume(self, start_date=None, end_date=None, timespan='DAY', check= False):
+    def resume(self, start_date=None, end_date=None, timespan='DAY', check= False, precise=False, max_diff_docs=10000):
         '''
         This method may help if the original run was interrupted for some reason. It will only work under the following conditions
         * You have a date field that you can facet on
@@ -267,11 +623,24 @@ class Reindexer():
         :param end_date: The date to index items up to. Solr Date Math compliant value for faceting; currenlty only DAY is supported.
         :param timespan: Solr Date Math compliant value for faceting; currenlty only DAY is supported.
         :param check: If set to True it will only log differences between the two collections without actually modifying the destination.
+        :param precise: Only copy the items that are missing or changed instead of whole date ranges, see below.
+        :param max_diff_docs: In precise mode, ranges with more source items than this are split into smaller ranges before diffing ids.
+
+        With precise=True, ranges are compared on both the item count and the largest _version_. Since _version_ is assigned when an item
+        is indexed, an item that changed in the source after it was copied has a larger _version_ than it's copy in the destination. Mismatched
+        ranges with more than `max_diff_docs` items are split into HOURs and then MINUTEs, and only the mismatched sub ranges are looked at.
+        For each of those, the ids and _version_ of both collections are scanned with cursorMark in id order and merged, and only the items
+        that are missing from the destination or have a newer _version_ in the source are copied. Items that are only in the destination are
+        logged, but not deleted. The time this takes is proportional to the number of differences, not to the size of the collection.
+        Returns a dict with the number of missing, changed and extra items.
         '''
 
         if type(self._source) is not SolrClient or type(self._dest) is not SolrClient:
             raise ValueError("To resume, both source and destination need to be Solr.")
 
+        if precise:
+            return self._resume_precise(start_date, end_date, timespan, check, max_diff_docs)
+
         source_facet, dest_facet = self._get_date_facet_counts(timespan, self._date_field, start_date=start_date, end_date=end_date)
 
         for dt_range in sorted(source_facet):
@@ -289,3 +658,108 @@ class Reindexer():
                 self.log.error("Destination: {}".format(dest_facet))
                 raise ValueError("Date Ranges don't match up")
         self._dest.commit(self._dest_coll, openSearcher=True)
+
+
+    def _resume_precise(self, start_date, end_date, timespan, check, max_diff_docs):
+        if 'DAY' not in timespan:
+            raise ValueError("At this time, only DAY date range increment is supported. Aborting..... ")
+        start_date, end_date = self._get_date_bounds(self._date_field, start_date, end_date)
+        self.log.info("Processing Items from {} to {}".format(start_date, end_date))
+        stats = {'missing': 0, 'changed': 0, 'extra': 0}
+        ranges = [(start_date, end_date, timespan)]
+        while ranges:
+            start, end, span = ranges.pop()
+            source_ranges = self._get_range_summary(self._source, self._source_coll, start, end, span, self._per_shard)
+            dest_ranges = self._get_range_summary(self._dest, self._dest_coll, start, end, span)
+            for dt_range in sorted(set(source_ranges) | set(dest_ranges), reverse=True):
+                count, version = source_ranges.get(dt_range, (0, 0))
+                dest_count, dest_version = dest_ranges.get(dt_range, (0, 0))
+                if count == dest_count and version <= dest_version:
+                    continue
+                self.log.info("Date Range: {} {} Source: {} Destination:{} Difference:{}".format(
+                    dt_range, span, count, dest_count, count - dest_count))
+                range_end = '{}+1{}'.format(dt_range, span)
+                if max(count, dest_count) > max_diff_docs and span in _SUB_TIMESPANS:
+                    ranges.append((dt_range, range_end, _SUB_TIMESPANS[span]))
+                    continue
+                self._resume_ids(['{}:[{} TO {}}}'.format(self._date_field, dt_range, range_end)], stats, check)
+        self.log.info("Missing: {missing} Changed: {changed} Only in destination: {extra}".format(**stats))
+        if not check:
+            self._dest.commit(self._dest_coll, openSearcher=True)
+        return stats
+
+
+    def _get_range_summary(self, solr, collection, start, end, timespan, per_shard=False):
+        '''
+        Returns {range start: (count, max _version_)} for each non empty timespan between start and end.
+        '''
+        query = {'q': '*:*',
+                 'rows': 0,
+                 'json.facet': json.dumps({'ranges': {
+                     'type': 'range',
+                     'field': self._date_field,
+                     'start': start,
+                     'end': end,
+                     'gap': '+1{}'.format(timespan),
+                     'facet': {'version': 'max(_version_)'}}})}
+        if per_shard:
+            query['distrib'] = 'false'
+        # Solr leaves out the ranges when nothing matches
+        buckets = solr.query(collection, query).data.get('facets', {}).get('ranges', {}).get('buckets', [])
+        return dict((b['val'], (b['count'], b.get('version', 0))) for b in buckets if b['count'])
+
+
+    def _iter_id_versions(self, solr, collection, fq, per_shard=False):
+        query = {'q': '*:*', 'fq': fq, 'fl': 'id,_version_', 'sort': 'id asc', 'rows': self._rows}
+        if per_shard:
+            query['distrib'] = 'false'
+        for res in solr.cursor_query(collection, query):
+            for doc in res.docs:
+                yield doc['id'], doc['_version_']
+
+
+    def _diff_ids(self, fq):
+        '''
+        Merges the id ordered (id, _version_) streams of source and destination, without holding either in memory.
+        Yields ('missing'|'changed'|'extra', id) tuples.
+        '''
+        return diff_sorted(self._iter_id_versions(self._source, self._source_coll, fq, self._per_shard),
+                           self._iter_id_versions(self._dest, self._dest_coll, fq),
+                           lambda source_version, dest_version: source_version > dest_version)
+
+
+    def _resume_ids(self, fq, stats, check):
+        batch = []
+        for status, doc_id in self._diff_ids(fq):
+            stats[status] += 1
+            if status == 'extra':
+                self.log.debug("Item {} is only in the destination".format(doc_id))
+                continue
+            if check:
+                continue
+            batch.append(doc_id)
+            if len(batch) >= self._rows:
+                self._copy_ids(batch)
+                batch = []
+        if batch:
+            self._copy_ids(batch)
+
+
+    def _copy_ids(self, ids):
+        '''
+        Gets items by id from the source and sends them to the destination.
+        '''
+        #The terms parser splits on commas, look up ids that contain one on their own
+        fqs = ['{!term f=id}' + doc_id for doc_id in ids if ',' in doc_id]
+        plain = [doc_id for doc_id in ids if ',' not in doc_id]
+        if plain:
+            fqs.append('{!terms f=id}' + ','.join(plain))
+        for fq in fqs:
+            query = {'q': '*:*', 'fq': fq, 'rows': len(ids)}
+            if self._per_shard:
+                query['distrib'] = 'false'
+            if self._fl:
+                query['fl'] = ','.join(self._fl)
+            docs = self._trim_fields(self._source.query(self._source_coll, query).docs)
+            self._items_processed += len(docs)
+            self._putter(docs)
@@ -0,0 +1,127 @@
+import logging
+import time
+
+
+class Throttle():
+    '''
+    Controls how fast the Reindexer sends items to the destination, so reindexing can run next to live traffic.
+
+    With a fixed `docs_per_sec`, batches are spaced out to stay under that rate. With `adaptive=True` the rate follows the latency of
+    the destination: every batch that is sent within `target_latency` seconds raises the rate by `increase` items per second, and every
+    slower batch multiplies it by `decrease` (additive increase, multiplicative decrease). The rate stays between `min_rate` and `max_rate`.
+
+    :param float docs_per_sec: Target rate, or the starting rate when adaptive.
+    :param bool adaptive: Adjust the rate based on how long each batch takes to send.
+    :param float target_latency: Longest time in seconds sending a batch can take before the rate is reduced.
+    :param float increase: Items per second to add to the rate after a fast batch.
+    :param float decrease: Factor to multiply the rate by after a slow batch.
+    :param float min_rate: Lowest rate in items per second.
+    :param float max_rate: Highest rate in items per second.
+    :param pressure: Callable that returns True while the destination is busy, for example a MetricsPressure. Sending pauses until it returns False.
+    :param float pressure_interval: Seconds between pressure checks.
+
+    Example::
+
+        >>> throttle = Throttle(docs_per_sec=2000, adaptive=True, target_latency=0.5,
+                                pressure=MetricsPressure(solr, max_merges=2))
+        >>> Reindexer(source=solr, source_coll='source_coll', dest=solr, dest_coll='dest_coll', throttle=throttle).reindex()
+    '''
+    _time = staticmethod(time.time)
+    _sleep = staticmethod(time.sleep)
+
+    def __init__(self, docs_per_sec=1000, adaptive=False, target_latency=1.0, increase=100, decrease=0.5,
+                 min_rate=10, max_rate=100000, pressure=None, pressure_interval=10):
+        self.log = logging.getLogger('reindexer.throttle')
+        self.rate = float(docs_per_sec)
+        self.adaptive = adaptive
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.pressure = pressure
+        self.pressure_interval = pressure_interval
+        self._next_send = 0
+        self._next_check = 0
+
+    def wait(self, count):
+        '''
+        Blocks until `count` items can be sent without going over the rate, or while the destination is under pressure.
+        '''
+        if self.pressure is not None and self._time() >= self._next_check:
+            while self._under_pressure():
+                self.log.info("Destination is busy, pausing for {} seconds".format(self.pressure_interval))
+                self._sleep(self.pressure_interval)
+            self._next_check = self._time() + self.pressure_interval
+        now = self._time()
+        if self._next_send > now:
+            self._sleep(self._next_send - now)
+            now = self._next_send
+        self._next_send = now + count / self.rate
+
+    def _under_pressure(self):
+        #A failing check, like a metrics request timing out, shouldn't stop the reindex
+        try:
+            return self.pressure()
+        except Exception as e:
+            self.log.warning("Checking pressure failed, continuing: {}".format(e))
+            return False
+
+    def split(self, parts):
+        '''
+        Returns a new Throttle with a 1/`parts` share of the rates, for each of `parts` workers sending at the same time.
+        '''
+        return Throttle(docs_per_sec=self.rate / parts, adaptive=self.adaptive, target_latency=self.target_latency,
+                        increase=self.increase / parts, decrease=self.decrease, min_rate=self.min_rate / parts,
+                        max_rate=self.max_rate / parts, pressure=self.pressure, pressure_interval=self.pressure_interval)
+
+    def record(self, count, latency):
+        '''
+        Records how long sending `count` items took and adjusts the rate if adaptive.
+        '''
+        if not self.adaptive:
+            return
+        if latency > self.target_latency:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.log.info("Sending {} items took {:.2f} seconds, slowing down to {} items/second".format(
+                count, latency, int(self.rate)))
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class MetricsPressure():
+    '''
+    Polls the metrics API of the destination Solr and reports pressure when too many segment merges are running on its cores.
+    Use it as the `pressure` of a Throttle.
+
+    :param solr: An instance of SolrClient for the destination.
+    :param int max_merges: Largest number of running merges (major and minor, across all cores of the node) that isn't considered pressure.
+    '''
+    metrics = ('INDEX.merge.major.running', 'INDEX.merge.minor.running')
+
+    def __init__(self, solr, max_merges=2):
+        self.log = logging.getLogger('reindexer.throttle')
+        self._solr = solr
+        self.max_merges = max_merges
+
+    def get_running_merges(self):
+        res, con_info = self._solr.transport.send_request(endpoint='admin/metrics',
+                                                          params={'group': 'core', 'prefix': ','.join(self.metrics)})
+        registries = res.get('metrics', {})
+        if type(registries) is list:
+            registries = dict(zip(registries[::2], registries[1::2]))
+        total = 0
+        for values in registries.values():
+            if type(values) is list:
+                values = dict(zip(values[::2], values[1::2]))
+            for name in self.metrics:
+                val = values.get(name, 0)
+                total += val.get('value', 0) if type(val) is dict else val
+        return total
+
+    def __call__(self):
+        merges = self.get_running_merges()
+        if merges > self.max_merges:
+            self.log.info("{} merges running on the destination".format(merges))
+            return True
+        return False
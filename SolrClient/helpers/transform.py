@@ -0,0 +1,130 @@
+'''
+Compiles a declarative list of document transforms into a single function that is applied to a whole batch of documents.
+
+A spec is a list of steps, applied in order. Each step is a dict with one key:
+
+* ``{'drop': ['field', ...]}`` removes fields.
+* ``{'rename': {'old': 'new', ...}}`` renames fields.
+* ``{'map': {'field': func, ...}}`` replaces the value of a field with ``func(value)``. ``func`` can also be one of the type names
+  'int', 'float', 'str' or 'bool'. Multi valued fields are mapped value by value.
+* ``{'compute': {'field': func, ...}}`` sets a field to ``func(doc)``.
+* ``{'filter': func}`` only keeps documents where ``func(doc)`` is true.
+
+Consecutive drop and rename steps are merged into a single pass over the keys of each document. To run transforms in a process pool,
+functions in the spec need to be picklable, so use module level functions instead of lambdas. ::
+
+    >>> transform = compile_transform([
+            {'drop': ['_version_']},
+            {'rename': {'title_t': 'title'}},
+            {'map': {'price': 'float'}},
+            {'filter': has_title}])
+    >>> transform([{'id': '1', 'title_t': 'a', 'price': '10', '_version_': 1}])
+    [{'id': '1', 'title': 'a', 'price': 10.0}]
+'''
+
+_TYPES = {'int': int, 'float': float, 'str': str, 'bool': bool}
+_STEPS = ('drop', 'rename', 'map', 'compute', 'filter')
+
+
+def compile_transform(spec):
+    '''
+    :param list spec: List of transform steps, see the module documentation.
+
+    Returns a function that takes a list of documents and returns the transformed list.
+    '''
+    stages = []
+    keymap = None
+    for step in spec or []:
+        if type(step) is not dict or len(step) != 1 or list(step)[0] not in _STEPS:
+            raise ValueError("Transform steps need exactly one of {} as key, got {}".format(", ".join(_STEPS), step))
+        op, arg = list(step.items())[0]
+        if op in ('drop', 'rename'):
+            if keymap is None:
+                keymap = {}
+            _add_to_keymap(keymap, op, arg)
+            continue
+        if keymap is not None:
+            stages.append(_compile_keymap(keymap))
+            keymap = None
+        stages.append(_COMPILERS[op](arg))
+    if keymap is not None:
+        stages.append(_compile_keymap(keymap))
+
+    def transform(docs):
+        for stage in stages:
+            docs = stage(docs)
+        return docs
+    return transform
+
+
+def _add_to_keymap(keymap, op, arg):
+    # keymap maps original field names to their new name, or None if they're dropped
+    pairs = [(field, None) for field in arg] if op == 'drop' else list(arg.items())
+    for old, new in pairs:
+        for raw, current in list(keymap.items()):
+            if current == old:
+                keymap[raw] = new
+        if old not in keymap:
+            keymap[old] = new
+
+
+def _compile_keymap(keymap):
+    drop = tuple(field for field, new in keymap.items() if new is None)
+    if len(drop) == len(keymap):
+        def drop_fields(docs):
+            for doc in docs:
+                for field in drop:
+                    doc.pop(field, None)
+            return docs
+        return drop_fields
+
+    def remap_fields(docs):
+        get = keymap.get
+        return [{get(key, key): val for key, val in doc.items() if get(key, key) is not None} for doc in docs]
+    return remap_fields
+
+
+def _compile_map(arg):
+    funcs = [(field, _TYPES.get(func, func)) for field, func in arg.items()]
+
+    def map_fields(docs):
+        for field, func in funcs:
+            for doc in docs:
+                if field in doc:
+                    val = doc[field]
+                    doc[field] = [func(x) for x in val] if type(val) is list else func(val)
+        return docs
+    return map_fields
+
+
+def _compile_compute(arg):
+    funcs = list(arg.items())
+
+    def compute_fields(docs):
+        for field, func in funcs:
+            for doc in docs:
+                doc[field] = func(doc)
+        return docs
+    return compute_fields
+
+
+def _compile_filter(func):
+    def filter_docs(docs):
+        return [doc for doc in docs if func(doc)]
+    return filter_docs
+
+
+_COMPILERS = {'map': _compile_map, 'compute': _compile_compute, 'filter': _compile_filter}
+
+
+#Set in each worker of a transform process pool
+_worker_transform = None
+
+
+def _init_worker(spec):
+    global _worker_transform
+    _worker_transform = compile_transform(spec)
+
+
+def _run_worker(docs):
+    return _worker_transform(docs)
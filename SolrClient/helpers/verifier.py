@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+
+
+def diff_sorted(source, dest, is_changed):
+    '''
+    Merge joins two iterators of (id, value) tuples that are sorted by id, without holding either in memory.
+    Yields ('missing'|'changed'|'extra', id) tuples. `is_changed` gets the source and destination values of an id that is in both.
+    '''
+    s = next(source, None)
+    d = next(dest, None)
+    while s is not None or d is not None:
+        if d is None or (s is not None and s[0] < d[0]):
+            yield 'missing', s[0]
+            s = next(source, None)
+        elif s is None or s[0] > d[0]:
+            yield 'extra', d[0]
+            d = next(dest, None)
+        else:
+            if is_changed(s[1], d[1]):
+                yield 'changed', s[0]
+            s = next(source, None)
+            d = next(dest, None)
+
+
+class Verifier():
+    '''
+    Compares the items in two collections, for example before switching over to a reindexed collection.
+
+    Ids are streamed from both collections with cursorMark, sorted by the unique key, and merged, so memory use stays the same no matter
+    how big the collections are. Items are reported as missing (only in the source), extra (only in the destination) or changed.
+
+    :param source: An instance of SolrClient.
+    :param dest: An instance of SolrClient.
+    :param string source_coll: Source collection name.
+    :param string dest_coll: Destination collection name.
+    :param list fields: Fields to compare. If given, the values of these fields are hashed for each item and items with different hashes
+    are changed. If not, _version_ is compared: since it is assigned when an item is indexed, an item that was updated in the source after it
+    was copied has a larger _version_ than it's copy.
+    :param string digest_field: Numeric field holding a hash of each item, e.g. from a SignatureUpdateProcessor. Used to compare buckets in `verify`.
+    :param int rows: Number of ids to get in each query.
+    :param string unique_key: Name of the unique key field.
+    '''
+    def __init__(self, source, dest, source_coll, dest_coll, fields=None, digest_field=None, rows=1000, unique_key='id'):
+        self.log = logging.getLogger('verifier')
+        self._source = source
+        self._dest = dest
+        self._source_coll = source_coll
+        self._dest_coll = dest_coll
+        self._fields = fields
+        self._digest_field = digest_field
+        self._rows = rows
+        self._unique_key = unique_key
+
+    def _iter_keys(self, solr, collection, fq):
+        fields = self._fields or ['_version_']
+        query = {'q': '*:*',
+                 'fq': fq,
+                 'fl': ','.join([self._unique_key] + fields),
+                 'sort': '{} asc'.format(self._unique_key),
+                 'rows': self._rows}
+        for res in solr.cursor_query(collection, query):
+            for doc in res.docs:
+                if self._fields:
+                    values = json.dumps([doc.get(field) for field in self._fields], sort_keys=True)
+                    yield doc[self._unique_key], hashlib.md5(values.encode('utf-8')).digest()
+                else:
+                    yield doc[self._unique_key], doc['_version_']
+
+    def _is_changed(self, source_val, dest_val):
+        if self._fields:
+            return source_val != dest_val
+        return source_val > dest_val
+
+    def diff(self, fq=[]):
+        '''
+        :param list fq: Filter queries to limit the comparison to, applied to both collections.
+
+        Yields ('missing'|'changed'|'extra', id) tuples for every item that differs. ::
+
+            >>> verifier = Verifier(solr, solr, 'source_coll', 'dest_coll')
+            >>> list(verifier.diff())
+            [('missing', '0b1a7c41-...'), ('changed', '5e1f03aa-...')]
+        '''
+        return diff_sorted(self._iter_keys(self._source, self._source_coll, fq),
+                           self._iter_keys(self._dest, self._dest_coll, fq),
+                           self._is_changed)
+
+    def verify(self, fq=[], bucket_field=None, buckets=32, max_bucket_docs=10000, depth=3, max_report=1000):
+        '''
+        :param list fq: Filter queries to limit the comparison to.
+        :param string bucket_field: Numeric or date field to split the collections into buckets on. Without it, all ids are diffed.
+        :param int buckets: Number of buckets to split into at each level.
+        :param int max_bucket_docs: Mismatched buckets with more items than this are split again.
+        :param int depth: Maximum number of times to split.
+        :param int max_report: Maximum number of ids to return for each kind of difference.
+
+        Compares the collections and returns a dict with the number of missing, changed and extra items, along with up to `max_report` of their ids.
+
+        With a `bucket_field`, this works like a Merkle tree. The source is split into buckets with about the same number of items
+        and a digest of each bucket is taken on both sides with a single json.facet query: the item count, the largest _version_
+        (or, when comparing `fields`, the sum of `digest_field` if given). Buckets with matching digests are skipped, mismatched
+        buckets are split again until they hold at most `max_bucket_docs` items, and only those get their ids diffed. Note that
+        when comparing `fields` without a `digest_field`, only the counts are compared, so changes in buckets with the same count aren't found. ::
+
+            >>> verifier.verify(bucket_field='date')
+            {'missing': 5, 'changed': 1, 'extra': 0, 'buckets_skipped': 31, 'buckets_diffed': 2,
+             'ids': {'missing': [...], 'changed': [...], 'extra': []}}
+        '''
+        out = {'missing': 0, 'changed': 0, 'extra': 0, 'buckets_skipped': 0, 'buckets_diffed': 0,
+               'ids': {'missing': [], 'changed': [], 'extra': []}}
+        fq = [fq] if type(fq) is str else list(fq)
+        if not bucket_field:
+            self._diff_into(fq, out, max_report)
+            return out
+        pending = [(fq, 0)]
+        while pending:
+            bucket_fq, level = pending.pop()
+            sub_fqs = self._source.get_slice_fqs(self._source_coll, {'q': '*:*', 'fq': bucket_fq}, bucket_field, buckets)
+            source_digests = self._get_digests(self._source, self._source_coll, bucket_fq, sub_fqs)
+            dest_digests = self._get_digests(self._dest, self._dest_coll, bucket_fq, sub_fqs)
+            for sub_fq, source_digest, dest_digest in zip(sub_fqs, source_digests, dest_digests):
+                if self._digests_match(source_digest, dest_digest):
+                    out['buckets_skipped'] += 1
+                    continue
+                self.log.info("Bucket {} Source: {} Destination: {}".format(sub_fq, source_digest, dest_digest))
+                count = max(source_digest['count'], dest_digest['count'])
+                # A bucket that didn't get split any further can't be narrowed down
+                if count > max_bucket_docs and level + 1 < depth and len(sub_fqs) > 2:
+                    pending.append((bucket_fq + [sub_fq], level + 1))
+                else:
+                    out['buckets_diffed'] += 1
+                    self._diff_into(bucket_fq + [sub_fq], out, max_report)
+        return out
+
+    def _get_digests(self, solr, collection, fq, sub_fqs):
+        aggs = {}
+        if not self._fields:
+            aggs['version'] = 'max(_version_)'
+        elif self._digest_field:
+            aggs['digest'] = 'sum({})'.format(self._digest_field)
+        facet = {}
+        for i, sub_fq in enumerate(sub_fqs):
+            # Query facets don't match anything with a purely negative query
+            q = '*:* ' + sub_fq if sub_fq.startswith('-') else sub_fq
+            facet['b{}'.format(i)] = {'type': 'query', 'q': q, 'facet': aggs}
+        res = solr.query(collection, {'q': '*:*', 'fq': fq, 'rows': 0, 'json.facet': json.dumps(facet)})
+        # Solr leaves out the buckets when nothing matches fq
+        facets = res.data.get('facets', {})
+        return [facets.get('b{}'.format(i), {'count': 0}) for i in range(len(sub_fqs))]
+
+    def _digests_match(self, source_digest, dest_digest):
+        if source_digest.get('count', 0) != dest_digest.get('count', 0):
+            return False
+        if 'version' in source_digest and source_digest['version'] > dest_digest.get('version', 0):
+            return False
+        return source_digest.get('digest') == dest_digest.get('digest')
+
+    def _diff_into(self, fq, out, max_report):
+        for status, doc_id in self.diff(fq):
+            out[status] += 1
+            if len(out['ids'][status]) < max_report:
+                out['ids'][status].append(doc_id)
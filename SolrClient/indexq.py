@@ -6,12 +6,64 @@ import gzip
 import shutil
 import random
 import json
+import re
 import threading
 import time
+import socket
+from collections import deque
 from multiprocessing.pool import ThreadPool
 from multiprocessing import Process, JoinableQueue
 from functools import partial
 from SolrClient.exceptions import *
+
+#json.dumps makes a new encoder on each call when it gets any options, this one is shared by all buffers
+_encode = json.JSONEncoder(sort_keys=True).encode
+_decoder = json.JSONDecoder()
+_ws = re.compile(r'[ \t\n\r]*')
+
+
+def _iter_json(f, chunk_size=65536):
+    '''
+    Incrementally decodes a JSON array, or newline delimited JSON, from a text file object and yields the items one at a time.
+    Only the item being decoded and the rest of the current chunk are kept in memory.
+    '''
+    buf = f.read(chunk_size)
+    eof = not buf
+    pos = 0
+    array = None
+    while True:
+        pos = _ws.match(buf, pos).end()
+        if pos < len(buf):
+            c = buf[pos]
+            if array is None:
+                array = c == '['
+                if array:
+                    pos += 1
+                    continue
+            if array and c == ',':
+                pos += 1
+                continue
+            if array and c == ']':
+                return
+            try:
+                item, end = _decoder.raw_decode(buf, pos)
+                #A number at the end of the chunk could continue in the next one
+                complete = end < len(buf) or eof or type(item) in (dict, list)
+            except ValueError:
+                if eof:
+                    raise
+                complete = False
+            if complete:
+                pos = end
+                yield item
+                continue
+        elif eof:
+            return
+        #Read at least as much as is buffered, so a large item isn't decoded over and over
+        chunk = f.read(max(chunk_size, len(buf) - pos))
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
 
 
 
@@ -24,12 +76,16 @@ class IndexQ():
     queue_name/
      - todo/
      - done/
+     - inprogress/
 
     Items get saved to the todo directory and once an item is processed it gets moved to the done directory. Items are processed in chronological order.
+
+    Several consumers, also on different hosts sharing the queue over NFS, can drain a queue at the same time with claim_todo_items.
+    Claimed items are moved to inprogress/<consumer_id>/ while they are being processed.
     '''
 
     def __init__(self, basepath, queue, compress=False, compress_complete=False, size=0, devel=False,
-                 threshold=0.90, log=None, rotate_complete=None, remove_complete=False, **kwargs ):
+                 threshold=0.90, log=None, rotate_complete=None, remove_complete=False, fsync=None, fsync_interval=100, **kwargs ):
         '''
         :param string basepath: Path to the root of the indexQ. All other queues will get created underneath this.
         :param string queue: Name of the queue.
@@ -39,6 +95,10 @@ class IndexQ():
         :param bool compress: If todo files should be compressed, set to True if there is going to be a lot of data and these files will be sitting there for a while.
         :param bool compress: If done files should be compressed, set to True if there is going to be a lot of data and these files will be sitting there for a while.
         :param int size: Internal buffer size (MB) that queued data must be to get written to the file system. If not passed, the data will be written to the filesystem as it is sent to IndexQ, otherwise they will be written when the buffer reaches 90%.
+        :param string fsync: When to fsync written files. Files are always written to the tmp directory first and renamed into todo once complete, so a crashed producer never leaves a partial file in todo.
+            None leaves it to the OS, 'file' fsyncs every file before it is renamed, 'group' renames files in groups every `fsync_interval` milliseconds with a single fsync of the todo directory, so files show up in todo up to that much later.
+            With 'group', the path returned by add is where the file will be once its group is committed. Until then the complete file waits in tmp as a .ready file, which is moved into todo the next time the queue is opened if the producer died before committing it.
+        :param int fsync_interval: Milliseconds between group commits when fsync is 'group'. Call sync() or add(finalize=True) to commit right away.
 
         Example Usage::
             i = IndexQ('/data/indexq','parsed_data')
@@ -55,7 +115,9 @@ class IndexQ():
         self._threshold = threshold
         self._qpathdir = os.path.join(self._basepath, self._queue_name)
         self._todo_dir = os.path.join(self._basepath, self._queue_name, 'todo')
+        self._tmp_dir = os.path.join(self._basepath, self._queue_name, 'tmp')
         self._done_dir = os.path.join(self._basepath, self._queue_name, 'done')
+        self._inprogress_dir = os.path.join(self._basepath, self._queue_name, 'inprogress')
         self._locked = False
         self._rlock = threading.RLock()
         self.rotate_complete = rotate_complete
@@ -63,9 +125,20 @@ class IndexQ():
         #Lock File
         self._lck = os.path.join(self._qpathdir,'index.lock')
 
-        for dir in [self._qpathdir, self._todo_dir, self._done_dir]:
+        if fsync not in (None, 'file', 'group'):
+            raise ValueError("fsync has to be None, 'file' or 'group'")
+        self._fsync = fsync
+        self._fsync_interval = fsync_interval
+        self._pending = []
+        self._sync_lock = threading.Lock()
+        self._sync_timer = None
+        #Dots are used to split temp file names
+        self._host = socket.gethostname().replace('.', '_')
+
+        for dir in [self._qpathdir, self._todo_dir, self._done_dir, self._tmp_dir, self._inprogress_dir]:
             if not os.path.isdir(dir):
                 os.makedirs(dir)
+        self._remove_orphans()
 
         #First argument will be datestamp, second is counter
         self._output_filename_pattern = self._queue_name+"_{}.json"
@@ -103,26 +176,152 @@ class IndexQ():
                 raise ValueError("Not the right data submitted. Make sure you are sending a dict or list of dicts")
         with self._rlock:
             res = self._preprocess(item, finalize, callback)
+        if finalize:
+            self.sync()
         return res
 
 
     def _write_file(self, content):
+        with self._sync_lock:
+            pending = set(path for tmp, path in self._pending)
         while True:
             path = os.path.join(self._todo_dir,self._gen_file_name())
             if self._compress:
                 path += '.gz'
-            if not os.path.isfile(path):
+            if not os.path.isfile(path) and path not in pending:
                 break
         self.logger.info("Writing new file to {}".format(path))
-        if self._compress:
-            with gzip.open(path, 'wb') as f:
-                f.write(content.encode('utf-8'))
+        tmp = self._get_tmp_path(path)
+        self._write_tmp(tmp, content.encode('utf-8'), self._compress)
+        if self._fsync == 'group':
+            #Complete files get their own suffix, so recovery knows to move them into todo instead of removing them
+            ready = tmp[:-len('.tmp')] + '.ready'
+            os.replace(tmp, ready)
+            with self._sync_lock:
+                self._pending.append((ready, path))
+                if self._sync_timer is None:
+                    #Not a daemon, so the interpreter waits for the last group commit when exiting
+                    self._sync_timer = threading.Timer(self._fsync_interval / 1000, self.sync)
+                    self._sync_timer.start()
         else:
-            with open(path,'w') as f:
-                f.write(content)
+            os.replace(tmp, path)
+            if self._fsync == 'file':
+                self._fsync_dir(self._todo_dir)
         return path
 
 
+    def _get_tmp_path(self, path):
+        #Host and PID in the name let recovery tell which temp files belong to dead producers
+        return os.path.join(self._tmp_dir, '{}.{}.{}.tmp'.format(os.path.basename(path), self._host, os.getpid()))
+
+
+    def _write_tmp(self, tmp, data, compress):
+        with open(tmp, 'wb') as f:
+            if compress:
+                with gzip.GzipFile(filename='', mode='wb', fileobj=f) as gz:
+                    gz.write(data)
+            else:
+                f.write(data)
+            if self._fsync == 'file':
+                f.flush()
+                os.fsync(f.fileno())
+
+
+    def _fsync_dir(self, dir):
+        #Makes renames into the directory durable, not supported on Windows
+        try:
+            fd = os.open(dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+    def sync(self):
+        '''
+        With fsync='group', fsyncs and renames all files written since the last group commit into the todo directory. Does nothing otherwise.
+        '''
+        with self._sync_lock:
+            pending, self._pending = self._pending, []
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+        if not pending:
+            return []
+        for tmp, path in pending:
+            fd = os.open(tmp, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for tmp, path in pending:
+            self._move(tmp, path)
+        self._fsync_dir(self._todo_dir)
+        if self._devel:
+            self.logger.debug("Committed {} files to {}".format(len(pending), self._todo_dir))
+        return [path for tmp, path in pending]
+
+
+    def _remove_orphans(self, max_age=86400):
+        '''
+        Removes temp files left behind by producers that died while writing, and moves complete files that they didn't get to commit into todo.
+        Files from other hosts are only handled once they're older than max_age seconds.
+        '''
+        recovered = False
+        for name in os.listdir(self._tmp_dir):
+            parts = name.rsplit('.', 3)
+            if len(parts) != 4 or parts[3] not in ('tmp', 'ready'):
+                continue
+            path = os.path.join(self._tmp_dir, name)
+            try:
+                if parts[1] == self._host:
+                    orphaned = not self._pid_alive(int(parts[2]))
+                else:
+                    orphaned = time.time() - os.path.getmtime(path) > max_age
+                if not orphaned:
+                    continue
+                if parts[3] == 'ready':
+                    dest = os.path.join(self._todo_dir, parts[0])
+                    if os.path.exists(dest):
+                        self.logger.error("Can't recover {}, {} already exists".format(path, dest))
+                        continue
+                    self.logger.warning("Recovering uncommitted file {} to {}".format(path, dest))
+                    os.replace(path, dest)
+                    recovered = True
+                else:
+                    self.logger.warning("Removing orphaned temp file {}".format(path))
+                    os.remove(path)
+            except (OSError, ValueError) as e:
+                self.logger.error("Couldn't check temp file {}".format(path))
+                self.logger.exception(e)
+        if recovered:
+            self._fsync_dir(self._todo_dir)
+
+
+    def _pid_alive(self, pid):
+        if pid == os.getpid():
+            return True
+        try:
+            import psutil
+            return psutil.pid_exists(pid)
+        except ImportError:
+            pass
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        except OSError:
+            #Can't tell on this platform, keep the file
+            return True
+        return True
+
+
     def _buffer(self, size, callback):
         _c = {
             'size': 0,
@@ -134,10 +333,12 @@ class IndexQ():
         def inner(item=None, finalize=False, listener=None):
             #Listener is the external callback specific by the user. Need to change the names later a bit.
             if item:
-                #Buffer Item
-                [_c['buf'].append(x) for x in item]
-                #Wish I didn't have to make a string of it over here sys.getsizeof wasn't providing accurate info either.
-                _c['size'] += len(str(item))
+                #Each item is encoded once here. json.dumps escapes non ascii characters, so the length of the string is the size in bytes.
+                #The 2 is for the separator between items, and the brackets around the list take the place of the last one.
+                for x in item:
+                    encoded = _encode(x)
+                    _c['buf'].append(encoded)
+                    _c['size'] += len(encoded) + 2
                 if self._devel:
                     self.logger.debug("Item added to Buffer {} New Buffer Size is {}".format(self._queue_name, _c['size']))
             if _c['size'] / _c['osize'] > self._threshold or (finalize is True and len(_c['buf']) >= 1):
@@ -147,7 +348,7 @@ class IndexQ():
                         self.logger.debug("Finalize is True, writing out")
                     else:
                         self.logger.debug("Buffer Filled, writing out")
-                res = _c['callback'](json.dumps(_c['buf'], indent=0, sort_keys=True))
+                res = _c['callback']('[' + ',\n'.join(_c['buf']) + ']')
                 if listener:
                     try:
                         listener(res)
@@ -159,7 +360,7 @@ class IndexQ():
                     _c['size'] = 0
                     return res
                 else:
-                    raise RuntimeError("Couldn't write out the buffer." + _c)
+                    raise RuntimeError("Couldn't write out the buffer of {} items.".format(len(_c['buf'])))
             return _c['size']
         return inner
 
@@ -217,9 +418,15 @@ class IndexQ():
         '''
         dir = getattr(self,dir)
         list = [x for x in os.listdir(dir) if x.endswith('.json') or x.endswith('.json.gz')]
-        full = [os.path.join(dir,x) for x in list]
-        full.sort(key=lambda x: os.path.getmtime(x))
-        return full
+        full = []
+        for x in list:
+            try:
+                #Items can be claimed by other consumers while listing
+                full.append((os.path.getmtime(os.path.join(dir,x)), os.path.join(dir,x)))
+            except FileNotFoundError:
+                pass
+        full.sort(key=lambda x: x[0])
+        return [x[1] for x in full]
 
 
     def get_todo_items(self, **kwargs):
@@ -239,6 +446,114 @@ class IndexQ():
         raise RuntimeError("RuntimeError: Index Already Locked")
 
 
+    def claim_todo_items(self, consumer_id=None, lease=300):
+        '''
+        Returns an iterator of todo items claimed by this consumer. Unlike get_todo_items, any number of consumers can run this on the same
+        queue at the same time. Each item is claimed with an atomic rename into inprogress/<consumer_id>/, so only one consumer gets it, and
+        the path in there is what gets yielded. Pass it to complete once it is processed, or to release to put it back into todo.
+
+        Each consumer has a heartbeat file that is touched on every claim. Before claiming, items of consumers whose heartbeat is older than
+        `lease` seconds are moved back to todo, so items claimed by a consumer that died are picked up again. If processing a single item can
+        take longer than the lease, call heartbeat while working on it.
+
+        A consumer_id must only be used by one consumer at a time. Items left in inprogress/<consumer_id>/ by a previous run with the
+        same consumer_id, one that crashed for example, are moved back to todo when this starts.
+
+        :param string consumer_id: Unique name of this consumer, defaults to host name and PID.
+        :param int lease: Seconds without a heartbeat after which a consumer is considered dead.
+        '''
+        consumer_id = consumer_id or '{}_{}'.format(self._host, os.getpid())
+        claim_dir = os.path.join(self._inprogress_dir, consumer_id)
+        if os.path.isdir(claim_dir):
+            left = self._release_all(claim_dir)
+            if left:
+                self.logger.warning("Moved {} items left by a previous run of {} back to todo".format(len(left), consumer_id))
+        self.heartbeat(consumer_id)
+        self.reclaim_stale(lease)
+        for todo_file in self.get_all_as_list():
+            claimed = os.path.join(claim_dir, os.path.basename(todo_file))
+            try:
+                os.rename(todo_file, claimed)
+            except FileNotFoundError:
+                #Another consumer got to it first
+                continue
+            self.heartbeat(consumer_id)
+            if self._devel: self.logger.debug("{} claimed {}".format(consumer_id, claimed))
+            yield claimed
+
+
+    def heartbeat(self, consumer_id):
+        '''
+        Renews the lease of the consumer.
+        '''
+        claim_dir = os.path.join(self._inprogress_dir, consumer_id)
+        if not os.path.isdir(claim_dir):
+            os.makedirs(claim_dir, exist_ok=True)
+        with open(os.path.join(self._inprogress_dir, consumer_id, '.heartbeat'), 'w') as f:
+            f.write(str(time.time()))
+
+
+    def reclaim_stale(self, lease=300):
+        '''
+        Moves items claimed by consumers without a heartbeat in the last `lease` seconds back to todo. Returns the paths of the items moved.
+
+        Heartbeats are compared to the modification time of a file touched right before, so both times come from the file server and
+        clock differences between consumer hosts don't matter.
+        '''
+        now = self._server_time()
+        reclaimed = []
+        for consumer_id in os.listdir(self._inprogress_dir):
+            claim_dir = os.path.join(self._inprogress_dir, consumer_id)
+            if not os.path.isdir(claim_dir):
+                continue
+            beat = os.path.join(claim_dir, '.heartbeat')
+            try:
+                last = os.path.getmtime(beat) if os.path.exists(beat) else os.path.getmtime(claim_dir)
+            except FileNotFoundError:
+                continue
+            if now - last < lease:
+                continue
+            self.logger.warning("Consumer {} has no heartbeat for {} seconds, reclaiming it's items".format(
+                consumer_id, int(now - last)))
+            reclaimed.extend(self._release_all(claim_dir))
+            try:
+                os.remove(beat)
+                os.rmdir(claim_dir)
+            except OSError:
+                pass
+        return reclaimed
+
+
+    def _server_time(self):
+        #Current time according to the filesystem holding the queue
+        path = os.path.join(self._inprogress_dir, '.clock')
+        with open(path, 'w') as f:
+            f.write(self._host)
+        return os.path.getmtime(path)
+
+
+    def _release_all(self, claim_dir):
+        released = []
+        for name in os.listdir(claim_dir):
+            if name == '.heartbeat':
+                continue
+            try:
+                released.append(self.release(os.path.join(claim_dir, name)))
+            except FileNotFoundError:
+                #Completed or reclaimed by someone else meanwhile
+                pass
+        return released
+
+
+    def release(self, filepath):
+        '''
+        Puts a claimed item back into the todo directory, for example after it failed to index.
+        '''
+        newpath = os.path.join(self._todo_dir, os.path.basename(filepath))
+        os.rename(filepath, newpath)
+        return newpath
+
+
     def complete(self, filepath):
         '''
         Marks the item as complete by moving it to the done directory and optionally gzipping it.
@@ -283,7 +598,7 @@ class IndexQ():
                     return newpath
                 # else the file is already compressed and can just be moved
             #if not compressing completed file, just move it
-            shutil.move(filepath, newpath)
+            self._move(filepath, newpath)
             self.logger.info(" Completed - {}".format(filepath))
         except Exception as e:
             self.logger.error("Couldn't Complete {}".format(filepath))
@@ -295,8 +610,10 @@ class IndexQ():
     def _compress_and_move(self, source, destination):
         try:
             self.logger.debug("Compressing and Moving Completed file: {} -> {}".format(source, destination))
-            with gzip.open(destination, 'wb') as df, open(source, 'rb') as sf:
+            tmp = self._get_tmp_path(destination)
+            with open(tmp, 'wb') as f, gzip.GzipFile(filename='', mode='wb', fileobj=f) as df, open(source, 'rb') as sf:
                     df.writelines(sf)
+            os.replace(tmp, destination)
             os.remove(source)
         except Exception as e:
             self.logger.error("Unable to Compress and Move file {} -> {}".format(source, destination))
@@ -305,7 +622,17 @@ class IndexQ():
         return True
 
 
-    def index(self, solr, collection, threads=1, send_method='stream_file', **kwargs):
+    def _move(self, source, destination):
+        '''
+        Moves the file with an atomic rename, falling back to copying if the destination is on another filesystem.
+        '''
+        try:
+            os.replace(source, destination)
+        except OSError:
+            shutil.move(source, destination)
+
+
+    def index(self, solr, collection, threads=1, send_method='stream_file', consumer_id=None, lease=300, batch_size=None, **kwargs):
         '''
         Will index the queue into a specified solr instance and collection. Specify multiple threads to make this faster, however keep in mind that if you specify multiple threads the items may not be in order.
         Example::
@@ -318,7 +645,18 @@ class IndexQ():
         :param string collection: The name of the collection to index document into.
         :param int threads: Number of simultaneous threads to spin up for indexing.
         :param string send_method: SolrClient method to execute for indexing. Default is stream_file
+        :param string consumer_id: Claim items as this consumer with claim_todo_items instead of locking the whole queue, so several processes can index the queue at once.
+        :param int lease: Lease for claim_todo_items.
+        :param int batch_size: Stream docs out of the files with get_todo_docs and send them with index_json in batches of this many docs, instead of sending whole files. Only with a single thread.
         '''
+        if batch_size:
+            if threads > 1:
+                raise ValueError("batch_size can only be used with a single thread")
+            return self._index_batches(solr, collection, batch_size, consumer_id, lease)
+        if consumer_id:
+            todo_items = self.claim_todo_items(consumer_id, lease=lease)
+        else:
+            todo_items = self.get_todo_items()
 
         try:
             method = getattr(solr, send_method)
@@ -335,19 +673,56 @@ class IndexQ():
                 method = partial(self._wrap_dynamic, method, collection)
             else:
                 method = partial(self._wrap, method, collection)
+            if consumer_id:
+                method = partial(self._wrap_claimed, method, consumer_id)
             with ThreadPool(threads) as p:
-                p.map(method, self.get_todo_items())
+                #ThreadPool.map and imap read the whole iterable up front, this only takes the next item when a thread is free,
+                #so a consumer doesn't claim more than it is working on
+                pending = deque()
+                for todo_file in todo_items:
+                    pending.append(p.apply_async(method, (todo_file,)))
+                    if len(pending) >= threads:
+                        pending.popleft().get()
+                while pending:
+                    pending.popleft().get()
         else:
-            for todo_file in self.get_todo_items():
+            for todo_file in todo_items:
                 try:
                     result = method(collection, todo_file)
                     if result:
                         self.complete(todo_file)
+                    elif consumer_id:
+                        self.release(todo_file)
+                    if consumer_id:
+                        self.heartbeat(consumer_id)
                 except SolrError:
                     self.logger.error("Error Indexing Item: {}".format(todo_file))
-                    self._unlock()
+                    if consumer_id:
+                        self.release(todo_file)
+                    else:
+                        self._unlock()
                     raise
 
+    def _index_batches(self, solr, collection, batch_size, consumer_id, lease):
+        self.logger.info("Indexing {} into {} in batches of {}".format(self._queue_name, collection, batch_size))
+        batches = self.get_todo_docs(batch_size, consumer_id=consumer_id, lease=lease)
+        for docs in batches:
+            if hasattr(collection, '__call__'):
+                temp = {}
+                for item in docs:
+                    temp.setdefault(collection(item), []).append(item)
+            else:
+                temp = {collection: docs}
+            try:
+                for coll in temp:
+                    solr.index_json(coll, json.dumps(temp[coll]))
+            except SolrError:
+                self.logger.error("Error Indexing {} items from {}".format(len(docs), self._queue_name))
+                #Releases claimed files or the lock
+                batches.close()
+                raise
+
+
     def _wrap(self, method, collection, doc):
         #Indexes entire file into the collection
         try:
@@ -359,6 +734,16 @@ class IndexQ():
             self.logger.error("Error Indexing Item: {}".format(doc))
             pass
 
+    def _wrap_claimed(self, method, consumer_id, doc):
+        #Renews the lease for each item and puts items that weren't completed back into todo
+        self.heartbeat(consumer_id)
+        try:
+            return method(doc)
+        finally:
+            if os.path.exists(doc):
+                self.release(doc)
+            self.heartbeat(consumer_id)
+
     def _wrap_dynamic(self, method, collection, doc):
         # Reads the file, executing 'collection' function on each item to
         # get the name of collection it should be indexed into
@@ -401,14 +786,79 @@ class IndexQ():
 
     def get_all_json_from_indexq(self):
         '''
-        Gets all data from the todo files in indexq and returns one huge list of all data.
+        Gets all data from the todo files in indexq and returns one huge list of all data. Use get_todo_docs for large queues.
         '''
         files = self.get_all_as_list()
         out = []
         for efile in files:
-            out.extend(self._open_file(efile))
+            out.extend(self._iter_file(efile))
         return out
 
+
+    def get_todo_docs(self, batch_size=1000, complete=True, consumer_id=None, lease=300):
+        '''
+        Returns an iterator of lists of up to `batch_size` docs from all todo files, oldest first. Files are decoded incrementally,
+        so memory use depends on the batch size and not on the size of the files or of the queue. Example::
+
+            >>> for docs in index.get_todo_docs(batch_size=5000):
+                    solr.index_json('SolrClient_unittest', json.dumps(docs))
+
+        :param int batch_size: Number of docs in each batch, batches span files.
+        :param bool complete: Complete each file once the batch with it's last doc is processed, that is when the next batch is requested.
+            Files in a batch that failed are not completed, so stopping the iteration on an error doesn't lose docs.
+        :param string consumer_id: Read files claimed with claim_todo_items instead of locking the queue. The lease is renewed with every batch,
+            and files that aren't completed are released back to todo if the iterator is closed early. Without it the queue is locked
+            while iterating, and unlocked again when the iterator is closed or finished.
+        :param int lease: Lease for claim_todo_items.
+        '''
+        if consumer_id:
+            files = self.claim_todo_items(consumer_id, lease=lease)
+        else:
+            files = self.get_todo_items()
+        batch = []
+        consumed = []
+        try:
+            for efile in files:
+                for doc in self._iter_file(efile):
+                    batch.append(doc)
+                    if len(batch) >= batch_size:
+                        if consumer_id:
+                            self.heartbeat(consumer_id)
+                        yield batch
+                        batch = []
+                        #All docs of these files were in batches that have been processed now
+                        if complete:
+                            [self.complete(x) for x in consumed]
+                        consumed = []
+                consumed.append(efile)
+            if batch:
+                if consumer_id:
+                    self.heartbeat(consumer_id)
+                yield batch
+        except GeneratorExit:
+            if consumer_id:
+                self._release_all(os.path.join(self._inprogress_dir, consumer_id))
+            raise
+        finally:
+            #The lock is only released by get_todo_items when it is read to the end
+            if not consumer_id:
+                self._unlock()
+        if complete:
+            [self.complete(x) for x in consumed]
+
+
+    def _iter_file(self, efile):
+        if efile.endswith('.gz'):
+            f = gzip.open(efile, 'rt', encoding='utf-8')
+        else:
+            f = open(efile, encoding='utf-8')
+        with f:
+            for item in _iter_json(f):
+                if type(item) is list:
+                    yield from item
+                else:
+                    yield item
+
     def _open_file(self, efile):
         if efile.endswith('.gz'):
             f = gzip.open(efile, 'rt', encoding='utf-8')
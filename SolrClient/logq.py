@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_encode = json.JSONEncoder(sort_keys=True).encode
+
+
+class LogQ():
+    '''
+    Append only alternative to IndexQ for queues with a lot of small writes. Instead of a file per flush, items are appended as
+    newline delimited JSON to segment files that are rotated once they reach `segment_size`. A small index file lists the segments,
+    so neither producers nor consumers need to scan directories, and each consumer keeps it's position (segment and byte offset)
+    in an offsets file that is fsynced and atomically replaced on every commit.
+
+    Each queue is set up with the following directory structure
+    queue_name/
+     - log/index
+     - log/0000000000.ndjson, log/0000000001.ndjson, ...
+     - offsets/<consumer>
+
+    Several producer processes can append to the same queue, appends are serialized with a lock on the index file (POSIX only).
+
+    :param string basepath: Path to the root of the queue. All other queues will get created underneath this.
+    :param string queue: Name of the queue.
+    :param int segment_size: Size in MB at which a new segment is started.
+    :param log: Logging instance that you want it to log to.
+
+    Example Usage::
+
+        >>> q = LogQ('/data/indexq', 'parsed_data', segment_size=64)
+        >>> q.add([{'id': 'doc1'}, {'id': 'doc2'}])
+        >>> q.index(solr, 'SolrClient_unittest', consumer='indexer')
+    '''
+    def __init__(self, basepath, queue, segment_size=64, log=None):
+        self.logger = log or logging.getLogger(__package__)
+        self._queue_name = queue
+        self._qpathdir = os.path.join(basepath, queue)
+        self._log_dir = os.path.join(self._qpathdir, 'log')
+        self._offsets_dir = os.path.join(self._qpathdir, 'offsets')
+        self._index_path = os.path.join(self._log_dir, 'index')
+        self._segment_bytes = segment_size * 1000000
+        for dir in [self._qpathdir, self._log_dir, self._offsets_dir]:
+            if not os.path.isdir(dir):
+                os.makedirs(dir)
+        # Opened in append mode, this file is also what producers lock on
+        self._index_fh = open(self._index_path, 'a+')
+        self._index_size = None
+        self._segments = []
+        self._fd = None
+        self._fd_seq = None
+        if fcntl is None:
+            self.logger.warning("fcntl isn't available, only use a single producer for queue {}".format(queue))
+
+    def _segment_path(self, seq):
+        return os.path.join(self._log_dir, '{:010d}.ndjson'.format(seq))
+
+    def _read_index(self):
+        '''
+        Returns the list of segment numbers, re-reading the index only if it changed.
+        '''
+        size = os.path.getsize(self._index_path)
+        if size != self._index_size:
+            with open(self._index_path) as f:
+                self._segments = [int(line) for line in f if line.strip()]
+            self._index_size = size
+        return self._segments
+
+    def _lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._index_fh.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._index_fh.fileno(), fcntl.LOCK_UN)
+
+    def _new_segment(self, seq):
+        self._index_fh.write('{}\n'.format(seq))
+        self._index_fh.flush()
+        os.fsync(self._index_fh.fileno())
+        self.logger.info("Starting segment {} in {}".format(seq, self._queue_name))
+
+    def _open_segment(self, seq):
+        if self._fd_seq != seq:
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self._segment_path(seq), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            self._fd_seq = seq
+
+    def _repair_tail(self, seq):
+        '''
+        Truncates a partial last line, left by a producer that died while writing, so the next items don't get appended to it.
+        Readers never read past a partial line, so nothing that was read is removed.
+        '''
+        size = os.fstat(self._fd).st_size
+        if not size or os.pread(self._fd, 1, size - 1) == b'\n':
+            return
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            nl = os.pread(self._fd, end - start, start).rfind(b'\n')
+            if nl != -1:
+                end = start + nl + 1
+                break
+            end = start
+        self.logger.warning("Removing {} bytes of a partial item at the end of segment {} in {}".format(
+            size - end, seq, self._queue_name))
+        os.ftruncate(self._fd, end)
+
+    def add(self, item):
+        '''
+        :param <dict,list> item: Dict or list of dicts to append to the queue.
+
+        Appends the items to the active segment with a single write. Returns the (segment, byte offset) after the items.
+        '''
+        if type(item) is dict:
+            item = [item]
+        elif type(item) is not list or any(type(x) is not dict for x in item):
+            raise ValueError("Not the right data submitted. Make sure you are sending a dict or list of dicts")
+        data = ''.join([_encode(x) + '\n' for x in item]).encode('utf-8')
+        self._lock()
+        try:
+            segments = self._read_index()
+            if not segments:
+                self._new_segment(0)
+                segments = self._read_index()
+            seq = segments[-1]
+            self._open_segment(seq)
+            self._repair_tail(seq)
+            if os.fstat(self._fd).st_size >= self._segment_bytes:
+                seq += 1
+                self._new_segment(seq)
+                self._open_segment(seq)
+            os.write(self._fd, data)
+            return seq, os.fstat(self._fd).st_size
+        finally:
+            self._unlock()
+
+    def get_offset(self, consumer):
+        '''
+        Returns the committed (segment, byte offset) of the consumer, or the start of the queue if it hasn't committed yet.
+        '''
+        path = os.path.join(self._offsets_dir, consumer)
+        if os.path.isfile(path):
+            with open(path) as f:
+                seq, pos = f.read().split()
+            return int(seq), int(pos)
+        segments = self._read_index()
+        return (segments[0] if segments else 0), 0
+
+    def commit(self, consumer, offset):
+        '''
+        Durably stores the offset of the consumer: written to a temp file, fsynced and renamed over the previous one.
+        '''
+        path = os.path.join(self._offsets_dir, consumer)
+        with open(path + '.tmp', 'w') as f:
+            f.write('{} {}\n'.format(*offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def read_batches(self, consumer, batch_size=1000):
+        '''
+        :param string consumer: Name of the consumer, each consumer reads the queue independently.
+        :param int batch_size: Maximum number of items in a batch.
+
+        Yields (items, offset) tuples starting at the consumer's committed offset, until it is caught up with the producers.
+        Pass the offset to commit once the items are processed. ::
+
+            >>> for docs, offset in q.read_batches('indexer'):
+                    solr.index_json('SolrClient_unittest', json.dumps(docs))
+                    q.commit('indexer', offset)
+        '''
+        seq, pos = self.get_offset(consumer)
+        batch = []
+        rescanned = False
+        while True:
+            segments = self._read_index()
+            path = self._segment_path(seq)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    f.seek(pos)
+                    for line in f:
+                        # A producer could be in the middle of writing the last line
+                        if not line.endswith(b'\n'):
+                            break
+                        pos += len(line)
+                        batch.append(json.loads(line.decode('utf-8')))
+                        if len(batch) >= batch_size:
+                            yield batch, (seq, pos)
+                            batch = []
+            later = [s for s in segments if s > seq]
+            if not later:
+                break
+            # Producers don't write to a segment after rotating, so once a newer segment exists this one is done.
+            # Read it once more in case the last line was completed after the read above, anything left is a torn write.
+            if os.path.isfile(path) and pos < os.path.getsize(path):
+                if not rescanned:
+                    rescanned = True
+                    continue
+                self.logger.warning("Skipping {} bytes of a partial item at the end of segment {} in {}".format(
+                    os.path.getsize(path) - pos, seq, self._queue_name))
+            seq, pos = later[0], 0
+            rescanned = False
+        if batch:
+            yield batch, (seq, pos)
+
+    def index(self, solr, collection, consumer='indexer', batch_size=1000, **kwargs):
+        '''
+        Indexes everything the consumer hasn't indexed yet into the collection, committing the offset after each batch.
+        Returns the number of items indexed.
+        '''
+        count = 0
+        for docs, offset in self.read_batches(consumer, batch_size=batch_size):
+            solr.index_json(collection, json.dumps(docs), **kwargs)
+            self.commit(consumer, offset)
+            count += len(docs)
+        return count
+
+    def cleanup(self):
+        '''
+        Removes segments that every consumer has read past. The index isn't rewritten, readers skip segments that are gone.
+        '''
+        consumers = [name for name in os.listdir(self._offsets_dir) if not name.endswith('.tmp')]
+        if not consumers:
+            return []
+        oldest = min(self.get_offset(name)[0] for name in consumers)
+        removed = []
+        # The last segment could still be written to
+        for seq in self._read_index()[:-1]:
+            if seq < oldest and os.path.isfile(self._segment_path(seq)):
+                os.remove(self._segment_path(seq))
+                removed.append(seq)
+        return removed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._fd_seq = None
+        self._index_fh.close()
@@ -20,13 +20,33 @@ class Schema():
 
         self.schema_endpoint = 'schema/'
 
-    def get_schema_fields(self, collection):
+    def get_schema_fields(self, collection, show_defaults=False):
         '''
         Returns Schema Fields from a Solr Collection
+
+        :param bool show_defaults: Include properties inherited from the field type, like stored and docValues.
         '''
-        res, con_info = self.solr.transport.send_request(endpoint='schema/fields',collection=collection)
+        params = {'showDefaults': 'true'} if show_defaults else None
+        res, con_info = self.solr.transport.send_request(endpoint='schema/fields',collection=collection, params=params)
         return res
 
+    def get_schema_dynamic_fields(self, collection, show_defaults=False):
+        '''
+        Returns Dynamic Fields from a Solr Collection
+
+        :param bool show_defaults: Include properties inherited from the field type, like stored and docValues.
+        '''
+        params = {'showDefaults': 'true'} if show_defaults else None
+        res, con_info = self.solr.transport.send_request(endpoint='schema/dynamicfields', collection=collection, params=params)
+        return res['dynamicFields']
+
+    def get_unique_key(self, collection):
+        '''
+        Returns the name of the uniqueKey field of a Solr Collection
+        '''
+        res, con_info = self.solr.transport.send_request(endpoint='schema/uniquekey', collection=collection)
+        return res['uniqueKey']
+
     def get_schema_copyfields(self, collection):
         res, con_info = self.solr.transport.send_request(endpoint='schema/copyfields', collection=collection)
         return res['copyFields']
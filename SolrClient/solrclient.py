@@ -1,14 +1,115 @@
+import datetime
 import gzip
 import os
 import json
 import logging
+import queue
+import threading
+from multiprocessing.pool import ThreadPool
 from .transport import TransportRequests
-from .exceptions import NotFoundError, MinRfError
+from .exceptions import SolrError, ConnectionError, NotFoundError, MinRfError
 from .schema import Schema
 from .solrresp import SolrResponse
+from .columnar import ColumnarResponse
 from .collections import Collections
 from .zk import ZK
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _date_to_ms(date):
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ'):
+        try:
+            dt = datetime.datetime.strptime(date, fmt)
+        except ValueError:
+            continue
+        return int(round((dt - _EPOCH).total_seconds() * 1000))
+    raise ValueError("Couldn't parse date {}".format(date))
+
+
+def _ms_to_date(ms):
+    dt = _EPOCH + datetime.timedelta(milliseconds=ms)
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(ms % 1000)
+
+
+def prefetch_iter(iterator, depth):
+    """
+    Consumes `iterator` in a background thread, keeping up to `depth` items ready ahead of the caller.
+    Exceptions raised by the iterator are re-raised to the caller. If the caller stops iterating early, the thread stops as well.
+    """
+    return parallel_iter([iterator], depth)
+
+
+def parallel_iter(iterators, depth):
+    """
+    Consumes each of `iterators` in it's own background thread and yields items from all of them as they become available,
+    keeping up to `depth` items ready ahead of the caller. Exceptions are re-raised to the caller and all threads stop when
+    the caller stops iterating.
+    """
+    buf = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(iterator):
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((None, e))
+
+    for iterator in iterators:
+        threading.Thread(target=worker, args=(iterator,), daemon=True).start()
+    running = len(iterators)
+    try:
+        while running:
+            item, error = buf.get()
+            if error is not None:
+                raise error
+            if item is done:
+                running -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+
+
+class FileStream(object):
+    """
+    Iterable request body that reads a file in chunks. Each iteration re-opens the file, so the same body can be sent again
+    if the request is failed over to another host.
+
+    :param str filename: Path of the file to send.
+    :param opener: Function used to open the file in binary mode, pass gzip.open to decompress it on the fly.
+    :param int chunk_size: Number of bytes to read at a time.
+    """
+
+    def __init__(self, filename, opener=open, chunk_size=1048576):
+        self.filename = filename
+        self.opener = opener
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        with self.opener(self.filename, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def __repr__(self):
+        return "FileStream({})".format(self.filename)
+
 
 class SolrClient(object):
     """
@@ -17,6 +118,9 @@ class SolrClient(object):
     :param host: Specifies the location of Solr Server. ex 'http://localhost:8983/solr'. Can also take a list of host values in which case it will use the first server specified, but will switch over to the second one if the first one is not available.
     :param transport: Transport class to use. So far only requests is supported.
     :param bool devel: Can be turned on during development or debugging for a much greater logging. Requires logging to be configured with DEBUG level.
+    :param retry_policy: A transport.RetryPolicy instance describing how transient errors are retried. By default each host is tried once and nothing is retried.
+    :param compression: A transport.CompressionPolicy instance to compress update requests. Disabled by default.
+    :param str wt: Response format to request from Solr, either 'json' (default) or 'javabin'. Can also be passed to each query.
     """
 
     def __init__(self,
@@ -32,6 +136,10 @@ class SolrClient(object):
         self.logger = log if log else logging.getLogger(__package__)
         self.schema = Schema(self)
         self.collections = Collections(self, self.logger)
+        #Number of paging_query calls that paged deeper than deep_paging_threshold with start/rows
+        self.deep_paging_count = 0
+        #uniqueKey field of each collection, looked up for cursorMark paging
+        self._unique_keys = {}
 
     def get_zk(self):
         return ZK(self, self.logger)
@@ -89,13 +197,17 @@ class SolrClient(object):
                                                     **kwargs)
         return resp
 
-    def query(self, collection, query, request_handler='select', **kwargs):
+    def query(self, collection, query, request_handler='select', compact_docs=False, **kwargs):
         """
         :param str collection: The name of the collection for the request
         :param str request_handler: Request handler, default is 'select'
         :param dict query: Python dictonary of Solr query parameters.
+        :param bool compact_docs: Store returned documents in a memory efficient CompactDocs container instead of a list of dicts. \
+        With wt='javabin' the container is filled while the response is decoded. With wt='json' the page is decoded into dicts first, \
+        so this only reduces the memory held after the request, not the peak memory use during it.
 
         Sends a query to Solr, returns a SolrResults Object. `query` should be a dictionary of solr request handler arguments.
+        Pass wt='javabin' to decode the response from Solr's binary format instead of JSON, this is faster for large pages.
         Example::
 
             res = solr.query('SolrClient_unittest',{
@@ -122,12 +234,33 @@ class SolrClient(object):
                                                     params=params,
                                                     data=data,
                                                     headers=headers,
+                                                    compact_docs=compact_docs and not self._is_grouped(query),
                                                     **kwargs)
         if resp:
-            resp = SolrResponse(resp)
+            resp = SolrResponse(resp, compact_docs=compact_docs)
             resp.url = con_inf['url']
             return resp
 
+    def query_many(self, collections, query, threads=None, **kwargs):
+        """
+        :param list collections: Names of the collections to query.
+        :param dict query: Python dictonary of Solr query parameters, sent to each collection.
+        :param int threads: Number of queries to run at the same time, by default one per collection.
+
+        Sends the same query to several collections in parallel and returns a list of SolrResponse objects in the same order.
+        Combine it with the merge functions in SolrClient.facets to facet across collections without an alias. ::
+
+            >>> from SolrClient.facets import merge_facets, merge_num_found
+            >>> responses = solr.query_many(['logs_us', 'logs_eu'], {'q': '*:*', 'rows': 0, 'facet': True, 'facet.field': 'facet_test'})
+            >>> merge_num_found(responses)
+            100
+            >>> merge_facets(responses, k=3)
+            {'facet_test': OrderedDict([('amet,', 28), ('sit', 22), ('dolor', 20)])}
+
+        """
+        with ThreadPool(threads or len(collections)) as p:
+            return p.map(lambda coll: self.query(coll, dict(query), **kwargs), collections)
+
     def index(self, collection, docs, params=None, min_rf=None, **kwargs):
         """
         :param str collection: The name of the collection for the request.
@@ -257,6 +390,8 @@ class SolrClient(object):
         :param str filename: Filename of json file to index.
 
         Will open the json file, uncompressing it if necessary, and submit it to specified solr collection for indexing.
+        The file is streamed to Solr in chunks, so memory use doesn't depend on the size of the file.
+        If the client was created with a `compression` policy, gzipped files are sent to Solr as they are, without decompressing them.
         ::
 
             >>> solr.local_index('SolrClient_unittest',
@@ -265,13 +400,15 @@ class SolrClient(object):
         if not os.path.isfile(filename):
             raise IOError("{} File Not Found".format(filename))
         self.logger.info("Indexing {} into Solr Collection {}".format(filename, collection))
-        if filename.endswith('gz'):
-            open_function = gzip.open
+        headers = {'content-type': 'application/json'}
+        if filename.endswith('gz') and self.transport.compression is not None:
+            headers['content-encoding'] = 'gzip'
+            body = FileStream(filename)
+        elif filename.endswith('gz'):
+            body = FileStream(filename, opener=gzip.open)
         else:
-            open_function = open
-        with open_function(filename, 'r') as file:
-            js_data = file.read()
-        return self.index_json(collection, js_data)
+            body = FileStream(filename)
+        return self.index_json(collection, body, headers=headers)
 
     def local_index(self, collection, filename, **kwargs):
         """
@@ -298,17 +435,25 @@ class SolrClient(object):
             return False
 
     # Version 0.0.7
-    def paging_query(self, collection, query, rows=1000, start=0, max_start=200000):
+    def paging_query(self, collection, query, rows=1000, start=0, max_start=200000, use_cursor=False, unique_key=None,
+                     deep_paging_threshold=10000):
         """
         :param str collection: The name of the collection for the request.
         :param dict query: Dictionary of solr args.
         :param int rows: Number of rows to return in each batch. Default is 1000.
         :param int start: What position to start with. Default is 0.
         :param int max_start: Once the start will reach this number, the function will stop. Default is 200000.
+        :param bool use_cursor: Page with cursorMark when the query allows it. Default is False.
+        :param str unique_key: Name of the uniqueKey field, added to the sort as a tie breaker for cursorMark. Looked up from the schema if not passed.
+        :param int deep_paging_threshold: If paging with start goes past this position, a warning is logged and deep_paging_count is incremented.
 
-        Will page through the result set in increments of `row` WITHOUT using cursorMark until it has all items \
-        or until `max_start` is reached. Use max_start to protect your Solr instance if you are not sure how many items you \
-        will be getting. The default is 200,000, which is still a bit high.
+        Will page through the result set in increments of `row` until it has all items or until `max_start` is reached. \
+        Use max_start to protect your Solr instance if you are not sure how many items you will be getting. The default is 200,000, \
+        which is still a bit high.
+
+        Solr's cost of a start/rows page grows with `start`. With `use_cursor`, if `start` is 0 and the query isn't grouped, this pages with \
+        cursorMark instead, adding `unique_key` to the sort if it isn't there already. Otherwise, or if the uniqueKey can't be looked up, it \
+        falls back to start/rows paging.
 
         Returns an iterator of SolrResponse objects. For Example::
 
@@ -317,8 +462,21 @@ class SolrClient(object):
 
         """
         query = dict(query)
+        cursor = None
+        if use_cursor and start == 0 and not self._is_grouped(query):
+            unique_key = unique_key or self._get_unique_key(collection)
+        else:
+            unique_key = None
+        if unique_key:
+            query['sort'] = self._get_cursor_sort(query.get('sort'), unique_key)
+            query.pop('start', None)
+            cursor = '*'
+        deep_paging = False
         while True:
-            query['start'] = start
+            if cursor is not None:
+                query['cursorMark'] = cursor
+            else:
+                query['start'] = start
             query['rows'] = rows
             res = self.query(collection, query)
             if res.get_results_count():
@@ -326,30 +484,225 @@ class SolrClient(object):
                 start += rows
             if res.get_results_count() < rows or start > max_start:
                 break
-
-    def cursor_query(self, collection, query):
+            if cursor is not None:
+                next_cursor = res.get_cursor()
+                if next_cursor == cursor:
+                    break
+                cursor = next_cursor
+            elif start >= deep_paging_threshold and not deep_paging:
+                deep_paging = True
+                self.deep_paging_count += 1
+                self.logger.warning("Deep paging detected on {}, start is {}. Consider use_cursor or cursor_query instead.".format(
+                    collection, start))
+
+    def _is_grouped(self, query):
+        return str(query.get('group', 'false')).lower() == 'true'
+
+    def _get_unique_key(self, collection):
+        '''
+        Returns the uniqueKey field of the collection, or None if it can't be looked up.
+        '''
+        if collection not in self._unique_keys:
+            try:
+                self._unique_keys[collection] = self.schema.get_unique_key(collection)
+            except (SolrError, ConnectionError) as e:
+                self.logger.warning("Couldn't get the uniqueKey of {}, paging with start/rows: {}".format(collection, e))
+                return None
+        return self._unique_keys[collection]
+
+    def _get_cursor_sort(self, sort, unique_key='id'):
+        '''
+        Returns the sort with the unique key appended as a tie breaker, as required for cursorMark.
+        '''
+        if not sort:
+            sort = 'score desc'
+        if unique_key not in [clause.rsplit(None, 1)[0] for clause in self._split_sort(sort)]:
+            sort = '{}, {} asc'.format(sort, unique_key)
+        return sort
+
+    def _split_sort(self, sort):
+        '''
+        Splits a sort into it's clauses, commas inside function sorts like sum(a,b) don't split.
+        '''
+        clauses = []
+        depth = 0
+        clause = ''
+        for c in sort:
+            if c == ',' and depth == 0:
+                clauses.append(clause)
+                clause = ''
+                continue
+            if c == '(':
+                depth += 1
+            elif c == ')':
+                depth -= 1
+            clause += c
+        clauses.append(clause)
+        return [clause.strip() for clause in clauses if clause.strip()]
+
+    def cursor_query(self, collection, query, prefetch=0, **kwargs):
         """
         :param str collection: The name of the collection for the request.
         :param dict query: Dictionary of solr args.
+        :param int prefetch: Number of pages to fetch ahead in a background thread while the current page is being processed. Default is 0, no prefetching.
+
+        Other keyword arguments, like wt, are passed on to query for each page.
 
         Will page through the result set in increments using cursorMark until it has all items. Sort is required for cursorMark \
-        queries, if you don't specify it, the default is 'id desc'.
+        queries, if you don't specify it, the default is 'id desc'. Iteration stops on a page shorter than `rows`, if it is set in the query, or when the cursor \
+        stops changing, so no extra empty request is sent at the end. The query dictionary passed in is not modified.
 
         Returns an iterator of SolrResponse objects. For Example::
 
-            >>> for res in solr.cursor_query('SolrClient_unittest',{'q':'*:*'}):
+            >>> for res in solr.cursor_query('SolrClient_unittest',{'q':'*:*'}, prefetch=2):
                     print(res)
         """
-        cursor = '*'
+        query = dict(query)
         if 'sort' not in query:
             query['sort'] = 'id desc'
+        pages = self._cursor_pages(collection, query, **kwargs)
+        if prefetch:
+            return prefetch_iter(pages, prefetch)
+        return pages
+
+    def _cursor_pages(self, collection, query, **kwargs):
+        #Without rows the handler's default is used, which isn't known here, so only a cursor that doesn't change ends the scan
+        rows = int(query['rows']) if 'rows' in query else None
+        cursor = '*'
         while True:
             query['cursorMark'] = cursor
             # Get data with starting cursorMark
-            results = self.query(collection, query)
-            if results.get_results_count():
-                cursor = results.get_cursor()
-                yield results
-            else:
+            results = self.query(collection, query, **kwargs)
+            if not results.get_results_count():
                 self.logger.debug("Got zero Results with cursor: {}".format(cursor))
                 break
+            yield results
+            next_cursor = results.get_cursor()
+            if next_cursor == cursor or (rows is not None and results.get_results_count() < rows):
+                break
+            cursor = next_cursor
+
+    def sliced_cursor_query(self, collection, query, field, slices=4, buckets_per_slice=10, prefetch=None):
+        """
+        :param str collection: The name of the collection for the request.
+        :param dict query: Dictionary of solr args.
+        :param str field: Numeric or date field used to split the result set, e.g. a date field or a precomputed hash field.
+        :param int slices: Number of slices to scan concurrently.
+        :param int buckets_per_slice: Resolution of the range facet used to find slice boundaries.
+        :param int prefetch: Number of pages to keep ready ahead of the caller, default is one per slice.
+
+        Splits the result set into `slices` disjoint fq ranges on `field` with roughly the same number of documents in each and scans \
+        all of them concurrently with cursorMark. This works on standalone cores as well, no SolrCloud shard info is needed. \
+        Slice boundaries are found with a stats query for the min and max values and a range facet between them. \
+        Documents without a value in `field` are scanned as an extra slice.
+
+        Returns an iterator of SolrResponse objects, in the order they arrive from the slices. For Example::
+
+            >>> for res in solr.sliced_cursor_query('SolrClient_unittest', {'q': '*:*', 'rows': 1000}, 'date', slices=8):
+                    print(res)
+        """
+        query = dict(query)
+        fq = query.get('fq', [])
+        fq = [fq] if type(fq) is str else list(fq)
+        iterators = []
+        for slice_fq in self.get_slice_fqs(collection, query, field, slices, buckets_per_slice):
+            slice_query = dict(query)
+            slice_query['fq'] = fq + [slice_fq]
+            iterators.append(self.cursor_query(collection, slice_query))
+        self.logger.info("Scanning {} in {} slices on {}".format(collection, len(iterators), field))
+        return parallel_iter(iterators, prefetch or len(iterators))
+
+    def get_slice_fqs(self, collection, query, field, slices, buckets_per_slice=10):
+        '''
+        :param str collection: The name of the collection for the request.
+        :param dict query: Dictionary of solr args, only `q` and `fq` are used.
+        :param str field: Numeric or date field to split the result set on.
+        :param int slices: Number of slices to split the result set into.
+        :param int buckets_per_slice: Resolution of the range facet used to find slice boundaries.
+
+        Returns filter queries that split the result set of the query into disjoint slices on `field` with roughly the same \
+        number of documents in each, plus one for documents without a value in `field`. Used by sliced_cursor_query, \
+        the Reindexer and the Verifier. ::
+
+            >>> solr.get_slice_fqs('SolrClient_unittest', {'q': '*:*'}, 'price', 2)
+            ['price:[* TO 500}', 'price:[500 TO *]', '-price:[* TO *]']
+        '''
+        base = {'q': query.get('q', '*:*'), 'rows': 0}
+        if 'fq' in query:
+            base['fq'] = query['fq']
+        stats = dict(base)
+        stats.update({'stats': 'true', 'stats.field': field})
+        stats = self.query(collection, stats).data['stats']['stats_fields'][field]
+        missing = '-{}:[* TO *]'.format(field)
+        if not stats or not stats.get('count'):
+            return ['{}:[* TO *]'.format(field), missing]
+        low, high = stats['min'], stats['max']
+        is_date = type(low) is str
+        if is_date:
+            low, high = _date_to_ms(low), _date_to_ms(high)
+        buckets = slices * buckets_per_slice
+        if is_date or (float(low).is_integer() and float(high).is_integer()):
+            low, high = int(low), int(high)
+            gap = max(1, -(-(high - low + 1) // buckets))
+        else:
+            gap = (high - low) / buckets or 1
+        facet = dict(base)
+        facet.update({
+            'facet': 'true',
+            'facet.range': field,
+            'facet.range.start': _ms_to_date(low) if is_date else low,
+            'facet.range.end': _ms_to_date(high) if is_date else high,
+            'facet.range.gap': '+{}MILLISECONDS'.format(gap) if is_date else gap,
+            'facet.range.include': 'lower',
+        })
+        keys, counts = self.query(collection, facet).get_facet_range_arrays(field)
+        edges = ['*'] + self._get_slice_boundaries(keys, counts, slices) + ['*']
+        fqs = []
+        for i in range(len(edges) - 1):
+            closing = ']' if i == len(edges) - 2 else '}'
+            fqs.append('{}:[{} TO {}{}'.format(field, edges[i], edges[i + 1], closing))
+        return fqs + [missing]
+
+    @staticmethod
+    def _get_slice_boundaries(keys, counts, slices):
+        '''
+        Picks up to slices - 1 bucket keys that split the facet counts into slices with about the same number of documents.
+        '''
+        total = sum(counts)
+        bounds = []
+        cumulative = 0
+        i = 1
+        for idx, count in enumerate(counts):
+            cumulative += count
+            while i < slices and cumulative >= total * i / slices:
+                if idx + 1 < len(keys) and (not bounds or bounds[-1] != keys[idx + 1]):
+                    bounds.append(keys[idx + 1])
+                i += 1
+        return bounds
+
+    def query_columns(self, collection, query, fields=None, cursor=False, **kwargs):
+        """
+        :param str collection: The name of the collection for the request.
+        :param dict query: Dictionary of solr args.
+        :param list fields: Fields to return, if not specified they are taken from the `fl` parameter of the query.
+        :param bool cursor: Page through the whole result set with cursorMark, like cursor_query does.
+
+        Runs the query and returns a ColumnarResponse that holds the values of each field as a column instead of a dict per document.
+        Numeric fields are stored in compact arrays, so this is well suited for exporting a few fields out of a large result set. ::
+
+            >>> res = solr.query_columns('SolrClient_unittest', {'q': '*:*', 'rows': 1000}, fields=['id', 'price'], cursor=True)
+            >>> sum(res['price'])
+            24513
+        """
+        query = dict(query)
+        if fields is None:
+            if 'fl' not in query:
+                raise ValueError("Specify fields to return, either through `fields` or the fl parameter.")
+            fields = [f.strip() for f in query['fl'].split(',') if f.strip()]
+        query['fl'] = ','.join(fields)
+        out = ColumnarResponse(fields)
+        pages = self.cursor_query(collection, query, **kwargs) if cursor else [self.query(collection, query, **kwargs)]
+        for res in pages:
+            out.add_response(res)
+        return out
+
@@ -2,30 +2,81 @@ from collections import OrderedDict
 
 import json
 from .exceptions import *
+from .compactdocs import CompactDocs, CompactDoc
+from . import facets as facetutils
+
+
+def _to_json(obj):
+    if type(obj) is CompactDocs:
+        return [dict(doc) for doc in obj]
+    if type(obj) is CompactDoc:
+        return dict(obj)
+    raise TypeError("{} is not JSON serializable".format(type(obj)))
+
 
 class SolrResponse:
-    def __init__(self, data):
+    '''
+    Wraps the decoded response from Solr. Documents, groups and the header are pulled out of the response the first
+    time they are accessed and facets are only parsed when one of the facet methods is called, so a rows=0 count query
+    doesn't pay for anything it doesn't use.
+
+    :param dict data: Decoded response from Solr.
+    :param bool compact_docs: Store the documents in a CompactDocs container instead of a list of dicts, see CompactDocs.
+    '''
+    __slots__ = ('data', 'url', 'facets', 'facet_ranges', 'facet_pivot', '_docs', '_compact_docs')
+
+    def __init__(self, data, compact_docs=False):
         self.data = data
-        self.query_time = data['responseHeader']['QTime']
-        self.header = data['responseHeader']
-
-        if 'response' in data:
-            self.grouped = False
-            self.docs = data['response']['docs']
-            if 'numFound' in data['response']:
-                self.num_found = data['response']['numFound']
-
-        elif 'grouped' in data:
-            self.groups = {}
-            self.grouped = True
-            for field in data['grouped']:
-                #For backwards compatability
-                self.groups = data['grouped'][field]['groups']
-                self.docs = data['grouped'][field]['groups']
+        self._compact_docs = compact_docs
+
+    @property
+    def header(self):
+        return self.data['responseHeader']
+
+    @property
+    def query_time(self):
+        return self.data['responseHeader']['QTime']
+
+    @property
+    def grouped(self):
+        return 'response' not in self.data and 'grouped' in self.data
+
+    @property
+    def num_found(self):
+        if 'response' in self.data and 'numFound' in self.data['response']:
+            return self.data['response']['numFound']
+        raise AttributeError("num_found")
+
+    @property
+    def groups(self):
+        if not self.grouped:
+            raise AttributeError("groups")
+        groups = {}
+        for field in self.data['grouped']:
+            #For backwards compatability
+            groups = self.data['grouped'][field]['groups']
+        return groups
+
+    @property
+    def docs(self):
+        try:
+            return self._docs
+        except AttributeError:
+            pass
+        if 'response' in self.data:
+            if self._compact_docs and type(self.data['response']['docs']) is not CompactDocs:
+                #Replace the list so the dicts can be garbage collected
+                self.data['response']['docs'] = CompactDocs(self.data['response']['docs'])
+            self._docs = self.data['response']['docs']
+        elif 'grouped' in self.data:
+            self._docs = self.groups
         else:
-            self.grouped = False
-            self.docs = {}
+            self._docs = {}
+        return self._docs
 
+    @docs.setter
+    def docs(self, docs):
+        self._docs = docs
 
     def get_num_found(self):
         '''
@@ -206,6 +257,58 @@ class SolrResponse:
         else:
             return self.facet_pivot
 
+    def _get_pivot_fieldset(self, fieldset=None):
+        if 'facet_counts' not in self.data or 'facet_pivot' not in self.data['facet_counts']:
+            raise SolrResponseError("No Facet Pivot in the Response")
+        pivots = self.data['facet_counts']['facet_pivot']
+        if fieldset is None:
+            if len(pivots) != 1:
+                raise ValueError("More than one pivot in the response, specify the fieldset. Available: {}".format(list(pivots)))
+            fieldset = list(pivots)[0]
+        return pivots[fieldset]
+
+    def iter_facet_pivot(self, fieldset=None):
+        '''
+        :param str fieldset: Pivot field set, like 'facet_test,price'. Only needed if there is more than one pivot in the response.
+
+        Iterates over the pivot tree without building nested dictionaries, yielding a (path, count, metrics) row for each node.
+        It doesn't recurse, so it works for pivots of any depth. Example::
+
+            >>> for path, count, metrics in res.iter_facet_pivot('facet_test,price'):
+                    print(path, count)
+            ('Lorem',) 9
+            ('Lorem', 89) 1
+            ('Lorem', 75) 1
+            ...
+        '''
+        return facetutils.iter_pivot_rows(self._get_pivot_fieldset(fieldset))
+
+    def get_facet_pivot_columns(self, fieldset=None, metrics=()):
+        '''
+        :param str fieldset: Pivot field set. Only needed if there is more than one pivot in the response.
+        :param list metrics: Names of additional per node values (like stats) to keep.
+
+        Returns the flattened pivot as a ColumnarResponse with path, depth and count columns.
+        '''
+        return facetutils.rows_to_columns(self.iter_facet_pivot(fieldset), metrics=metrics)
+
+    def iter_json_facet(self, field=None):
+        '''
+        :param str field: Name of the json.facet field, only needed if there is more than one.
+
+        Iterates over json.facet buckets and sub facet buckets without recursion, yielding a (path, count, metrics) row for each bucket.
+        '''
+        return facetutils.iter_json_facet_rows(self.json_facet(field)['buckets'])
+
+    def get_json_facet_columns(self, field=None, metrics=()):
+        '''
+        :param str field: Name of the json.facet field, only needed if there is more than one.
+        :param list metrics: Names of aggregations to keep, like ['pr_sum'].
+
+        Returns the flattened json.facet buckets as a ColumnarResponse with path, depth, count and metric columns.
+        '''
+        return facetutils.rows_to_columns(self.iter_json_facet(field), metrics=metrics)
+
     def _rec_subfield(self,sub_field_set):
         out = {}
         if type(sub_field_set) is list:
@@ -228,6 +331,8 @@ class SolrResponse:
             ['Mauris risus risus lacus. sit', 'dolor auctor Vivamus fringilla. vulputate', 'semper nisi lacus nulla sed', 'vel amet diam sed posuere', 'vitae neque ultricies, Phasellus ac', 'consectetur nisi orci, eu diam', 'sapien, nisi accumsan accumsan In', 'ligula. odio ipsum sit vel', 'tempus orci. elit, Ut nisl.', 'neque nisi Integer nisi Lorem']
 
         '''
+        if type(self.docs) is CompactDocs:
+            return self.docs.get_field_values(field)
         return [doc[field] for doc in self.docs if field in doc]
 
     #Not Sure what this one is doing or why I wrote it
@@ -273,6 +378,11 @@ class SolrResponse:
 
         Goes through all documents returned looking for specified field. At first encounter will return the field's value.
         '''
+        if type(self.docs) is CompactDocs:
+            try:
+                return self.docs.get_first_field_value(field)
+            except KeyError:
+                raise SolrResponseError("No field in result set")
         for doc in self.docs:
             if field in doc.keys():
                 return doc[field]
@@ -295,14 +405,7 @@ class SolrResponse:
             {'facet_test': {'Lorem': 9, 'ipsum': 6, 'amet,': 14, 'dolor': 10, 'sit': 11}}
 
         '''
-        facets = self.get_facets()
-        out = []
-        if field in facets.keys():
-            for facetfield in facets[field]:
-                out.append(facets[field][facetfield])
-            return out
-        else:
-            raise SolrResponseError("No field in facet output")
+        return self._get_flat_facet('facet_fields', field)[1::2]
 
     def get_facet_keys_as_list(self,field):
         '''
@@ -315,17 +418,77 @@ class SolrResponse:
             ['Lorem', 'ipsum', 'amet,', 'dolor', 'sit']
 
         '''
-        facets = self.get_facets()
-        if facets == -1:
-            return facets
-        if field in facets.keys():
-            return [x for x in facets[field]]
+        try:
+            return self._get_flat_facet('facet_fields', field)[::2]
+        except SolrResponseError:
+            if 'facet_counts' not in self.data:
+                raise
+            return None
+
+    def _get_flat_facet(self, section, field):
+        '''
+        Returns the flat [term, count, term, count] list Solr sent for the field.
+        '''
+        data = self.data
+        if 'facet_counts' not in data or type(data['facet_counts']) is not dict:
+            raise SolrResponseError("No Facet Information in the Response")
+        facets = data['facet_counts'].get(section) or {}
+        if field not in facets:
+            raise SolrResponseError("No field in facet output")
+        if section == 'facet_ranges':
+            return facets[field]['counts']
+        return facets[field]
+
+    def get_facet_arrays(self, field, as_numpy=False):
+        '''
+        :param str field: Name of facet field.
+        :param bool as_numpy: Return counts as a numpy array instead of array('q'). Requires numpy.
+
+        Returns facet keys as a list and counts as an array, without building any dictionaries. Use this instead of get_facets for
+        facets with a large number of buckets. Example::
+
+            >>> res.get_facet_arrays('facet_test')
+            (['Lorem', 'ipsum', 'amet,', 'dolor', 'sit'], array('q', [9, 6, 14, 10, 11]))
+
+        '''
+        return facetutils.flat_to_arrays(self._get_flat_facet('facet_fields', field), as_numpy=as_numpy)
+
+    def get_facet_range_arrays(self, field, as_numpy=False):
+        '''
+        :param str field: Name of range facet field.
+        :param bool as_numpy: Return counts as a numpy array instead of array('q'). Requires numpy.
+
+        Same as get_facet_arrays, but for range facets.
+        '''
+        return facetutils.flat_to_arrays(self._get_flat_facet('facet_ranges', field), as_numpy=as_numpy)
+
+    def get_facet_top(self, field, k=10):
+        '''
+        :param str field: Name of facet field.
+        :param int k: Number of buckets to return.
+
+        Returns a list of (key, count) tuples for the `k` largest buckets, useful when facet.sort=index was used. ::
+
+            >>> res.get_facet_top('facet_test', 2)
+            [('amet,', 14), ('sit', 11)]
+
+        '''
+        keys, counts = self.get_facet_arrays(field)
+        return facetutils.top_k(keys, counts, k)
+
+    def get_facet_sum(self, field):
+        '''
+        :param str field: Name of facet field.
+
+        Returns sum of all bucket counts for the field.
+        '''
+        return sum(self._get_flat_facet('facet_fields', field)[1::2])
 
     def get_json(self):
         '''
         Returns json from the original response.
         '''
-        return json.dumps(self.data)
+        return json.dumps(self.data, default=_to_json)
 
 
     def json_facet(self, field=None):
@@ -1,2 +1,4 @@
 from .transportbase import TransportBase
-from .transportrequests import TransportRequests
\ No newline at end of file
+from .transportrequests import TransportRequests
+from .retry import RetryPolicy, RetryBudget
+from .compression import CompressionPolicy
@@ -0,0 +1,54 @@
+import gzip
+import zlib
+
+
+class CompressionPolicy():
+    """
+    Describes how update request bodies get compressed before they are sent to Solr.
+
+    Solr only accepts compressed request bodies if Jetty's GzipHandler is set up to inflate them
+    (``inflateBufferSize`` in jetty-gzip.xml), so this is disabled unless a policy is passed to SolrClient.
+    Responses are always requested with ``Accept-Encoding`` and decompressed transparently.
+
+    :param str encoding: Either 'gzip' or 'deflate'.
+    :param int min_size: Payloads smaller than this (in bytes) are sent as is, compressing them isn't worth the CPU.
+    :param levels: List of (min_bytes, compression_level) tuples. The level of the largest matching size is used, so big payloads can use a cheaper level.
+
+    Example::
+
+        >>> from SolrClient.transport import CompressionPolicy
+        >>> solr = SolrClient('http://localhost:8983/solr', compression=CompressionPolicy())
+
+    """
+    encodings = ('gzip', 'deflate')
+    accept_encoding = 'gzip, deflate'
+
+    def __init__(self, encoding='gzip', min_size=1024, levels=((0, 6), (1000000, 3), (16000000, 1))):
+        if encoding not in self.encodings:
+            raise ValueError("Unsupported encoding {}, use one of {}".format(encoding, ", ".join(self.encodings)))
+        self.encoding = encoding
+        self.min_size = min_size
+        self.levels = sorted(levels)
+
+    def get_level(self, size):
+        '''
+        Returns compression level to use for a payload of `size` bytes.
+        '''
+        level = self.levels[0][1]
+        for min_bytes, lvl in self.levels:
+            if size >= min_bytes:
+                level = lvl
+        return level
+
+    def compress(self, data):
+        '''
+        Compresses str or bytes data. Returns a tuple of (data, encoding), encoding is None if data was left alone.
+        '''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if not isinstance(data, bytes) or len(data) < self.min_size:
+            return data, None
+        level = self.get_level(len(data))
+        if self.encoding == 'gzip':
+            return gzip.compress(data, compresslevel=level), 'gzip'
+        return zlib.compress(data, level), 'deflate'
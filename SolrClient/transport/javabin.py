@@ -0,0 +1,301 @@
+'''
+Decoder for Solr's binary javabin response format (wt=javabin).
+
+The output mirrors what Solr's JSON response writer produces with the default json.nl=flat, so SolrResponse works
+the same with either format:
+
+* SimpleOrderedMap and Map become dicts
+* NamedList becomes a flat [name, value, name, value] list
+* Document lists become {'numFound':..., 'start':..., 'docs': [...]}
+* Dates become ISO-8601 strings
+'''
+import datetime
+import struct
+import uuid
+from ..compactdocs import CompactDocs
+
+VERSION = 2
+
+# Tags that are stored in the lower 5 bits of the tag byte
+NULL = 0
+BOOL_TRUE = 1
+BOOL_FALSE = 2
+BYTE = 3
+SHORT = 4
+DOUBLE = 5
+INT = 6
+LONG = 7
+FLOAT = 8
+DATE = 9
+MAP = 10
+SOLRDOC = 11
+SOLRDOCLST = 12
+BYTEARR = 13
+ITERATOR = 14
+END = 15
+SOLRINPUTDOC = 16
+MAP_ENTRY_ITER = 17
+ENUM_FIELD_VALUE = 18
+MAP_ENTRY = 19
+UUID = 20
+
+# Tags that are stored in the upper 3 bits of the tag byte, the lower 5 bits hold a size or a small value
+STR = 1
+SINT = 2
+SLONG = 3
+ARR = 4
+ORDERED_MAP = 5
+NAMED_LST = 6
+EXTERN_STRING = 7
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_short = struct.Struct('>h')
+_int = struct.Struct('>i')
+_long = struct.Struct('>q')
+_float = struct.Struct('>f')
+_double = struct.Struct('>d')
+
+
+class _End(object):
+    pass
+
+_END = _End()
+
+
+class JavabinDecoder():
+    '''
+    Decodes a single javabin payload. Use :func:`loads` instead of using this directly.
+    '''
+
+    def __init__(self, data, compact_docs=False):
+        self.data = memoryview(data)
+        self.pos = 0
+        self.strings = []
+        self.compact_docs = compact_docs
+        self._small = {
+            STR: self._read_str,
+            SINT: self._read_small_int,
+            SLONG: self._read_small_int,
+            ARR: self._read_array,
+            ORDERED_MAP: self._read_ordered_map,
+            NAMED_LST: self._read_named_list,
+            EXTERN_STRING: self._read_extern_string,
+        }
+        self._plain = {
+            NULL: lambda tag: None,
+            BOOL_TRUE: lambda tag: True,
+            BOOL_FALSE: lambda tag: False,
+            BYTE: self._read_byte,
+            SHORT: lambda tag: self._unpack(_short),
+            DOUBLE: lambda tag: self._unpack(_double),
+            INT: lambda tag: self._unpack(_int),
+            LONG: lambda tag: self._unpack(_long),
+            FLOAT: self._read_float,
+            DATE: self._read_date,
+            MAP: self._read_map,
+            SOLRDOC: self._read_solr_doc,
+            SOLRDOCLST: self._read_solr_doc_list,
+            BYTEARR: self._read_byte_array,
+            ITERATOR: self._read_iterator,
+            END: lambda tag: _END,
+            SOLRINPUTDOC: self._read_solr_input_doc,
+            MAP_ENTRY_ITER: self._read_map_entry_iter,
+            ENUM_FIELD_VALUE: self._read_enum,
+            MAP_ENTRY: self._read_map_entry,
+            UUID: self._read_uuid,
+        }
+
+    def decode(self):
+        version = self.data[0]
+        if version != VERSION:
+            raise ValueError("Unsupported javabin version {}, expected {}".format(version, VERSION))
+        self.pos = 1
+        return self.read_val()
+
+    def read_val(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag >> 5:
+            return self._small[tag >> 5](tag)
+        try:
+            reader = self._plain[tag]
+        except KeyError:
+            raise ValueError("Unknown javabin tag {} at position {}".format(tag, self.pos - 1))
+        return reader(tag)
+
+    def _unpack(self, st):
+        val = st.unpack_from(self.data, self.pos)[0]
+        self.pos += st.size
+        return val
+
+    def _read_vint(self):
+        data = self.data
+        b = data[self.pos]
+        self.pos += 1
+        val = b & 0x7F
+        shift = 7
+        while b & 0x80:
+            b = data[self.pos]
+            self.pos += 1
+            val |= (b & 0x7F) << shift
+            shift += 7
+        return val
+
+    def _read_size(self, tag):
+        size = tag & 0x1F
+        if size == 0x1F:
+            size += self._read_vint()
+        return size
+
+    def _read_small_int(self, tag):
+        val = tag & 0x0F
+        if tag & 0x10:
+            val |= self._read_vint() << 4
+        return val
+
+    def _read_str(self, tag):
+        size = self._read_size(tag)
+        start = self.pos
+        self.pos += size
+        return str(self.data[start:self.pos], 'utf-8')
+
+    def _read_extern_string(self, tag):
+        idx = self._read_size(tag)
+        if idx:
+            return self.strings[idx - 1]
+        val = self.read_val()
+        self.strings.append(val)
+        return val
+
+    def _read_array(self, tag):
+        return [self.read_val() for _ in range(self._read_size(tag))]
+
+    def _read_ordered_map(self, tag):
+        out = {}
+        for _ in range(self._read_size(tag)):
+            key = self.read_val()
+            out[key] = self.read_val()
+        return out
+
+    def _read_named_list(self, tag):
+        out = []
+        for _ in range(self._read_size(tag)):
+            out.append(self.read_val())
+            out.append(self.read_val())
+        return out
+
+    def _read_byte(self, tag):
+        val = self.data[self.pos]
+        self.pos += 1
+        return val - 256 if val > 127 else val
+
+    def _read_float(self, tag):
+        val = self._unpack(_float)
+        # Find the shortest representation that round trips to the same float32, like the JSON writer prints it
+        for precision in range(6, 10):
+            short = float('{:.{}g}'.format(val, precision))
+            if _float.pack(short) == _float.pack(val):
+                return short
+        return val
+
+    def _read_date(self, tag):
+        ms = self._unpack(_long)
+        dt = _EPOCH + datetime.timedelta(milliseconds=ms)
+        if ms % 1000:
+            return dt.strftime('%Y-%m-%dT%H:%M:%S.') + '{:03d}Z'.format(ms % 1000)
+        return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _read_map(self, tag):
+        out = {}
+        for _ in range(self._read_vint()):
+            key = self.read_val()
+            out[key] = self.read_val()
+        return out
+
+    def _read_solr_doc(self, tag):
+        tag = self.data[self.pos]
+        self.pos += 1
+        doc = {}
+        for _ in range(self._read_size(tag)):
+            name = self.read_val()
+            if type(name) is dict:
+                doc.setdefault('_childDocuments_', []).append(name)
+                continue
+            doc[name] = self.read_val()
+        return doc
+
+    def _read_solr_doc_list(self, tag):
+        header = self.read_val()
+        out = {'numFound': header[0], 'start': header[1]}
+        if len(header) > 2 and header[2] is not None:
+            out['maxScore'] = header[2]
+        if len(header) > 3 and header[3] is not None:
+            out['numFoundExact'] = header[3]
+        if self.compact_docs and self.data[self.pos] >> 5 == ARR:
+            #Only the main result, it's the first document list in the response
+            self.compact_docs = False
+            tag = self.data[self.pos]
+            self.pos += 1
+            #Each document is converted to a row as soon as it is read
+            out['docs'] = CompactDocs(self.read_val() for _ in range(self._read_size(tag)))
+        else:
+            out['docs'] = self.read_val()
+        return out
+
+    def _read_solr_input_doc(self, tag):
+        size = self._read_vint()
+        # document boost, not used since Solr 7
+        self.read_val()
+        doc = {}
+        for _ in range(size):
+            name = self.read_val()
+            if type(name) is dict:
+                doc.setdefault('_childDocuments_', []).append(name)
+                continue
+            doc[name] = self.read_val()
+        return doc
+
+    def _read_byte_array(self, tag):
+        size = self._read_vint()
+        start = self.pos
+        self.pos += size
+        return bytes(self.data[start:self.pos])
+
+    def _read_iterator(self, tag):
+        out = []
+        while True:
+            val = self.read_val()
+            if val is _END:
+                return out
+            out.append(val)
+
+    def _read_map_entry_iter(self, tag):
+        out = {}
+        while True:
+            key = self.read_val()
+            if key is _END:
+                return out
+            out[key] = self.read_val()
+
+    def _read_enum(self, tag):
+        # ordinal followed by the name, JSON only shows the name
+        self.read_val()
+        return self.read_val()
+
+    def _read_map_entry(self, tag):
+        key = self.read_val()
+        return {key: self.read_val()}
+
+    def _read_uuid(self, tag):
+        start = self.pos
+        self.pos += 16
+        return str(uuid.UUID(bytes=bytes(self.data[start:self.pos])))
+
+
+def loads(data, compact_docs=False):
+    '''
+    Decodes javabin bytes into python data structures, the same ones `json.loads` would return for wt=json.
+
+    With `compact_docs` the documents of the main result are stored in a CompactDocs container while they are decoded.
+    '''
+    return JavabinDecoder(data, compact_docs).decode()
@@ -0,0 +1,110 @@
+import random
+import threading
+from ..exceptions import SolrError, ConnectionError
+
+
+class RetryBudget():
+    """
+    Limits how many retries a single client can issue compared to the number of requests it sends, so that a
+    struggling cluster doesn't get hammered by a retry storm.
+
+    Every request deposits `ratio` tokens into the budget (up to `max_tokens`) and every retry withdraws one.
+
+    :param float ratio: Fraction of requests that can be retried. Default is 0.2 (one retry for every five requests).
+    :param int min_tokens: Number of retries available before any requests were made.
+    :param int max_tokens: Upper bound of retries that can be saved up.
+    """
+
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        '''
+        Takes one retry out of the budget, returns False if the budget is exhausted.
+        '''
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class RetryPolicy():
+    """
+    Describes how the transport retries failed requests.
+
+    Each attempt goes through all configured hosts. If all of them fail with a retryable error, the transport sleeps
+    using exponential backoff with full jitter and starts the next attempt, up to `max_attempts`.
+
+    :param int max_attempts: Total number of passes over the host list. 1 disables retrying.
+    :param float backoff: Base delay in seconds, doubled on each attempt.
+    :param float max_backoff: Upper bound of the delay in seconds.
+    :param bool jitter: Randomize the delay between 0 and the computed backoff.
+    :param tuple retry_statuses: HTTP status codes that are considered transient.
+    :param bool retry_updates: Also retry requests that modify the index (update handlers, schema and admin calls). These are not idempotent so they are only failed over to the next host by default.
+    :param float budget_ratio: Passed to :class:`RetryBudget`. Set to None to disable the budget.
+
+    Example::
+
+        >>> from SolrClient.transport import RetryPolicy
+        >>> solr = SolrClient('http://localhost:8983/solr', retry_policy=RetryPolicy(max_attempts=5, retry_updates=True))
+
+    """
+    non_idempotent_endpoints = ('update', 'schema', 'admin/collections', 'admin/cores', 'config')
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=10, jitter=True,
+                 retry_statuses=(429, 502, 503, 504), retry_updates=False, budget_ratio=0.2):
+        if max_attempts < 1:
+            raise ValueError("max_attempts has to be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = tuple(retry_statuses)
+        self.retry_updates = retry_updates
+        self.budget_ratio = budget_ratio
+
+    def new_budget(self):
+        '''
+        Returns a new :class:`RetryBudget` for a client, or None if budgets are disabled.
+        '''
+        if self.budget_ratio is None:
+            return None
+        return RetryBudget(ratio=self.budget_ratio)
+
+    def is_idempotent(self, method='GET', endpoint=None, **kwargs):
+        '''
+        Queries are sent as POST as well, so the endpoint decides if a request is safe to repeat.
+        '''
+        if self.retry_updates:
+            return True
+        endpoint = (endpoint or '').lstrip('/')
+        return not endpoint.startswith(self.non_idempotent_endpoints)
+
+    def is_retryable(self, exception):
+        '''
+        Returns True if the exception is transient and the request can be sent again.
+        '''
+        status = getattr(exception, 'status_code', None)
+        if isinstance(exception, ConnectionError):
+            # No status means we never got a response, like a timeout or a connection reset
+            return status is None or status in self.retry_statuses
+        if isinstance(exception, SolrError):
+            return status in self.retry_statuses
+        return False
+
+    def get_backoff(self, attempt):
+        '''
+        Returns number of seconds to sleep before `attempt` (starting at 1 for the first retry).
+        '''
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
@@ -1,5 +1,7 @@
 import logging
+import time
 from ..exceptions import *
+from .retry import RetryPolicy
 from ..routers.plain import PlainRouter
 
 
@@ -7,9 +9,12 @@ class TransportBase():
     """
     Base Transport Class
     """
+    #Response formats that can be decoded into the same python structures
+    response_formats = ('json', 'javabin')
 
     #def __init__(self, solr, auth=(None, None), devel=None, host=None, router=PlainRouter, **kwargs):
-    def __init__(self, solr, auth=(None, None), devel=None, host=None, **kwargs):
+    def __init__(self, solr, auth=(None, None), devel=None, host=None, retry_policy=None, compression=None, wt='json',
+                 **kwargs):
         self.logger = logging.getLogger(str(__package__))
         self.auth = auth
         self.host = host if type(host) is list else [host]
@@ -17,9 +22,25 @@ class TransportBase():
         self._action_log = []
         self._action_log_count = 1000
         self.solr = solr
+        #Without a policy every host is tried once, as before retry policies existed
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(max_attempts=1)
+        #Each client gets it's own budget, even if the policy is shared
+        self._retry_budget = self.retry_policy.new_budget()
+        self.compression = compression
+        self.wt = self._get_wt(wt)
         #self.router = router(self, host, **kwargs)
         self.setup()
 
+    def _get_wt(self, wt=None):
+        '''
+        Returns the response format to request, either the one passed in or the transport default.
+        '''
+        if wt is None:
+            return self.wt
+        if wt not in self.response_formats:
+            raise ValueError("Unsupported response format {}, use one of {}".format(wt, ", ".join(self.response_formats)))
+        return wt
+
     def _add_to_action(self, action):
         self._action_log.append(action)
         if len(self._action_log) >= self._action_log_count:
@@ -28,23 +49,45 @@ class TransportBase():
     def _retry(function):
         """
         Internal mechanism to try to send data to multiple Solr Hosts if
-        the query fails on the first one.
+        the query fails on the first one. If all hosts fail with a transient error,
+        the request is retried according to self.retry_policy.
         """
 
         def inner(self, **kwargs):
+            policy = self.retry_policy
+            budget = self._retry_budget
+            idempotent = policy.is_idempotent(**kwargs)
+            if budget is not None:
+                budget.deposit()
             last_exception = None
-            #for host in self.router.get_hosts(**kwargs):
-            for host in self.host:
-                try:
-                    return function(self, host, **kwargs)
-                except SolrError as e:
-                    self.logger.exception(e)
-                    raise
-                except ConnectionError as e:
-                    self.logger.exception("Tried connecting to Solr, but couldn't because of the following exception.")
-                    if '401' in e.__str__():
-                        raise
-                    last_exception = e
+            for attempt in range(policy.max_attempts):
+                if attempt:
+                    if budget is not None and not budget.withdraw():
+                        self.logger.warning("Retry budget exhausted, not retrying request.")
+                        break
+                    delay = policy.get_backoff(attempt)
+                    self.logger.info("Retrying request in {} seconds, attempt {} of {}".format(
+                        round(delay, 3), attempt + 1, policy.max_attempts))
+                    time.sleep(delay)
+                retryable = False
+                #for host in self.router.get_hosts(**kwargs):
+                for host in self.host:
+                    try:
+                        return function(self, host, **kwargs)
+                    except ConnectionError as e:
+                        self.logger.exception("Tried connecting to Solr, but couldn't because of the following exception.")
+                        if '401' in e.__str__():
+                            raise
+                        last_exception = e
+                        retryable = policy.is_retryable(e)
+                    except SolrError as e:
+                        self.logger.exception(e)
+                        if not idempotent or not policy.is_retryable(e):
+                            raise
+                        last_exception = e
+                        retryable = True
+                if not idempotent or not retryable:
+                    break
             # raise the last exception after contacting all hosts instead of returning None
             if last_exception is not None:
                 raise last_exception
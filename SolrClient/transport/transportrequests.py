@@ -1,5 +1,7 @@
 import time
 from .transportbase import TransportBase
+from .compression import CompressionPolicy
+from . import javabin
 from ..exceptions import SolrError, ConnectionError
 
 try:
@@ -19,16 +21,19 @@ class TransportRequests(TransportBase):
         if not req:
             raise ImportError("Requests Module not found. Please install it before using this transport")
         self.session = requests.session()
+        self.session.headers['Accept-Encoding'] = CompressionPolicy.accept_encoding
         if self.auth and self.auth != (None, None):
             self.session.auth = (self.auth[0], self.auth[1])
 
-    def _send(self, host, method='GET', endpoint=None, collection=None, params=None, headers=None, data=None, **kwargs):
+    def _send(self, host, method='GET', endpoint=None, collection=None, params=None, headers=None, data=None, wt=None,
+              compact_docs=False, **kwargs):
         if endpoint is None:
             raise ValueError("No URL 'endpoint' set in parameters to send_request")
         if params is None:
             params = {}
         # put each kwarg into the params, like min_rf, _route_ etc
-        params.update(wt='json', indent=False, **kwargs)
+        wt = self._get_wt(wt)
+        params.update(wt=wt, indent=False, **kwargs)
         if not host.endswith('/'):
             host += '/'
         for field in params:
@@ -40,6 +45,12 @@ class TransportRequests(TransportBase):
             url = host + endpoint
         if headers is None:
             headers = {'content-type': 'application/json'}
+        if self.compression is not None and data is not None and endpoint.startswith('update') \
+                and 'content-encoding' not in (h.lower() for h in headers):
+            data, encoding = self.compression.compress(data)
+            if encoding is not None:
+                headers = dict(headers)
+                headers['content-encoding'] = encoding
 
         self.logger.debug("Sending Request to {} with {}".format(url, ", ".join(
             (str("{}={}".format(key, params[key])) for key in params))))
@@ -61,12 +72,16 @@ class TransportRequests(TransportBase):
             raise ConnectionError('N/A', str(e), e)
 
         if 200 <= res.status_code < 300:
+            if wt == 'javabin':
+                return [javabin.loads(res.content, compact_docs=compact_docs), {'url': res.url}]
             return [res.json(), {'url': res.url}]
         if res.status_code == 404:
-            raise ConnectionError("404 - {}".format(res.url))
+            error = ConnectionError("404 - {}".format(res.url))
         elif res.status_code == 401:
-            raise ConnectionError("401 - {}".format(res.url))
+            error = ConnectionError("401 - {}".format(res.url))
         elif res.status_code == 500:
-            raise SolrError("500 - " + res.url + " " + res.text)
+            error = SolrError("500 - " + res.url + " " + res.text)
         else:
-            raise SolrError(res.url + " " + res.text)
+            error = SolrError(res.url + " " + res.text)
+        error.status_code = res.status_code
+        raise error
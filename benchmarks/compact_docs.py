@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+'''
+Compares memory use and field access speed of a page of documents stored as a list of dicts and as CompactDocs.
+
+    PYTHONPATH=. python3 benchmarks/compact_docs.py -rows 50000
+'''
+import argparse
+import json
+import timeit
+import tracemalloc
+from SolrClient import SolrResponse
+from test.RandomTestData import RandomTestData
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-rows', type=int, default=50000)
+args = parser.parse_args()
+
+payload = json.dumps({'responseHeader': {'status': 0, 'QTime': 1},
+                      'response': {'numFound': args.rows, 'start': 0, 'docs': RandomTestData().get_docs(args.rows)}})
+
+for compact in (False, True):
+    tracemalloc.start()
+    res = SolrResponse(json.loads(payload), compact_docs=compact)
+    docs = res.docs
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    values = timeit.timeit(lambda: res.get_field_values_as_list('price'), number=10) / 10
+    access = timeit.timeit(lambda: [doc['id'] for doc in docs], number=10) / 10
+    print("{:8} {:>8.1f} MB retained {:>8.1f} MB peak {:>8.1f} ms get_field_values_as_list {:>8.1f} ms doc['id']".format(
+        'compact' if compact else 'dicts', current / 1e6, peak / 1e6, values * 1000, access * 1000))
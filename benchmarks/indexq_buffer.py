@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+'''
+Compares producer CPU time of IndexQ buffering, encoding each document once on add, with the previous approach of
+estimating the size with len(str(item)) on every add and re-serializing the whole buffer on flush.
+
+    PYTHONPATH=. python3 benchmarks/indexq_buffer.py -docs 200000 -size 25
+'''
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from SolrClient import IndexQ
+from test.RandomTestData import RandomTestData
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-docs', type=int, default=200000)
+parser.add_argument('-size', type=int, default=25, help="IndexQ buffer size in MB")
+parser.add_argument('-batch', type=int, default=1, help="Documents per add call")
+args = parser.parse_args()
+
+docs = RandomTestData().get_docs(args.docs)
+batches = [docs[i:i + args.batch] for i in range(0, len(docs), args.batch)]
+
+
+def previous(index):
+    # What _buffer used to do, writing through the same _write_file
+    buf = []
+    size = 0
+    for item in batches:
+        buf.extend(item)
+        size += len(str(item))
+        if size / (args.size * 1000000) > 0.9:
+            index._write_file(json.dumps(buf, indent=0, sort_keys=True))
+            buf = []
+            size = 0
+    if buf:
+        index._write_file(json.dumps(buf, indent=0, sort_keys=True))
+
+
+def current(index):
+    for item in batches:
+        index.add(item)
+    index.add(finalize=True)
+
+
+for name, run in (('previous', previous), ('current', current)):
+    base = tempfile.mkdtemp()
+    try:
+        index = IndexQ(base, 'bench', size=args.size)
+        start = time.process_time()
+        run(index)
+        elapsed = time.process_time() - start
+        print("{:9} {:>8.2f} s CPU {:>8.2f} us/doc {} files".format(
+            name, elapsed, elapsed / len(docs) * 1e6, len(index.get_all_as_list())))
+    finally:
+        shutil.rmtree(base)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+'''
+Compares response size and decode time of wt=json and wt=javabin for a large /select page.
+
+    SOLR_TEST_URL=http://localhost:8983/solr/ PYTHONPATH=. python3 benchmarks/javabin_vs_json.py -collection SolrClient_unittest -rows 50000
+'''
+import argparse
+import json
+import os
+import timeit
+import requests
+from SolrClient.transport import javabin
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-collection', type=str, default='SolrClient_unittest')
+parser.add_argument('-rows', type=int, default=10000)
+parser.add_argument('-runs', type=int, default=10)
+args = parser.parse_args()
+
+url = os.environ.get('SOLR_TEST_URL', 'http://localhost:8983/solr/').rstrip('/') + '/{}/select'.format(args.collection)
+decoders = {
+    'json': lambda content: json.loads(content.decode('utf-8')),
+    'javabin': javabin.loads,
+}
+
+for wt, decode in decoders.items():
+    content = requests.get(url, params={'q': '*:*', 'rows': args.rows, 'wt': wt}).content
+    seconds = timeit.timeit(lambda: decode(content), number=args.runs) / args.runs
+    docs = len(decode(content)['response']['docs'])
+    print("{:8} {:>12,} bytes {:>10.1f} ms/decode {:>8} docs".format(wt, len(content), seconds * 1000, docs))
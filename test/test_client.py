@@ -3,9 +3,13 @@ import gzip
 import logging
 import json
 import os
-from SolrClient import SolrClient
+import struct
+import time
+from SolrClient import SolrClient, CompactDocs
+from SolrClient.solrclient import FileStream
 from SolrClient.exceptions import *
 from SolrClient.routers.aware import AwareRouter
+from SolrClient.transport import TransportBase, RetryPolicy, CompressionPolicy, javabin
 from .test_config import test_config
 from .RandomTestData import RandomTestData
 
@@ -276,6 +280,42 @@ class ClientTestIndexing(unittest.TestCase):
         except:
             pass
 
+    def test_paging_query_uses_cursor(self):
+        self.docs = self.rand_docs.get_docs(100)
+        self.solr.index(test_config['SOLR_COLLECTION'], self.docs)
+        self.commit()
+        pages = list(self.solr.paging_query(test_config['SOLR_COLLECTION'], {'q': '*:*', 'sort': 'price asc'}, rows=30,
+                                            use_cursor=True))
+        self.assertEqual(len(pages), 4)
+        for res in pages:
+            self.assertTrue(res.get_cursor())
+        self.assertEqual(sorted(x['id'] for res in pages for x in res.docs), sorted(x['id'] for x in self.docs))
+        pages = list(self.solr.paging_query(test_config['SOLR_COLLECTION'], {'q': '*:*'}, rows=30,
+                                            deep_paging_threshold=50))
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(self.solr.deep_paging_count, 1)
+        self.delete_docs()
+        self.commit()
+
+    def test_get_cursor_sort(self):
+        self.assertEqual(self.solr._get_cursor_sort('sum(price,1) desc', 'id'), 'sum(price,1) desc, id asc')
+        self.assertEqual(self.solr._get_cursor_sort('price asc, id desc', 'id'), 'price asc, id desc')
+        self.assertEqual(self.solr._get_cursor_sort(None, 'id'), 'score desc, id asc')
+        self.assertEqual(self.solr._get_unique_key(test_config['SOLR_COLLECTION']), 'id')
+
+    def test_sliced_cursor_query(self):
+        self.docs = self.rand_docs.get_docs(200)
+        self.solr.index(test_config['SOLR_COLLECTION'], self.docs)
+        self.solr.index(test_config['SOLR_COLLECTION'], [{'id': 'no_price'}])
+        self.commit()
+        for field in ['price', 'date']:
+            ids = [x['id'] for res in self.solr.sliced_cursor_query(test_config['SOLR_COLLECTION'],
+                                                                    {'q': '*:*', 'rows': 20}, field, slices=4)
+                   for x in res.docs]
+            self.assertEqual(sorted(ids), sorted([x['id'] for x in self.docs] + ['no_price']))
+        self.delete_docs()
+        self.commit()
+
     def test_paging_query_with_max(self):
         self.docs = self.rand_docs.get_docs(1000)
         with gzip.open('temp_file.json.gz', 'wb') as f:
@@ -330,5 +370,226 @@ class ClientTestIndexing(unittest.TestCase):
             pass
 
 
+class FlakyTransport(TransportBase):
+    # Fails with the given exceptions before returning a response, doesn't need Solr
+    def setup(self):
+        self.errors = []
+        self.calls = 0
+
+    def _send(self, host, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [{'responseHeader': {'status': 0, 'QTime': 1}}, {'url': host}]
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def get_transport(self, *errors, **kwargs):
+        policy = RetryPolicy(backoff=0.001, **kwargs)
+        t = FlakyTransport(None, host=['http://host1:8983/solr', 'http://host2:8983/solr'], retry_policy=policy)
+        for status in errors:
+            e = ConnectionError('N/A') if status is None else SolrError(str(status))
+            e.status_code = status
+            t.errors.append(e)
+        return t
+
+    def test_fails_over_to_next_host(self):
+        t = self.get_transport(None)
+        res, con_inf = t.send_request(endpoint='select')
+        self.assertEqual(con_inf['url'], 'http://host2:8983/solr')
+
+    def test_retries_transient_errors(self):
+        t = self.get_transport(503, 503, 429)
+        t.send_request(endpoint='select')
+        self.assertEqual(t.calls, 4)
+
+    def test_gives_up_after_max_attempts(self):
+        t = self.get_transport(503, 503, 503, 503, 503, 503, max_attempts=2)
+        with self.assertRaises(SolrError):
+            t.send_request(endpoint='select')
+        self.assertEqual(t.calls, 4)
+
+    def test_does_not_retry_bad_request(self):
+        t = self.get_transport(400)
+        with self.assertRaises(SolrError):
+            t.send_request(endpoint='select')
+        self.assertEqual(t.calls, 1)
+
+    def test_does_not_retry_updates(self):
+        t = self.get_transport(503)
+        with self.assertRaises(SolrError):
+            t.send_request(method='POST', endpoint='update')
+        t = self.get_transport(503, retry_updates=True)
+        t.send_request(method='POST', endpoint='update')
+        self.assertEqual(t.calls, 2)
+
+    def test_retry_budget(self):
+        t = self.get_transport(*([503] * 6), max_attempts=10)
+        t._retry_budget._tokens = 1
+        with self.assertRaises(SolrError):
+            t.send_request(endpoint='select')
+        self.assertEqual(t.calls, 4)
+
+    def test_no_retries_by_default(self):
+        t = FlakyTransport(None, host=['http://host1:8983/solr', 'http://host2:8983/solr'])
+        for status in (503, 503, 503):
+            e = SolrError(str(status))
+            e.status_code = status
+            t.errors.append(e)
+        with self.assertRaises(SolrError):
+            t.send_request(endpoint='select')
+        self.assertEqual(t.calls, 2)
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        self.assertEqual([policy.get_backoff(x) for x in range(1, 5)], [1, 2, 4, 5])
+
+
+class CompressionPolicyTest(unittest.TestCase):
+    def test_small_payload_not_compressed(self):
+        data, encoding = CompressionPolicy(min_size=1024).compress('[{"id": "1"}]')
+        self.assertIsNone(encoding)
+        self.assertEqual(data, b'[{"id": "1"}]')
+
+    def test_gzip(self):
+        payload = json.dumps([{'id': str(x)} for x in range(1000)])
+        data, encoding = CompressionPolicy().compress(payload)
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(data).decode('utf-8'), payload)
+
+    def test_deflate(self):
+        import zlib
+        payload = json.dumps([{'id': str(x)} for x in range(1000)])
+        data, encoding = CompressionPolicy(encoding='deflate').compress(payload)
+        self.assertEqual(encoding, 'deflate')
+        self.assertEqual(zlib.decompress(data).decode('utf-8'), payload)
+
+    def test_level_by_size(self):
+        policy = CompressionPolicy(levels=((0, 9), (100, 5), (1000, 1)))
+        self.assertEqual([policy.get_level(x) for x in (10, 100, 999, 5000)], [9, 5, 5, 1])
+
+
+class FileStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.data = json.dumps(RandomTestData().get_docs(500)).encode('utf-8')
+        with open('temp_stream.json', 'wb') as f:
+            f.write(self.data)
+        with gzip.open('temp_stream.json.gz', 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        for f in ['temp_stream.json', 'temp_stream.json.gz']:
+            os.remove(f)
+
+    def test_chunks(self):
+        chunks = list(FileStream('temp_stream.json', chunk_size=1000))
+        self.assertTrue(max(len(x) for x in chunks) <= 1000)
+        self.assertEqual(b''.join(chunks), self.data)
+
+    def test_gzip_decompressed_and_repeatable(self):
+        body = FileStream('temp_stream.json.gz', opener=gzip.open, chunk_size=1000)
+        self.assertEqual(b''.join(body), self.data)
+        # Second pass, like a failover to the next host would do
+        self.assertEqual(b''.join(body), self.data)
+
+
+class JavabinTest(unittest.TestCase):
+    # Hand encoded javabin for a small select response
+    def str_(self, s):
+        b = s.encode('utf-8')
+        return bytes([0x20 | len(b)]) + b
+
+    def get_select_response(self):
+        data = bytes([2, 0xA0 | 3])  # version, ordered map of 3
+        data += self.str_('responseHeader') + bytes([0xA0 | 2])
+        data += self.str_('status') + bytes([0x40 | 0])
+        data += self.str_('QTime') + bytes([0x40 | 0x10 | 5, 1])  # 5 | 1 << 4 = 21
+        data += self.str_('response') + bytes([12])  # SOLRDOCLST
+        data += bytes([0x80 | 3, 0x60 | 2, 0x60 | 0, 0])  # [numFound=2, start=0, maxScore=null]
+        data += bytes([0x80 | 2])
+        for i, (doc_id, price) in enumerate((('a', 10), ('b', 300))):
+            # field names are extern strings, defined in the first doc and referenced by index afterwards
+            names = [bytes([0xE0]) + self.str_(x) if i == 0 else bytes([0xE0 | n + 1])
+                     for n, x in enumerate(['id', 'price', 'date', 'score'])]
+            data += bytes([11, 0xA0 | 4])
+            data += names[0] + self.str_(doc_id)
+            data += names[1] + struct.pack('>bi', 6, price)
+            data += names[2] + struct.pack('>bq', 9, 1444747220492)
+            data += names[3] + struct.pack('>bf', 8, 0.1)
+        data += self.str_('facet_fields') + bytes([0xC0 | 2])  # named list
+        data += self.str_('x') + bytes([0x40 | 3]) + self.str_('y') + bytes([1])
+        return data
+
+    def test_select_response(self):
+        res = javabin.loads(self.get_select_response())
+        self.assertEqual(res['responseHeader'], {'status': 0, 'QTime': 21})
+        self.assertEqual(res['response']['numFound'], 2)
+        self.assertEqual(res['response']['docs'][1],
+                         {'id': 'b', 'price': 300, 'date': '2015-10-13T14:40:20.492Z', 'score': 0.1})
+        self.assertEqual(res['facet_fields'], ['x', 3, 'y', True])
+
+    def test_compact_docs(self):
+        res = javabin.loads(self.get_select_response(), compact_docs=True)
+        self.assertIsInstance(res['response']['docs'], CompactDocs)
+        self.assertEqual(res['response']['docs'].fields, ('id', 'price', 'date', 'score'))
+        self.assertEqual(dict(res['response']['docs'][1]),
+                         {'id': 'b', 'price': 300, 'date': '2015-10-13T14:40:20.492Z', 'score': 0.1})
+
+    def test_bad_version(self):
+        with self.assertRaises(ValueError):
+            javabin.loads(bytes([1, 0]))
+
+
+class CursorTransport(TransportBase):
+    # Serves docs from memory in cursorMark pages, doesn't need Solr
+    def setup(self):
+        self.docs = [{'id': str(x)} for x in range(25)]
+        self.requests = []
+
+    def _send(self, host, params=None, **kwargs):
+        self.requests.append(dict(params))
+        start = 0 if params['cursorMark'] == '*' else int(params['cursorMark'])
+        rows = int(params.get('rows', 10))
+        docs = self.docs[start:start + rows]
+        return [{'responseHeader': {'status': 0, 'QTime': 1},
+                 'response': {'numFound': len(self.docs), 'start': 0, 'docs': docs},
+                 'nextCursorMark': str(start + len(docs))}, {'url': host}]
+
+
+class CursorQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.solr = SolrClient('http://localhost:8983/solr', transport=CursorTransport)
+
+    def test_stops_on_short_page(self):
+        query = {'q': '*:*', 'rows': 10}
+        pages = list(self.solr.cursor_query('test', query))
+        self.assertEqual([len(res.docs) for res in pages], [10, 10, 5])
+        self.assertEqual(len(self.solr.transport.requests), 3)
+        self.assertEqual(query, {'q': '*:*', 'rows': 10})
+
+    def test_stops_on_unchanged_cursor(self):
+        self.solr.transport.docs = self.solr.transport.docs[:20]
+        pages = list(self.solr.cursor_query('test', {'q': '*:*', 'rows': 10}))
+        self.assertEqual(len(pages), 2)
+        # The last full page needs one more request to find out there is nothing left
+        self.assertEqual(len(self.solr.transport.requests), 3)
+
+    def test_prefetch(self):
+        pages = list(self.solr.cursor_query('test', {'q': '*:*', 'rows': 10}, prefetch=2))
+        self.assertEqual([x['id'] for res in pages for x in res.docs], [str(x) for x in range(25)])
+
+    def test_slice_boundaries(self):
+        self.assertEqual(SolrClient._get_slice_boundaries(['0', '10', '20', '30'], [5, 5, 5, 5], 2), ['20'])
+        self.assertEqual(SolrClient._get_slice_boundaries(list('abcdefgh'), [1] * 8, 4), ['c', 'e', 'g'])
+        # Skewed counts give fewer slices instead of empty ones
+        self.assertEqual(SolrClient._get_slice_boundaries(['0', '10', '20', '30'], [20, 0, 0, 0], 4), ['10'])
+
+    def test_prefetch_stops_early(self):
+        for res in self.solr.cursor_query('test', {'q': '*:*', 'rows': 1}, prefetch=1):
+            break
+        time.sleep(0.3)
+        self.assertTrue(len(self.solr.transport.requests) <= 3)
+
+
 if __name__ == '__main__':
     pass
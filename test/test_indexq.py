@@ -3,21 +3,45 @@ import gzip
 import logging
 import json
 import os
+import io
 import random
 from multiprocessing.pool import ThreadPool
 from SolrClient import SolrClient, IndexQ
+from SolrClient.indexq import _iter_json
 from SolrClient.exceptions import *
 from .test_config import test_config
 from .RandomTestData import RandomTestData
 import shutil
+import subprocess
+import sys
 from functools import partial
 from datetime import datetime as dt
 from time import sleep
+import time
 test_config['indexqbase'] = os.getcwd()
 
 logging.disable(logging.CRITICAL)
 
 
+class ClaimSolr():
+    #Records how many items the consumer holds while each one is sent, and fails on the items in fail
+    def __init__(self, claim_dir, fail=()):
+        self.claim_dir = claim_dir
+        self.fail = fail
+        self.held = []
+        self.sent = []
+
+    def stream_file(self, collection, path):
+        self.held.append(len([x for x in os.listdir(self.claim_dir) if x != '.heartbeat']))
+        if os.path.basename(path) in self.fail:
+            raise SolrError("Failed")
+        self.sent.append(os.path.basename(path))
+        return True
+
+    def index_json(self, collection, data):
+        raise SolrError("Failed")
+
+
 class TestIndexQ(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -182,6 +206,14 @@ class TestIndexQ(unittest.TestCase):
         self.assertGreaterEqual(os.path.getsize(doc), size * 1000000 * .90)
         os.remove(doc)
 
+    def test_buffer_size_is_exact(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', size=1)
+        size = index.add(self.docs[0:20])
+        doc = index.add(finalize=True)
+        self.assertEqual(os.path.getsize(doc), size)
+        self.check_file_contents(doc, self.docs[0:20])
+        os.remove(doc)
+
     def test_buffer_list_75m_dump_early(self):
         size = 75
         index = IndexQ(test_config['indexqbase'], 'testq', size=size)
@@ -196,6 +228,74 @@ class TestIndexQ(unittest.TestCase):
         self.check_file_contents(doc, buff)
         os.remove(doc)
 
+    def test_write_fsync_file(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', fsync='file', compress=True)
+        doc = index.add(self.docs[0:20])
+        self.check_file_contents(doc, self.docs[0:20])
+        self.assertEqual(os.listdir(index._tmp_dir), [])
+
+    def test_write_fsync_group(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', fsync='group', fsync_interval=60000)
+        doc = index._write_file(json.dumps(self.docs[0:20]))
+        # Not in todo until the group commit
+        self.assertFalse(os.path.exists(doc))
+        self.assertEqual(index.get_all_as_list(), [])
+        self.assertEqual(index.sync(), [doc])
+        self.check_file_contents(doc, self.docs[0:20])
+        self.assertEqual(os.listdir(index._tmp_dir), [])
+
+    def test_write_fsync_group_timer(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', fsync='group', fsync_interval=50)
+        doc = index._write_file(json.dumps(self.docs[0:20]))
+        sleep(1)
+        self.check_file_contents(doc, self.docs[0:20])
+
+    def test_write_fsync_group_finalize(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', fsync='group', fsync_interval=60000, size=1)
+        index.add(self.docs[0:20])
+        doc = index.add(finalize=True)
+        self.check_file_contents(doc, self.docs[0:20])
+
+    def test_write_fsync_group_exit(self):
+        #The producer exits normally before the timer fires
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        doc = subprocess.check_output([sys.executable, '-c', 'import sys; sys.path.insert(0, {!r}); from SolrClient import IndexQ; '
+                                       'print(IndexQ({!r}, "testq", fsync="group", fsync_interval=500)._write_file("[]"))'.format(
+                                           os.getcwd(), test_config['indexqbase'])]).decode().strip()
+        self.assertTrue(os.path.exists(doc))
+        self.assertEqual(os.listdir(index._tmp_dir), [])
+
+    def test_recover_ready(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        dead = os.path.join(index._tmp_dir, 'testq_1.json.{}.{}.ready'.format(index._host, 2 ** 22 + 12345))
+        with open(dead, 'w') as f:
+            json.dump(self.docs[0:20], f)
+        IndexQ(test_config['indexqbase'], 'testq')
+        self.assertFalse(os.path.exists(dead))
+        self.check_file_contents(os.path.join(index._todo_dir, 'testq_1.json'), self.docs[0:20])
+
+    def test_bad_fsync(self):
+        with self.assertRaises(ValueError):
+            IndexQ(test_config['indexqbase'], 'testq', fsync='always')
+
+    def test_remove_orphans(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        # A producer on this host whose PID doesn't exist any more, one that is still running and a file from another host
+        dead = os.path.join(index._tmp_dir, 'testq_1.json.{}.{}.tmp'.format(index._host, 2 ** 22 + 12345))
+        alive = os.path.join(index._tmp_dir, 'testq_2.json.{}.{}.tmp'.format(index._host, os.getpid()))
+        other = os.path.join(index._tmp_dir, 'testq_3.json.otherhost.1.tmp')
+        for path in (dead, alive, other):
+            with open(path, 'w') as f:
+                f.write('[{"id": "hal')
+        IndexQ(test_config['indexqbase'], 'testq')
+        self.assertFalse(os.path.exists(dead))
+        self.assertTrue(os.path.exists(alive))
+        self.assertTrue(os.path.exists(other))
+        os.utime(other, (time.time() - 100000, time.time() - 100000))
+        IndexQ(test_config['indexqbase'], 'testq')
+        self.assertFalse(os.path.exists(other))
+        os.remove(alive)
+
     def test_by_get_all_compressed(self):
         size = 1
         files = 2
@@ -322,6 +422,78 @@ class TestIndexQ(unittest.TestCase):
         [index.complete(i) for i in x]
         self.assertFalse(os.path.exists(index._lck))
 
+    def test_claim_multi_consumer(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        docs = [index.add(self.docs, finalize=True) for _ in range(6)]
+        c1 = IndexQ(test_config['indexqbase'], 'testq').claim_todo_items('c1')
+        c2 = IndexQ(test_config['indexqbase'], 'testq').claim_todo_items('c2')
+        claimed = {'c1': [], 'c2': []}
+        for _ in range(3):
+            claimed['c1'].append(next(c1))
+            claimed['c2'].append(next(c2))
+        self.assertEqual(list(c1), [])
+        for cid in claimed:
+            for path in claimed[cid]:
+                self.assertEqual(os.path.dirname(path), os.path.join(index._inprogress_dir, cid))
+                index.complete(path)
+        names = sorted(os.path.basename(x) for x in claimed['c1'] + claimed['c2'])
+        self.assertEqual(names, sorted(os.path.basename(x) for x in docs))
+        self.assertEqual(index.get_all_as_list(), [])
+        self.assertEqual(len(index.get_all_as_list('_done_dir')), 6)
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_claim_reclaim_stale(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        docs = [index.add(self.docs, finalize=True) for _ in range(2)]
+        dead = index.claim_todo_items('dead', lease=60)
+        path = next(dead)
+        old = time.time() - 120
+        os.utime(os.path.join(index._inprogress_dir, 'dead', '.heartbeat'), (old, old))
+        claimed = list(IndexQ(test_config['indexqbase'], 'testq').claim_todo_items('alive', lease=60))
+        self.assertEqual(sorted(os.path.basename(x) for x in claimed), sorted(os.path.basename(x) for x in docs))
+        self.assertFalse(os.path.exists(os.path.join(index._inprogress_dir, 'dead')))
+        [index.complete(x) for x in claimed]
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_claim_restart(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        docs = [index.add(self.docs, finalize=True) for _ in range(2)]
+        crashed = index.claim_todo_items('c1')
+        next(crashed)
+        #Restarted with the same consumer_id, well within the lease
+        claimed = list(IndexQ(test_config['indexqbase'], 'testq').claim_todo_items('c1'))
+        self.assertEqual(sorted(os.path.basename(x) for x in claimed), sorted(os.path.basename(x) for x in docs))
+        [index.complete(x) for x in claimed]
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_claim_release(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        doc = index.add(self.docs, finalize=True)
+        path = next(index.claim_todo_items('c1'))
+        self.assertEqual(index.get_all_as_list(), [])
+        self.assertEqual(index.release(path), doc)
+        self.assertEqual(index.get_all_as_list(), [doc])
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_index_claims_threads(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        docs = [index.add(self.docs, finalize=True) for _ in range(8)]
+        solr = ClaimSolr(os.path.join(index._inprogress_dir, 'c1'), fail=[os.path.basename(docs[3])])
+        index.index(solr, 'coll', threads=2, consumer_id='c1')
+        #Items are claimed as threads free up, not all at once
+        self.assertTrue(max(solr.held) <= 2)
+        self.assertEqual(len(solr.sent), 7)
+        #The failed item is back in todo
+        self.assertEqual(index.get_all_as_list(), [docs[3]])
+        self.assertEqual(os.listdir(solr.claim_dir), ['.heartbeat'])
+        index.complete(docs[3])
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
     def test_index(self):
         index = IndexQ(test_config['indexqbase'], 'testq')
         solr = SolrClient(test_config['SOLR_SERVER'],
@@ -569,6 +741,82 @@ class TestIndexQ(unittest.TestCase):
         t = index.add(docs[1], callback=cb, finalize=True)
         self.assertTrue(t in temp)
 
+    def test_iter_json_formats(self):
+        docs = [{'id': str(x), 'text': 'a, [b] {c}\n "d"'} for x in range(20)]
+        for data in [json.dumps(docs), json.dumps(docs, indent=4), '\n'.join(json.dumps(x) for x in docs) + '\n']:
+            self.assertEqual(list(_iter_json(io.StringIO(data), chunk_size=7)), docs)
+        self.assertEqual(list(_iter_json(io.StringIO(' {"id": "1"} '), chunk_size=2)), [{'id': '1'}])
+        self.assertEqual(list(_iter_json(io.StringIO('[]'))), [])
+        with self.assertRaises(ValueError):
+            list(_iter_json(io.StringIO('[{"id": "1"}, {"id": '), chunk_size=4))
+
+    def test_get_todo_docs(self):
+        index = IndexQ(test_config['indexqbase'], 'testq', size=0.001)
+        for doc in self.docs:
+            index.add(doc)
+        index.add(finalize=True)
+        files = index.get_all_as_list()
+        self.assertTrue(len(files) > 2)
+        index = IndexQ(test_config['indexqbase'], 'testq', compress=True)
+        index.add(self.docs, finalize=True)
+        out = []
+        for batch in index.get_todo_docs(batch_size=7):
+            self.assertTrue(len(batch) <= 7)
+            out.extend(batch)
+        self.assertEqual(out, self.docs + self.docs)
+        self.assertEqual(index.get_all_as_list(), [])
+        self.assertEqual(len(index.get_all_as_list('_done_dir')), len(files) + 1)
+
+    def test_get_todo_docs_claimed(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        first = index.add(self.docs[:10], finalize=True)
+        sleep(1)
+        second = index.add(self.docs[10:], finalize=True)
+        beat = os.path.join(index._inprogress_dir, 'c1', '.heartbeat')
+        batches = index.get_todo_docs(batch_size=4, consumer_id='c1', lease=60)
+        for i in range(5):
+            next(batches)
+            #Every batch renews the lease, also while reading a single file
+            os.utime(beat, (time.time() - 120, time.time() - 120))
+        self.assertEqual(next(batches), self.docs[20:24])
+        self.assertEqual(index.get_all_as_list(), [])
+        self.assertEqual(index.reclaim_stale(lease=60), [])
+        batches.close()
+        #Closing early puts the files that weren't completed back
+        self.assertEqual(index.get_all_as_list(), [second])
+        self.assertEqual(os.listdir(os.path.join(index._inprogress_dir, 'c1')), ['.heartbeat'])
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_index_batches_release(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        doc = index.add(self.docs, finalize=True)
+        solr = ClaimSolr(os.path.join(index._inprogress_dir, 'c1'))
+        with self.assertRaises(SolrError):
+            index.index(solr, 'coll', consumer_id='c1', batch_size=10)
+        self.assertEqual(index.get_all_as_list(), [doc])
+        shutil.rmtree(index._inprogress_dir)
+        os.makedirs(index._inprogress_dir)
+
+    def test_get_todo_docs_stop(self):
+        index = IndexQ(test_config['indexqbase'], 'testq')
+        first = index.add(self.docs[:10], finalize=True)
+        sleep(1)
+        second = index.add(self.docs[10:], finalize=True)
+        batches = index.get_todo_docs(batch_size=8)
+        self.assertEqual(next(batches), self.docs[:8])
+        self.assertEqual(next(batches), self.docs[8:16])
+        #First file is only completed once the batch with it's last doc is processed
+        self.assertEqual(index.get_all_as_list(), [first, second])
+        self.assertEqual(next(batches), self.docs[16:24])
+        self.assertEqual(index.get_all_as_list(), [second])
+        batches.close()
+        #Stopping early unlocks the queue
+        self.assertFalse(index._is_locked())
+        #The second file wasn't completed, so it is read again from the start
+        self.assertEqual(list(index.get_todo_docs(batch_size=100)), [self.docs[10:]])
+        self.assertFalse(index._is_locked())
+
     def test_get_multi_q1(self):
         docs = self.rand_docs.get_docs(5000)
         log = logging.getLogger()
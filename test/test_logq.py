@@ -0,0 +1,121 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from SolrClient import LogQ
+
+
+class FakeSolr():
+    def __init__(self):
+        self.indexed = []
+
+    def index_json(self, collection, data, **kwargs):
+        self.indexed.extend(json.loads(data))
+        return True
+
+
+class LogQTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.docs = [{'id': str(i), 'title': 'doc number {}'.format(i)} for i in range(100)]
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    def _read_all(self, q, consumer='c', batch_size=1000, commit=True):
+        out = []
+        for docs, offset in q.read_batches(consumer, batch_size=batch_size):
+            out.extend(docs)
+            if commit:
+                q.commit(consumer, offset)
+        return out
+
+    def test_add_and_read(self):
+        q = LogQ(self.base, 'q')
+        q.add(self.docs[:50])
+        q.add(self.docs[50])
+        self.assertEqual(self._read_all(q), self.docs[:51])
+        # Committed, so nothing is read again
+        self.assertEqual(self._read_all(q), [])
+        q.add(self.docs[51:])
+        self.assertEqual(self._read_all(q), self.docs[51:])
+
+    def test_bad_item(self):
+        q = LogQ(self.base, 'q')
+        with self.assertRaises(ValueError):
+            q.add([{'id': '1'}, []])
+        with self.assertRaises(ValueError):
+            q.add('abc')
+
+    def test_rotation(self):
+        q = LogQ(self.base, 'q', segment_size=0.001)
+        for doc in self.docs:
+            q.add(doc)
+        self.assertGreater(len(q._read_index()), 3)
+        self.assertEqual(self._read_all(q, batch_size=7), self.docs)
+
+    def test_uncommitted_is_read_again(self):
+        q = LogQ(self.base, 'q', segment_size=0.001)
+        q.add(self.docs)
+        self.assertEqual(self._read_all(q, commit=False), self.docs)
+        # A new instance, like a restarted consumer, picks up the committed offset
+        batches = LogQ(self.base, 'q').read_batches('c', batch_size=30)
+        docs, offset = next(batches)
+        q.commit('c', offset)
+        self.assertEqual(self._read_all(LogQ(self.base, 'q')), self.docs[30:])
+
+    def test_consumers_are_independent(self):
+        q = LogQ(self.base, 'q')
+        q.add(self.docs)
+        self.assertEqual(self._read_all(q, consumer='a'), self.docs)
+        self.assertEqual(self._read_all(q, consumer='b'), self.docs)
+
+    def test_partial_line_not_read(self):
+        q = LogQ(self.base, 'q')
+        seq, pos = q.add(self.docs[:2])
+        with open(q._segment_path(seq), 'a') as f:
+            f.write('{"id": "half')
+        self.assertEqual(self._read_all(q), self.docs[:2])
+        self.assertEqual(q.get_offset('c'), (seq, pos))
+
+    def test_torn_tail_append(self):
+        q = LogQ(self.base, 'q')
+        seq, pos = q.add(self.docs[:2])
+        with open(q._segment_path(seq), 'a') as f:
+            f.write('{"id": "half')
+        self.assertEqual(LogQ(self.base, 'q').add(self.docs[2:4])[0], seq)
+        with open(q._segment_path(seq)) as f:
+            self.assertEqual([json.loads(line) for line in f], self.docs[:4])
+        self.assertEqual(self._read_all(q), self.docs[:4])
+
+    def test_torn_tail_rotate(self):
+        q = LogQ(self.base, 'q')
+        seq, pos = q.add(self.docs[:2])
+        with open(q._segment_path(seq), 'a') as f:
+            f.write('{"id": "half')
+        q._new_segment(seq + 1)
+        q.add(self.docs[2:4])
+        self.assertEqual(self._read_all(q, batch_size=3), self.docs[:4])
+        self.assertEqual(q.get_offset('c')[0], seq + 1)
+
+    def test_cleanup(self):
+        q = LogQ(self.base, 'q', segment_size=0.001)
+        for doc in self.docs:
+            q.add(doc)
+        segments = list(q._read_index())
+        self.assertEqual(q.cleanup(), [])
+        self._read_all(q, consumer='a')
+        removed = q.cleanup()
+        self.assertEqual(removed, segments[:-1])
+        q.add({'id': 'new'})
+        self.assertEqual(self._read_all(q, consumer='a'), [{'id': 'new'}])
+
+    def test_index(self):
+        q = LogQ(self.base, 'q')
+        q.add(self.docs)
+        solr = FakeSolr()
+        self.assertEqual(q.index(solr, 'coll', batch_size=30), 100)
+        self.assertEqual(solr.indexed, self.docs)
+        self.assertEqual(q.index(solr, 'coll'), 0)
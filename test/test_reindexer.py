@@ -5,7 +5,7 @@ import json
 import gzip
 import os
 import datetime
-from SolrClient import SolrClient, IndexQ, Reindexer
+from SolrClient import SolrClient, IndexQ, Reindexer, Verifier
 from .test_config import test_config
 from .RandomTestData import RandomTestData
 
@@ -157,7 +157,8 @@ class ReindexerTests(unittest.TestCase):
         '''
         reindexer = Reindexer(source=self.solr, source_coll=self.colls[0], dest=self.solr, dest_coll='doesntmatter')
         self.assertEqual(reindexer._get_query('cursor'),
-                         {'cursorMark': 'cursor', 'rows': reindexer._rows, 'q': '*:*', 'sort': 'id desc'})
+                         {'cursorMark': 'cursor', 'rows': reindexer._rows, 'q': '*:*', 'sort': 'id desc',
+                          'fl': ','.join(reindexer._fl)})
 
     def test_query_gen_pershard_distrib(self):
         '''
@@ -176,7 +177,22 @@ class ReindexerTests(unittest.TestCase):
                               date_field='ddddd')
         self.assertEqual(reindexer._get_query('cursor'),
                          {'cursorMark': 'cursor', 'rows': reindexer._rows, 'q': '*:*', 'sort': 'id desc',
-                          'sort': 'ddddd asc, id desc'})
+                          'sort': 'ddddd asc, id desc', 'fl': ','.join(reindexer._fl)})
+
+    def test_query_gen_fl(self):
+        '''
+        Checks that ignore fields and copy field destinations are left out of fl.
+        '''
+        reindexer = Reindexer(source=self.solr, source_coll=self.colls[0], dest=self.solr, dest_coll='doesntmatter')
+        self.assertIn('id', reindexer._fl)
+        for field in reindexer._ignore_fields:
+            self.assertNotIn(field, reindexer._fl)
+        reindexer = Reindexer(source=self.solr, source_coll=self.colls[0], dest=self.solr, dest_coll='doesntmatter',
+                              ignore_fields=False)
+        self.assertNotIn('fl', reindexer._get_query('cursor'))
+        reindexer = Reindexer(source=self.solr, source_coll=self.colls[0], dest=self.solr, dest_coll='doesntmatter',
+                              fl=['id', 'price'])
+        self.assertEqual(reindexer._get_query('cursor')['fl'], 'id,price')
 
     def test_remove_copy_fields_from_data(self):
         index = IndexQ(test_config['indexqbase'], 'test_reindexer', size=0)
@@ -415,3 +431,139 @@ class ReindexerTests(unittest.TestCase):
         self.assertEqual(
             len(solr.query(self.colls[0], {'q': '*:*', 'rows': 10000000}).docs),
             len(solr.query(self.colls[1], {'q': '*:*', 'rows': 10000000}).docs))
+
+    def test_solr_to_solr_reindex_parallel(self):
+        self._index_docs(50000, self.colls[0])
+        state_dir = os.path.join(test_config['indexqbase'], 'reindexer_state_test')
+        reindexer = Reindexer(source=self.solr, source_coll='source_coll', dest=self.solr, dest_coll='dest_coll')
+        items, total, done = reindexer.reindex_parallel(state_dir=state_dir, partition='shard', report_interval=1)
+        self.assertEqual(items, 50000)
+        self.assertEqual(total, 50000)
+        self.assertEqual(
+            len(self.solr.query(self.colls[0], {'q': '*:*', 'rows': 10000000}).docs),
+            len(self.solr.query(self.colls[1], {'q': '*:*', 'rows': 10000000}).docs))
+        # Every worker is done, so running again doesn't start any
+        self.assertEqual(reindexer.reindex_parallel(state_dir=state_dir, partition='shard'), (items, total, done))
+        import shutil
+        shutil.rmtree(state_dir)
+
+    def test_solr_to_solr_reindex_parallel_slice_resume(self):
+        self._index_docs(50000, self.colls[0])
+        state_dir = os.path.join(test_config['indexqbase'], 'reindexer_state_test')
+        reindexer = Reindexer(source=self.solr, source_coll='source_coll', dest=self.solr, dest_coll='dest_coll',
+                              date_field='date')
+        os.makedirs(state_dir, exist_ok=True)
+        specs = reindexer._get_worker_specs(state_dir, 'slice', 3, [])
+        # Simulate a worker that got killed after a few batches
+        reindexer._write_state(specs[0]['state_file'], {'cursor': '*', 'items': 0})
+        items, total, done = reindexer.reindex_parallel(state_dir=state_dir, partition='slice', slices=3, report_interval=1)
+        self.assertEqual(items, 50000)
+        self.assertEqual(done, len(specs))
+        self.assertEqual(self.solr.query(self.colls[1], {'q': '*:*', 'rows': 0}).get_num_found(), 50000)
+        import shutil
+        shutil.rmtree(state_dir)
+
+    def test_solr_to_solr_resume_precise(self):
+        self._index_docs(50000, self.colls[0])
+        solr = SolrClient(test_config['SOLR_SERVER'][0], auth=test_config['SOLR_CREDENTIALS'])
+        reindexer = Reindexer(source=solr, source_coll='source_coll', dest=solr, dest_coll='dest_coll',
+                              date_field='date')
+        reindexer.reindex()
+        # Remove a few items from the destination and change one in the source
+        for doc in self.docs[2:7]:
+            solr.delete_doc_by_id(self.colls[1], doc['id'])
+        solr.commit(self.colls[1], openSearcher=True)
+        changed = dict(self.docs[10])
+        changed['price'] = 123456
+        solr.index_json(self.colls[0], json.dumps([changed]))
+        solr.commit(self.colls[0], openSearcher=True)
+
+        stats = reindexer.resume(check=True, precise=True, max_diff_docs=100)
+        self.assertEqual(stats, {'missing': 5, 'changed': 1, 'extra': 0})
+        self.assertEqual(solr.query(self.colls[1], {'q': '*:*', 'rows': 0}).get_num_found(), 49995)
+
+        stats = reindexer.resume(precise=True, max_diff_docs=100)
+        self.assertEqual(stats, {'missing': 5, 'changed': 1, 'extra': 0})
+        self.assertEqual(solr.query(self.colls[1], {'q': '*:*', 'rows': 0}).get_num_found(), 50000)
+        self.assertEqual(
+            solr.query(self.colls[1], {'q': 'id:{}'.format(changed['id'])}).docs[0]['price'], 123456)
+        self.assertEqual(reindexer.resume(check=True, precise=True), {'missing': 0, 'changed': 0, 'extra': 0})
+
+    def test_verifier(self):
+        self._index_docs(50000, self.colls[0])
+        reindexer = Reindexer(source=self.solr, source_coll='source_coll', dest=self.solr, dest_coll='dest_coll')
+        reindexer.reindex()
+        verifier = Verifier(self.solr, self.solr, self.colls[0], self.colls[1])
+        self.assertEqual(verifier.verify(bucket_field='date')['buckets_diffed'], 0)
+        for doc in self.docs[2:5]:
+            self.solr.delete_doc_by_id(self.colls[1], doc['id'])
+        self.solr.commit(self.colls[1], openSearcher=True)
+        for res in (verifier.verify(), verifier.verify(bucket_field='date', buckets=8, max_bucket_docs=1000)):
+            self.assertEqual(res['missing'], 3)
+            self.assertEqual(res['extra'], 0)
+            self.assertEqual(sorted(res['ids']['missing']), sorted(doc['id'] for doc in self.docs[2:5]))
+        by_fields = Verifier(self.solr, self.solr, self.colls[0], self.colls[1], fields=['price', 'date'])
+        self.assertEqual(list(by_fields.diff(fq=['-id:({})'.format(' OR '.join('"{}"'.format(d['id']) for d in self.docs[2:5]))])), [])
+
+
+class ReindexerFromJsonTests(unittest.TestCase):
+    '''
+    Reindexing from a directory of json files to an IndexQ, doesn't need Solr.
+    '''
+    def setUp(self):
+        import tempfile
+        self.base = tempfile.mkdtemp()
+        self.source = os.path.join(self.base, 'source')
+        os.makedirs(os.path.join(self.source, 'nested'))
+        self.docs = [{'id': str(i), 'price': i, '_version_': i} for i in range(25)]
+        # Write files with increasing mtimes, one of them compressed and in a sub directory
+        paths = [os.path.join(self.source, 'b.json'), os.path.join(self.source, 'nested', 'a.json.gz'),
+                 os.path.join(self.source, 'c.json')]
+        for i, path in enumerate(paths):
+            chunk = self.docs[i * 10:(i + 1) * 10]
+            if path.endswith('.gz'):
+                with gzip.open(path, 'wt', encoding='utf-8') as f:
+                    json.dump(chunk, f)
+            else:
+                with open(path, 'w') as f:
+                    json.dump(chunk, f)
+            os.utime(path, (1000000 + i, 1000000 + i))
+        with open(os.path.join(self.source, 'ignored.txt'), 'w') as f:
+            f.write('not json')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.base)
+
+    def _dest_docs(self, index):
+        out = []
+        for path in index.get_all_as_list():
+            out.extend(index._open_file(path))
+        return out
+
+    def test_from_json(self):
+        index = IndexQ(self.base, 'dest', size=0)
+        reindexer = Reindexer(source=self.source, dest=index, rows=4)
+        reindexer.reindex(processes=2)
+        expected = [{'id': doc['id'], 'price': doc['price']} for doc in self.docs]
+        self.assertEqual(sorted(self._dest_docs(index), key=lambda x: int(x['id'])), expected)
+        self.assertEqual(reindexer._items_processed, 25)
+
+    def test_from_json_order(self):
+        reindexer = Reindexer(source=self.source, dest=IndexQ(self.base, 'dest', size=0), rows=100)
+        batches = list(reindexer._from_json())
+        self.assertEqual([batch[0]['id'] for batch in batches], ['0', '10', '20'])
+
+    def test_from_json_manifest_resume(self):
+        manifest = os.path.join(self.base, 'manifest')
+        reindexer = Reindexer(source=self.source, dest=IndexQ(self.base, 'dest', size=0), rows=100)
+        batches = reindexer._from_json(manifest=manifest)
+        next(batches)
+        next(batches)
+        # Stopped while the second file was being sent, only the first one is complete
+        batches.close()
+        with open(manifest) as f:
+            self.assertEqual(f.read().splitlines(), [os.path.join(self.source, 'b.json')])
+        index = IndexQ(self.base, 'resumed', size=0)
+        Reindexer(source=self.source, dest=index).reindex(manifest=manifest)
+        self.assertEqual(sorted(doc['id'] for doc in self._dest_docs(index)), sorted(str(i) for i in range(10, 25)))
@@ -4,7 +4,10 @@ import logging
 import json
 import itertools
 from time import sleep
-from SolrClient import SolrClient
+from array import array
+from SolrClient import SolrClient, SolrResponse, ColumnarResponse, CompactDocs
+from SolrClient.facets import merge_facet_arrays, merge_facets, merge_facet_ranges, merge_json_facets, merge_num_found, merge_stats
+from SolrClient.exceptions import SolrResponseError
 from .test_config import test_config
 from .RandomTestData import RandomTestData
 #logging.basicConfig(level=logging.DEBUG,format='%(asctime)s [%(levelname)s] (%(process)d) (%(threadName)-10s) [%(name)s] %(message)s')
@@ -235,3 +238,187 @@ class ClientTestQuery(unittest.TestCase):
                     'pr_sum': 501.0}}}
 
         self.assertEqual(a, b)
+
+    def test_javabin_matches_json(self):
+        query = {'q': '*:*', 'rows': 50, 'facet': True, 'facet.field': 'facet_test', 'sort': 'id asc'}
+        r_json = self.solr.query(test_config['SOLR_COLLECTION'], dict(query))
+        r_bin = self.solr.query(test_config['SOLR_COLLECTION'], dict(query), wt='javabin')
+        self.assertEqual(r_json.docs, r_bin.docs)
+        self.assertEqual(r_json.get_num_found(), r_bin.get_num_found())
+        self.assertEqual(r_json.get_facets(), r_bin.get_facets())
+
+    def test_query_columns(self):
+        res = self.solr.query_columns(test_config['SOLR_COLLECTION'], {'q': '*:*', 'rows': 7, 'sort': 'id asc'},
+                                      fields=['id', 'price'], cursor=True)
+        self.assertEqual(len(res), 50)
+        self.assertIsInstance(res['price'], array)
+        self.assertEqual(sorted(res['id']), sorted(doc['id'] for doc in self.docs))
+        self.assertEqual(sum(res['price']), sum(doc['price'] for doc in self.docs))
+
+
+class ColumnarResponseTest(unittest.TestCase):
+    def test_columns(self):
+        res = ColumnarResponse(['id', 'price', 'score', 'tags'])
+        res.add_docs([{'id': 'a', 'price': 1, 'score': 0.5, 'tags': ['x']}, {'id': 'b', 'price': 2, 'score': 1.5}])
+        res.add_docs([{'id': 'c', 'price': 3, 'score': 2.0, 'tags': ['y', 'z']}])
+        self.assertEqual(len(res), 3)
+        self.assertEqual(res['id'], ['a', 'b', 'c'])
+        self.assertEqual(res['price'], array('q', [1, 2, 3]))
+        self.assertEqual(res['score'], array('d', [0.5, 1.5, 2.0]))
+        self.assertEqual(res['tags'], [['x'], None, ['y', 'z']])
+
+    def test_column_type_changes(self):
+        res = ColumnarResponse(['price', 'count'])
+        res.add_docs([{'price': 1, 'count': 1}, {'price': 2, 'count': 2}])
+        res.add_docs([{'price': 2.5, 'count': 3}, {'price': 3}])
+        self.assertEqual(res['price'], array('d', [1, 2, 2.5, 3]))
+        self.assertEqual(res['count'], [1, 2, 3, None])
+
+    def test_column_large_ints(self):
+        res = ColumnarResponse(['big', 'mixed'])
+        res.add_docs([{'big': 1, 'mixed': 2 ** 60}])
+        res.add_docs([{'big': 2 ** 70, 'mixed': 0.5}])
+        #Doubles would round these
+        self.assertEqual(res['big'], [1, 2 ** 70])
+        self.assertEqual(res['mixed'], [2 ** 60, 0.5])
+
+
+class SolrResponseTest(unittest.TestCase):
+    def get_response(self):
+        return SolrResponse({
+            'responseHeader': {'status': 0, 'QTime': 3},
+            'response': {'numFound': 120, 'start': 0, 'docs': []},
+            'facet_counts': {'facet_fields': {'facet_test': ['Lorem', 9, 'ipsum', 6]}},
+        })
+
+    def test_count_query(self):
+        r = self.get_response()
+        self.assertEqual(r.get_num_found(), 120)
+        self.assertEqual(r.query_time, 3)
+        # Docs weren't touched
+        self.assertFalse(hasattr(r, '_docs'))
+        self.assertEqual(r.get_results_count(), 0)
+        self.assertFalse(hasattr(r, '__dict__'))
+
+    def test_facets_cached(self):
+        r = self.get_response()
+        self.assertFalse(hasattr(r, 'facets'))
+        facets = r.get_facets()
+        self.assertEqual(facets, {'facet_test': OrderedDict([('Lorem', 9), ('ipsum', 6)])})
+        self.assertIs(r.get_facets(), facets)
+
+    def test_compact_docs(self):
+        docs = [{'id': '1', 'price': 10}, {'id': '2', 'tags': ['a', 'b']}, {'id': '3', 'price': 30}]
+        r = SolrResponse({'responseHeader': {'status': 0, 'QTime': 3},
+                          'response': {'numFound': 3, 'start': 0, 'docs': [dict(d) for d in docs]}},
+                         compact_docs=True)
+        self.assertIsInstance(r.docs, CompactDocs)
+        self.assertEqual(r.docs, docs)
+        self.assertEqual(dict(r.docs[1]), docs[1])
+        self.assertFalse('price' in r.docs[1])
+        self.assertEqual(r.get_field_values_as_list('price'), [10, 30])
+        self.assertEqual(r.get_first_field_values_as_list('tags'), ['a', 'b'])
+        self.assertEqual(json.loads(r.get_json())['response']['docs'], docs)
+
+    def test_facet_arrays(self):
+        r = self.get_response()
+        keys, counts = r.get_facet_arrays('facet_test')
+        self.assertEqual(keys, ['Lorem', 'ipsum'])
+        self.assertEqual(counts, array('q', [9, 6]))
+        self.assertEqual(r.get_facet_keys_as_list('facet_test'), ['Lorem', 'ipsum'])
+        self.assertEqual(r.get_facet_values_as_list('facet_test'), [9, 6])
+        self.assertEqual(r.get_facet_sum('facet_test'), 15)
+        self.assertEqual(r.get_facet_top('facet_test', 1), [('Lorem', 9)])
+        self.assertIsNone(r.get_facet_keys_as_list('not_a_field'))
+        with self.assertRaises(SolrResponseError):
+            r.get_facet_arrays('not_a_field')
+
+    def test_merge_facet_arrays(self):
+        merged = merge_facet_arrays([(['a', 'b'], array('q', [1, 5])), (['c', 'a'], array('q', [3, 7]))])
+        self.assertEqual(merged, (['a', 'b', 'c'], array('q', [8, 5, 3])))
+        self.assertEqual(merge_facet_arrays([(['a', 'b'], [1, 5]), (['a'], [7])], k=1), (['a'], array('q', [8])))
+
+    def test_iter_facet_pivot(self):
+        r = SolrResponse({'responseHeader': {'status': 0, 'QTime': 1}, 'facet_counts': {'facet_pivot': {'facet_test,price': [
+            {'field': 'facet_test', 'value': 'Lorem', 'count': 2, 'pivot': [
+                {'field': 'price', 'value': 89, 'count': 1},
+                {'field': 'price', 'value': 75, 'count': 1}]},
+            {'field': 'facet_test', 'value': 'ipsum', 'count': 1, 'pivot': [
+                {'field': 'price', 'value': 53, 'count': 1, 'stats': {'min': 1}}]}]}}})
+        self.assertEqual(list(r.iter_facet_pivot()), [
+            (('Lorem',), 2, {}), (('Lorem', 89), 1, {}), (('Lorem', 75), 1, {}),
+            (('ipsum',), 1, {}), (('ipsum', 53), 1, {'stats': {'min': 1}})])
+        columns = r.get_facet_pivot_columns('facet_test,price')
+        self.assertEqual(columns['count'], array('q', [2, 1, 1, 1, 1]))
+        self.assertEqual(columns['depth'], array('q', [1, 2, 2, 1, 2]))
+
+    def test_iter_deep_pivot(self):
+        node = {'field': 'f', 'value': 0, 'count': 1}
+        for x in range(1, 5000):
+            node = {'field': 'f', 'value': x, 'count': 1, 'pivot': [node]}
+        r = SolrResponse({'responseHeader': {'status': 0, 'QTime': 1}, 'facet_counts': {'facet_pivot': {'f': [node]}}})
+        rows = list(r.iter_facet_pivot())
+        self.assertEqual(len(rows), 5000)
+        self.assertEqual(len(rows[-1][0]), 5000)
+
+    def test_iter_json_facet(self):
+        r = SolrResponse({'responseHeader': {'status': 0, 'QTime': 1}, 'facets': {'count': 18, 'test': {'buckets': [
+            {'val': 'consectetur', 'count': 10, 'pr_sum': 639.0, 'pr': {'buckets': [
+                {'val': 79, 'count': 2, 'unique': 1}, {'val': 9, 'count': 1, 'unique': 1}]}},
+            {'val': 'auctor', 'count': 8, 'pr_sum': 420.0, 'pr': {'buckets': []}}]}}})
+        self.assertEqual(list(r.iter_json_facet()), [
+            (('consectetur',), 10, {'pr_sum': 639.0}),
+            (('consectetur', 79), 2, {'unique': 1}),
+            (('consectetur', 9), 1, {'unique': 1}),
+            (('auctor',), 8, {'pr_sum': 420.0})])
+        columns = r.get_json_facet_columns('test', metrics=['pr_sum'])
+        self.assertEqual(columns['path'][1], ('consectetur', 79))
+        self.assertEqual(columns['pr_sum'], [639.0, None, None, 420.0])
+
+    def test_merge_responses(self):
+        responses = [SolrResponse({
+            'responseHeader': {'status': 0, 'QTime': 1},
+            'response': {'numFound': num_found, 'start': 0, 'docs': []},
+            'facet_counts': {'facet_fields': {'facet_test': flat},
+                             'facet_ranges': {'price': {'counts': ranges}}},
+            'facets': {'count': num_found, 'test': {'buckets': buckets}}})
+            for num_found, flat, ranges, buckets in [
+                (10, ['a', 6, 'b', 4], ['0', 3, '10', 7], [
+                    {'val': 'x', 'count': 6, 'pr_sum': 10.0, 'pr_min': 1, 'pr_avg': 2.0}]),
+                (5, ['b', 3, 'c', 2], ['0', 1, '10', 4], [
+                    {'val': 'x', 'count': 2, 'pr_sum': 5.0, 'pr_min': 0, 'pr_avg': 6.0},
+                    {'val': 'y', 'count': 3, 'pr_sum': 1.0, 'pr_min': 4, 'pr_avg': 1.0}])]]
+        self.assertEqual(merge_num_found(responses), 15)
+        self.assertEqual(merge_facets(responses), {'facet_test': OrderedDict([('b', 7), ('a', 6), ('c', 2)])})
+        self.assertEqual(list(merge_facets(responses, k=1)['facet_test'].items()), [('b', 7)])
+        self.assertEqual(merge_facet_ranges(responses), {'price': OrderedDict([('0', 4), ('10', 11)])})
+        self.assertEqual(merge_json_facets(responses, 'test', aggregations={'pr_min': 'min', 'pr_avg': 'avg'}), {'buckets': [
+            {'val': 'x', 'count': 8, 'pr_sum': 15.0, 'pr_min': 0, 'pr_avg': 3.0},
+            {'val': 'y', 'count': 3, 'pr_sum': 1.0, 'pr_min': 4, 'pr_avg': 1.0}]})
+
+    def test_merge_json_query_facets(self):
+        responses = [SolrResponse({
+            'responseHeader': {'status': 0, 'QTime': 1},
+            'response': {'numFound': 10, 'start': 0, 'docs': []},
+            'facets': {'count': 10, 'cheap': {'count': count, 'pr_max': pr_max,
+                                              'cat': {'buckets': [{'val': 'x', 'count': count, 'top': {'count': 1, 'pr_avg': avg}}]}}}})
+            for count, pr_max, avg in [(4, 10.0, 2.0), (2, 30.0, 5.0)]]
+        self.assertEqual(merge_json_facets(responses, 'cheap', aggregations={'pr_max': 'max', 'pr_avg': 'avg'}), {
+            'count': 6, 'pr_max': 30.0,
+            'cat': {'buckets': [{'val': 'x', 'count': 6, 'top': {'count': 2, 'pr_avg': 3.5}}]}})
+
+    def test_merge_stats(self):
+        values = [[1.0, 2.0, 3.0], [4.0, 10.0]]
+        responses = [SolrResponse({
+            'responseHeader': {'status': 0, 'QTime': 1},
+            'response': {'numFound': 3, 'start': 0, 'docs': []},
+            'stats': {'stats_fields': {'price': {
+                'min': min(vals), 'max': max(vals), 'count': len(vals), 'missing': 1, 'sum': sum(vals),
+                'sumOfSquares': sum(v * v for v in vals), 'mean': sum(vals) / len(vals), 'stddev': 0.0}}}})
+            for vals in values]
+        stats = merge_stats(responses)['price']
+        allvals = values[0] + values[1]
+        self.assertEqual((stats['min'], stats['max'], stats['count'], stats['missing'], stats['sum']), (1.0, 10.0, 5, 2, 20.0))
+        self.assertEqual(stats['mean'], 4.0)
+        self.assertAlmostEqual(stats['stddev'], (sum((v - 4.0) ** 2 for v in allvals) / 4) ** 0.5)
+
@@ -0,0 +1,108 @@
+import unittest
+from SolrClient.helpers import Throttle, MetricsPressure
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_throttle(**kwargs):
+    clock = FakeClock()
+    throttle = Throttle(**kwargs)
+    throttle._time = clock.time
+    throttle._sleep = clock.sleep
+    return throttle, clock
+
+
+class ThrottleTest(unittest.TestCase):
+
+    def test_fixed_rate(self):
+        throttle, clock = make_throttle(docs_per_sec=100)
+        for _ in range(5):
+            throttle.wait(50)
+        # First batch goes right away, each one after waits for the previous 50 items at 100/second
+        self.assertEqual(clock.sleeps, [0.5] * 4)
+        self.assertEqual(throttle.rate, 100)
+
+    def test_no_wait_when_slower_than_rate(self):
+        throttle, clock = make_throttle(docs_per_sec=100)
+        throttle.wait(50)
+        clock.now += 1
+        throttle.wait(50)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_aimd(self):
+        throttle, clock = make_throttle(docs_per_sec=1000, adaptive=True, target_latency=0.5, increase=100,
+                                        decrease=0.5, min_rate=300)
+        throttle.record(1000, 0.1)
+        self.assertEqual(throttle.rate, 1100)
+        throttle.record(1000, 0.6)
+        self.assertEqual(throttle.rate, 550)
+        throttle.record(1000, 0.6)
+        self.assertEqual(throttle.rate, 300)
+
+    def test_fixed_rate_ignores_latency(self):
+        throttle, clock = make_throttle(docs_per_sec=1000)
+        throttle.record(1000, 10)
+        self.assertEqual(throttle.rate, 1000)
+
+    def test_pressure_pauses(self):
+        readings = [True, True, False]
+        throttle, clock = make_throttle(docs_per_sec=1000000, pressure=lambda: readings.pop(0), pressure_interval=5)
+        throttle.wait(1)
+        self.assertEqual(clock.sleeps, [5, 5])
+        # Not checked again until the interval passed
+        throttle.wait(1)
+        self.assertEqual(readings, [])
+
+    def test_pressure_error(self):
+        def pressure():
+            raise IOError("timed out")
+        throttle, clock = make_throttle(docs_per_sec=1000000, pressure=pressure)
+        throttle.wait(1)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_split(self):
+        throttle = Throttle(docs_per_sec=1000, adaptive=True, increase=100, min_rate=40, max_rate=4000).split(4)
+        self.assertEqual((throttle.rate, throttle.increase, throttle.min_rate, throttle.max_rate), (250, 25, 10, 1000))
+        self.assertTrue(throttle.adaptive)
+
+
+class FakeTransport():
+    def __init__(self, res):
+        self.res = res
+        self.params = None
+
+    def send_request(self, **kwargs):
+        self.params = kwargs['params']
+        return self.res, {}
+
+
+class FakeSolr():
+    def __init__(self, res):
+        self.transport = FakeTransport(res)
+
+
+class MetricsPressureTest(unittest.TestCase):
+
+    def test_flat_metrics(self):
+        solr = FakeSolr({'metrics': [
+            'solr.core.coll.shard1.replica_n1', ['INDEX.merge.major.running', 1, 'INDEX.merge.minor.running', 2],
+            'solr.core.coll.shard2.replica_n2', ['INDEX.merge.major.running', 0, 'INDEX.merge.minor.running', 0]]})
+        pressure = MetricsPressure(solr, max_merges=2)
+        self.assertEqual(pressure.get_running_merges(), 3)
+        self.assertTrue(pressure())
+        self.assertEqual(solr.transport.params['group'], 'core')
+
+    def test_map_metrics(self):
+        solr = FakeSolr({'metrics': {'solr.core.coll.shard1.replica_n1': {'INDEX.merge.major.running': {'value': 1}}}})
+        self.assertFalse(MetricsPressure(solr, max_merges=2)())
@@ -0,0 +1,69 @@
+import unittest
+from multiprocessing import Pool
+from SolrClient.helpers import transform
+from SolrClient.helpers.transform import compile_transform
+
+
+def has_title(doc):
+    return 'title' in doc
+
+
+def title_length(doc):
+    return len(doc['title'])
+
+
+class TransformTest(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = [
+            {'id': '1', 'title_t': 'abc', 'price': '10', 'tags': ['1', '2'], '_version_': 1},
+            {'id': '2', 'price': '5', '_version_': 2},
+        ]
+
+    def test_empty_spec(self):
+        self.assertEqual(compile_transform([])(self.docs), self.docs)
+        self.assertEqual(compile_transform(None)(self.docs), self.docs)
+
+    def test_drop(self):
+        docs = compile_transform([{'drop': ['_version_', 'not_there']}])(self.docs)
+        self.assertEqual([sorted(doc) for doc in docs], [['id', 'price', 'tags', 'title_t'], ['id', 'price']])
+
+    def test_rename_and_drop_are_merged(self):
+        docs = compile_transform([
+            {'rename': {'title_t': 'title', 'price': 'cost'}},
+            {'drop': ['cost']},
+            {'rename': {'title': 'name'}},
+        ])(self.docs)
+        self.assertEqual(docs[0], {'id': '1', 'name': 'abc', 'tags': ['1', '2'], '_version_': 1})
+        self.assertEqual(docs[1], {'id': '2', '_version_': 2})
+
+    def test_map(self):
+        docs = compile_transform([{'map': {'price': 'float', 'tags': int}}])(self.docs)
+        self.assertEqual(docs[0]['price'], 10.0)
+        self.assertEqual(docs[0]['tags'], [1, 2])
+        self.assertNotIn('tags', docs[1])
+
+    def test_compute_and_filter(self):
+        docs = compile_transform([
+            {'rename': {'title_t': 'title'}},
+            {'filter': has_title},
+            {'compute': {'title_len': title_length}},
+        ])(self.docs)
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(docs[0]['title_len'], 3)
+
+    def test_bad_step(self):
+        with self.assertRaises(ValueError):
+            compile_transform([{'drop': ['a'], 'rename': {'b': 'c'}}])
+        with self.assertRaises(ValueError):
+            compile_transform([{'explode': ['a']}])
+
+    def test_in_pool(self):
+        spec = [{'drop': ['_version_']}, {'rename': {'title_t': 'title'}}, {'filter': has_title}]
+        pool = Pool(2, initializer=transform._init_worker, initargs=(spec,))
+        try:
+            out = pool.map(transform._run_worker, [self.docs, self.docs])
+        finally:
+            pool.terminate()
+        expected = compile_transform(spec)([dict(doc) for doc in self.docs])
+        self.assertEqual(out, [expected, expected])
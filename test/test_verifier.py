@@ -0,0 +1,33 @@
+import unittest
+from SolrClient.helpers.verifier import diff_sorted
+
+
+class DiffSortedTest(unittest.TestCase):
+
+    def _diff(self, source, dest):
+        return list(diff_sorted(iter(source), iter(dest), lambda s, d: s > d))
+
+    def test_same(self):
+        items = [('a', 1), ('b', 2), ('c', 3)]
+        self.assertEqual(self._diff(items, items), [])
+
+    def test_missing_extra_changed(self):
+        source = [('a', 1), ('b', 5), ('d', 1), ('e', 1)]
+        dest = [('b', 2), ('c', 1), ('d', 1)]
+        self.assertEqual(self._diff(source, dest),
+                         [('missing', 'a'), ('changed', 'b'), ('extra', 'c'), ('missing', 'e')])
+
+    def test_older_source_is_not_changed(self):
+        self.assertEqual(self._diff([('a', 1)], [('a', 2)]), [])
+
+    def test_empty_sides(self):
+        self.assertEqual(self._diff([], [('a', 1)]), [('extra', 'a')])
+        self.assertEqual(self._diff([('a', 1)], []), [('missing', 'a')])
+        self.assertEqual(self._diff([], []), [])
+
+    def test_lazy(self):
+        def source():
+            yield 'a', 1
+            raise AssertionError("read too far")
+        gen = diff_sorted(source(), iter([('b', 1)]), lambda s, d: s > d)
+        self.assertEqual(next(gen), ('missing', 'a'))